@@ -2,43 +2,159 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
 import time
 import datetime
 import random
 import concurrent.futures
+import json
+import hashlib
+import http.client
 import signal
+import socket
+import ipaddress
+import tempfile
+import queue
+import argparse
+import sqlite3
+import csv
+import subprocess
+import itertools
+import tracemalloc
+from array import array
 from pathlib import Path
-from threading import Lock, Event
-from colorama import Fore, init
+from collections import deque
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+from urllib.parse import urlsplit, urlencode, parse_qsl, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Event, Thread, Condition, Semaphore, local, enumerate as threading_enumerate
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.common.exceptions import (
-    TimeoutException,
-    WebDriverException,
-    StaleElementReferenceException,
-)
+# ==========================
+# ЛЕНИВЫЕ ИМПОРТЫ: selenium/webdriver_manager — только когда нужен браузер,
+# colorama — при первом цветном выводе. Отчёт по кэшу и "всё уже в кэше" обходятся без них.
+# ==========================
+class _LazyFore:
+    def __getattr__(self, name):
+        return getattr(_load_colorama(), name)
+
+class _NoColor:
+    def __getattr__(self, name):
+        return ""
+
+Fore = _LazyFore()
+
+def _load_colorama():
+    global Fore
+    if isinstance(Fore, _LazyFore):
+        try:
+            from colorama import Fore as colorama_fore, init
+        except ImportError:
+            Fore = _NoColor()
+            return Fore
+        init(autoreset=True)
+        Fore = colorama_fore
+    return Fore
+
+# Заглушки до _load_selenium(): имена из except-веток должны существовать и без selenium
+class TimeoutException(Exception):
+    pass
+
+class WebDriverException(Exception):
+    pass
 
-init(autoreset=True)
+class StaleElementReferenceException(WebDriverException):
+    pass
+
+webdriver = By = Keys = ChromeService = ChromeDriverManager = None
+_selenium_lock = Lock()
+
+def _load_selenium():
+    global webdriver, By, Keys, ChromeService, ChromeDriverManager
+    global TimeoutException, WebDriverException, StaleElementReferenceException
+    with _selenium_lock:
+        if webdriver is not None:
+            return
+        from selenium import webdriver as selenium_webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.common.keys import Keys
+        from selenium.webdriver.chrome.service import Service as ChromeService
+        from webdriver_manager.chrome import ChromeDriverManager
+        from selenium.common.exceptions import (
+            TimeoutException,
+            WebDriverException,
+            StaleElementReferenceException,
+        )
+        webdriver = selenium_webdriver   # последним: по нему проверяется, что всё загружено
 
 # ==========================
 # НАСТРОЙКИ
 # ==========================
 PASSWORD_LENGTH = 12
-CACHE_AVAIL = "checked_cache.txt"
-CACHE_REP = "reputation_cache.txt"
+CACHE_AVAIL = "checked_cache.txt"      # старый текстовый кэш (импортируется в БД)
+CACHE_AVAIL_DB = "checked_cache.db"
+CACHE_AVAIL_BATCH = 200                # сколько записей копим перед commit
+CACHE_AVAIL_FLUSH_SECONDS = 5.0        # ...или сбрасываем не реже, чем раз в N сек
+CACHE_AVAIL_VACUUM_RATIO = 0.2         # доля пустых страниц, после которой стоит --compact-cache
+# Индекс в памяти для `email in кэш` (планировщик, process_domain) вместо запроса в SQLite:
+# "hash" — 64-битные хэши email (~13 байт на запись против ~100 у set строк, SQLite не трогается),
+# "bloom" — фильтр Блума (~CACHE_INDEX_BLOOM_BITS/8 байт на запись, найденное перепроверяется в SQLite),
+# "" — без индекса, каждый раз SQLite. Строится при старте одним проходом по кэшу.
+CACHE_INDEX = "hash"
+CACHE_INDEX_BLOOM_BITS = 10            # бит на запись: 10 — около 1% лишних запросов в SQLite
+CACHE_REP = "reputation_cache.txt"    # старый текстовый кэш (импортируется в БД)
+CACHE_REP_DB = "reputation_cache.db"
+
+# Все файлы результатов и кэши пишет один фоновый поток (групповая запись)
+WRITER_QUEUE_SIZE = 10000              # записей в очереди; полная очередь тормозит проверки
+WRITER_BATCH = 1000                    # максимум записей за одну групповую запись
+WRITER_FLUSH_SECONDS = 1.0             # сбрасываем на диск не реже, чем раз в N сек
+WRITER_FSYNC_SECONDS = 10.0            # fsync файлов результатов не реже, чем раз в N сек...
+WRITER_FSYNC_EVERY = 5000              # ...или каждые N записей (0 — не по счётчику)
+WRITER_RETRIES = 3                     # упавшая запись повторяется столько раз (с каждой следующей пачкой)...
+WRITER_FAILED_FILE = "writer_failed.jsonl"   # ...потом уходит сюда, чтобы не потеряться
+
+# Результаты: "sqlite" (results.db), "jsonl" (results.jsonl) или "txt" (старые файлы, пишутся сразу)
+RESULTS_STORE = "sqlite"
+RESULTS_EXPORT_TXT = True              # после запуска выгрузить из хранилища старые txt (available.txt, ...)
 
 SUPPORTED_DOMAINS = {
     "yahoo.com": "https://login.yahoo.com/account/create?lang=en-US",
     "aol.com":   "https://login.aol.com/account/create?lang=en-US",
 }
 
+# Путь к chromedriver: пусто = webdriver_manager сам скачает/найдёт (нужен интернет);
+# для офлайна/фиксированной версии укажи путь здесь или в переменной окружения CHROMEDRIVER_PATH
+CHROMEDRIVER_PATH = os.environ.get("CHROMEDRIVER_PATH", "")
+
 MAILS_FILE_DEFAULT = "mail.txt"
 DEFAULT_BATCH_SIZE = 50
 
+# ===== Канонизация логинов =====
+# Yahoo и AOL не различают регистр; точки и "+тег" у них значимы (в отличие от Gmail).
+# Один логин проверяется на всех доменах, поэтому к логину из файла применяются только правила,
+# общие для всех SUPPORTED_DOMAINS. Поменял правила — увеличь CANON_VERSION (кэши перестроятся).
+LOGIN_RULES = {
+    "yahoo.com": {"lower": True, "ignore_dots": False, "plus_tag": False},
+    "aol.com":   {"lower": True, "ignore_dots": False, "plus_tag": False},
+}
+DEFAULT_LOGIN_RULE = {"lower": True, "ignore_dots": False, "plus_tag": False}
+CANON_VERSION = 1
+
+# ===== Входной файл =====
+INPUT_JOURNAL = True             # <файл>.journal: следующий запуск начинает с места, где закончил этот
+INPUT_COMPACT = False            # переписывать входной файл без полностью проверенных логинов...
+INPUT_COMPACT_EVERY = 20         # ...каждые N пакетов и в конце запуска
+INPUT_SURVEY_MAX_MB = 200        # план и ETA заранее (лишний проход по файлу) — только для файлов до N МБ
+
+# ===== Параллельные домены =====
+# Yahoo и AOL проверяются одновременно (поток на домен). Потолок частоты — на каждый сайт отдельно
+# и общий для всего процесса (в сервисе — для всех заданий сразу), так что параллельность
+# не увеличивает частоту запросов ни к одному сайту.
+DOMAIN_WORKERS = True            # False — по очереди, как раньше (сначала Yahoo, потом AOL)
+DOMAIN_RATE_LIMITS = {"yahoo.com": 1.0, "aol.com": 1.0}   # проверок в секунду на сайт (0 = без потолка)
+DOMAIN_RATE_BURST = 1            # сколько проверок подряд можно сделать без паузы
+
 REPUTATION_URL = "https://mailmeteor.com/tools/email-reputation"
 
 # ===== Availability (100% рабочие настройки против "спама") =====
@@ -47,6 +163,24 @@ AVAIL_STABLE_OK_SECONDS = 1.5      # нужно стабильное состо
 AVAIL_IGNORE_ERROR_INITIAL = 1.5   # игнорируем первые 1.5 сек ошибки
 AVAIL_POLL_INTERVAL = 0.25         # проверяем каждые 250 мс
 AVAIL_AFTER_INPUT_DELAY = 0.6
+AVAIL_EVENT_WAIT = True            # ждать ответ валидации в браузере (MutationObserver), а не опросом
+AVAIL_EVENT_SETTLE_MS = 300        # DOM и сеть должны "затихнуть" на столько мс перед решением
+# запрос валидации логина узнаём по URL (подстрока); прочие XHR/fetch (аналитика, конфиг) — не ответ.
+# "/api/validate" — локальный стенд (--bench e2e)
+AVAIL_VALIDATE_URL_MARKERS = ("validateField=", "/api/validate")
+
+# ===== Адаптивные окна ожидания =====
+# Замеры копятся всегда (и в фиксированном режиме); ADAPTIVE_WINDOWS = True — сокращать по ним окна
+ADAPTIVE_WINDOWS = False
+ADAPTIVE_PERCENTILE = 0.999        # окно = этот перцентиль наблюдаемой задержки...
+ADAPTIVE_MARGIN = 1.5              # ...умноженный на запас (но не больше фиксированного окна)
+ADAPTIVE_MIN_WINDOW = 0.5          # и не меньше этого, сек
+ADAPTIVE_MIN_SAMPLES = 50          # пока замеров меньше — фиксированные окна
+ADAPTIVE_MAX_SAMPLES = 2000        # храним последние N замеров на домен
+ADAPTIVE_PROBE_EVERY = 20          # каждая N-я проверка — с фиксированным окном, чтобы видеть "хвост"
+ADAPTIVE_COOLDOWN = 50             # после "unknown" столько проверок домена — с фиксированным окном
+ADAPTIVE_STATE_FILE = "adaptive_windows.json"
+ADAPTIVE_RECORD = True             # писать замер каждой проверки в validation_timings.jsonl (для replay)
 
 # ===== Reputation =====
 REP_MAX_ATTEMPTS = 3
@@ -54,7 +188,57 @@ REP_WAIT_SECONDS = 180
 REP_RETRY_BACKOFF = (5, 10)
 REP_REQUIRE_NONZERO = True
 REP_AFTER_CLICK_DELAY = 3.0
+REP_STABLE_SECONDS = 2.0         # рейтинг должен не меняться столько секунд
 UNABLE_MAX_HITS = 2
+REP_QUEUE_SIZE = 100             # свободные email в очереди на репутацию; полная очередь тормозит шаг 1
+REP_PROBE_WAIT_MS = 1000         # проба ждёт изменения рейтинга/страницы не дольше этого
+REP_CACHE_TTL_DAYS = 30          # сколько дней доверяем сохранённому рейтингу
+REP_CACHE_TTL_ZERO_HOURS = 24    # рейтинг 0 чаще всего сбой — перепроверяем раньше (0 = не использовать)
+
+# ===== Бэкенды проверок =====
+# "selenium" — настоящий браузер (как всегда), "http" — лёгкий HTTP-клиент к API,
+# который отвечает {"messages": [...]} (доступность) / {"score": N} или {"unable": true} (репутация).
+# У Yahoo/AOL/Mailmeteor такого открытого API нет — "http" для своих прокси/стендов (--bench backends).
+AVAIL_BACKENDS = {"yahoo.com": "selenium", "aol.com": "selenium"}
+REP_BACKEND = "selenium"
+HTTP_AVAIL_URLS = {}             # домен -> URL проверки логина (логин уходит в параметре userId)
+HTTP_REP_URL = ""                # URL репутации (email уходит в параметре email)
+HTTP_BACKEND_TIMEOUT = 15
+
+# ===== Профиль браузера =====
+# "full" — как раньше (обычный Chrome на весь экран), "lean" — облегчённый:
+# без картинок/шрифтов/медиа и трекеров, маленькое окно, лишние подсистемы выключены
+BROWSER_PROFILE = "full"
+BROWSER_HEADLESS = False         # только для "lean"; Cloudflare-капчу в headless руками не решить
+BROWSER_WINDOW_SIZE = (1024, 768)
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm", "*.mp3",
+    "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*",
+    "*facebook.net*", "*hotjar.com*",
+]
+
+# ===== Метрики =====
+METRICS_REFRESH_SECONDS = 15     # как часто обновлять metrics.json (и .prom) и печатать прогресс
+METRICS_PROMETHEUS = False       # дополнительно писать metrics.prom (текстовый формат Prometheus)
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 180)
+
+# ===== Трассировка WebDriver (python main.py --trace) =====
+# Каждая команда chromedriver (find_element, send_keys, execute_script...) — с местом вызова в коде,
+# email и временем: webdriver_trace.jsonl в папке результатов и топ "горячих" мест в конце запуска.
+WEBDRIVER_TRACE = False
+WEBDRIVER_TRACE_TOP = 15
+
+# ===== Пул браузеров =====
+BROWSER_RECYCLE_AFTER = 300      # после стольких проверок браузер пересоздаётся
+BROWSER_POOL_MAX_IDLE = 2        # сколько свободных браузеров держать на одно назначение
+
+# ===== Сервис (python main.py --serve) =====
+SERVICE_HOST = "127.0.0.1"       # только локально: API без авторизации
+SERVICE_PORT = 8765
+SERVICE_MAX_JOBS = 2             # заданий одновременно, остальные ждут своей очереди
+SERVICE_WARM = True              # при старте открыть браузеры на все назначения
 
 stop_event = Event()
 
@@ -76,54 +260,1620 @@ class UnableToCheckEmail(Exception):
 # ==========================
 # УТИЛИТЫ / КЭШ
 # ==========================
-def load_lines(filename):
+def iter_lines(filename):
+    # лениво, по одной строке — файл целиком в память не читаем
     try:
-        with open(filename, "r", encoding="utf-8") as f:
-            return [x.strip() for x in f if x.strip()]
-    except:
-        return []
+        with open(filename, "r", encoding="utf-8", errors="replace") as f:
+            for x in f:
+                x = x.strip()
+                if x:
+                    yield x
+    except OSError:
+        return
 
 def write_lines(filename, lines):
     with open(filename, "w", encoding="utf-8") as f:
         for line in lines:
             f.write(line + "\n")
 
-def load_cache_set(path):
-    if not os.path.exists(path):
-        return set()
-    with open(path, "r", encoding="utf-8") as f:
-        return set(x.strip() for x in f if x.strip())
+def peek(iterable):
+    # (первый элемент, итератор со всеми элементами) — чтобы проверить "пусто ли" без списка
+    it = iter(iterable)
+    first = next(it, None)
+    if first is None:
+        return None, iter(())
+    return first, itertools.chain([first], it)
+
+def iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def percentile(values, p: float):
+    # p в долях (0.95); values могут быть не отсортированы
+    if not values:
+        return None
+    vals = sorted(values)
+    k = min(len(vals) - 1, max(0, int(round(p * (len(vals) - 1)))))
+    return vals[k]
+
+# ==========================
+# МЕТРИКИ: гистограммы времени фаз по доменам + прогресс/ETA
+# ==========================
+class Metrics:
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = Lock()
+        self._hist = {}        # (domain, phase) -> {"count", "sum", "max", "buckets", "recent"}
+        self._results = {}     # (domain, status) -> count
+        self.started = time.time()
+        self.total = None      # сколько проверок запланировано (для ETA)
+        self.done = 0
+        self.reputation_progress = False   # режим "только репутация": прогресс считаем по ней
+        self._progress = deque(maxlen=120)   # (время, done) для скорости "за последнее время"
+
+    def observe(self, domain: str, phase: str, seconds: float):
+        with self._lock:
+            h = self._hist.get((domain, phase))
+            if h is None:
+                h = self._hist[(domain, phase)] = {
+                    "count": 0, "sum": 0.0, "max": 0.0,
+                    "buckets": [0] * len(self.buckets), "recent": deque(maxlen=2048),
+                }
+            h["count"] += 1
+            h["sum"] += seconds
+            h["max"] = max(h["max"], seconds)
+            h["recent"].append(seconds)
+            for i, le in enumerate(self.buckets):
+                if seconds <= le:
+                    h["buckets"][i] += 1
+                    break
+
+    @contextmanager
+    def phase(self, domain: str, phase: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(domain, phase, time.perf_counter() - t0)
+
+    def result(self, domain: str, status: str, progress: bool = True):
+        with self._lock:
+            self._results[(domain, status)] = self._results.get((domain, status), 0) + 1
+            if progress:
+                self.done += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            phases = {}
+            for (domain, phase), h in sorted(self._hist.items()):
+                p50, p95, p99 = (round(percentile(h["recent"], p), 4) for p in (0.5, 0.95, 0.99))
+                phases.setdefault(domain, {})[phase] = {
+                    "count": h["count"], "sum": round(h["sum"], 4),
+                    "avg": round(h["sum"] / h["count"], 4), "max": round(h["max"], 4),
+                    "p50": p50, "p95": p95, "p99": p99,
+                    "buckets": dict(zip(map(str, self.buckets), h["buckets"])),
+                }
+            results = {}
+            for (domain, status), n in sorted(self._results.items()):
+                results.setdefault(domain, {})[status] = n
+            return {
+                "started": self.started, "elapsed": round(time.time() - self.started, 2),
+                "done": self.done, "total": self.total,
+                "phases": phases, "results": results,
+            }
+
+    def prometheus(self) -> str:
+        out = [
+            "# HELP email_checker_phase_seconds Время фаз проверки",
+            "# TYPE email_checker_phase_seconds histogram",
+        ]
+        with self._lock:
+            for (domain, phase), h in sorted(self._hist.items()):
+                lbl = f'domain="{domain}",phase="{phase}"'
+                acc = 0
+                for le, n in zip(self.buckets, h["buckets"]):
+                    acc += n
+                    out.append(f'email_checker_phase_seconds_bucket{{{lbl},le="{le}"}} {acc}')
+                out.append(f'email_checker_phase_seconds_bucket{{{lbl},le="+Inf"}} {h["count"]}')
+                out.append(f"email_checker_phase_seconds_sum{{{lbl}}} {h['sum']:.6f}")
+                out.append(f"email_checker_phase_seconds_count{{{lbl}}} {h['count']}")
+            out.append("# HELP email_checker_results_total Результаты проверок")
+            out.append("# TYPE email_checker_results_total counter")
+            for (domain, status), n in sorted(self._results.items()):
+                out.append(f'email_checker_results_total{{domain="{domain}",status="{status}"}} {n}')
+        return "\n".join(out) + "\n"
+
+    def progress_line(self) -> str:
+        now = time.time()
+        with self._lock:
+            done, total = self.done, self.total
+            self._progress.append((now, done))
+            t_old, d_old = self._progress[0]
+        elapsed = max(now - self.started, 1e-9)
+        rate_all = done / elapsed
+        rate_recent = (done - d_old) / (now - t_old) if now - t_old >= 1 else rate_all
+        line = f"{done}" + (f"/{total}" if total else "") + f" проверено | {rate_all:.2f}/с"
+        line += f" (сейчас {rate_recent:.2f}/с)"
+        if total and rate_recent > 0:
+            eta = int((total - done) / rate_recent)
+            line += f" | ETA {eta // 3600}h{eta % 3600 // 60:02d}m{eta % 60:02d}s"
+        return line
+
+    def write(self, out_dir: Path, prometheus: bool = METRICS_PROMETHEUS):
+        # через временный файл + os.replace: читатель не увидит недописанный файл
+        files = {"metrics.json": json.dumps(self.snapshot(), ensure_ascii=False, indent=1)}
+        if prometheus:
+            files["metrics.prom"] = self.prometheus()
+        for name, text in files.items():
+            tmp = out_dir / (name + ".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, out_dir / name)
+
+metrics = Metrics()
+
+class MetricsReporter:
+    # фоновый поток: раз в METRICS_REFRESH_SECONDS обновляет файлы метрик и печатает прогресс
+    def __init__(self, out_dir: Path, interval=METRICS_REFRESH_SECONDS):
+        self.out_dir = out_dir
+        self.interval = interval
+        self._stop = Event()
+        self._thread = Thread(target=self._loop, name="metrics", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                metrics.write(self.out_dir)
+            except OSError as e:
+                print(Fore.YELLOW + f"[metrics] не записал: {e}")
+            if metrics.done or metrics.total:
+                print(Fore.BLUE + f"[progress] {metrics.progress_line()}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        metrics.write(self.out_dir)
+
+# ==========================
+# КАНОНИЗАЦИЯ: John.Doe@Yahoo.com и " john.doe@yahoo.com" — один и тот же ключ кэша
+# ==========================
+# пробелы, неразрывные пробелы и невидимые символы из копипаста
+_LOGIN_JUNK = dict.fromkeys(map(ord, " \t\u00a0\u200b\u200c\u200d\u2060\ufeff"), None)
+
+def _apply_login_rule(login, rule):
+    # translate заметно медленнее остального — только если мусор вообще возможен
+    if not login.isascii() or " " in login or "\t" in login:
+        login = login.translate(_LOGIN_JUNK)
+    if rule["lower"]:
+        login = login.lower()
+    if rule["plus_tag"]:
+        login = login.split("+", 1)[0]
+    if rule["ignore_dots"]:
+        login = login.replace(".", "")
+    return login
+
+def _shared_login_rule(domains):
+    rules = [LOGIN_RULES.get(d, DEFAULT_LOGIN_RULE) for d in domains]
+    return {k: all(r[k] for r in rules) for k in DEFAULT_LOGIN_RULE}
+
+_SHARED_LOGIN_RULE = _shared_login_rule(SUPPORTED_DOMAINS)
+
+def canonical_login(login):
+    # логин, который проверяется на всех SUPPORTED_DOMAINS (ключи кэша доступности)
+    return _apply_login_rule(login, _SHARED_LOGIN_RULE)
+
+def canonical_email(email):
+    # полный email по правилам своего домена (репутация, режим 2)
+    login, _, domain = email.rpartition("@")
+    domain = domain.translate(_LOGIN_JUNK).lower()
+    rule = _SHARED_LOGIN_RULE if domain in SUPPORTED_DOMAINS else LOGIN_RULES.get(domain, DEFAULT_LOGIN_RULE)
+    return f"{_apply_login_rule(login, rule)}@{domain}"
+
+def iter_unique(iterable, stats=None):
+    # повторы выкидываются; встреченное хранится 64-битными хэшами (HashIndex, ~12 байт на email),
+    # а не строками — память на 10M email ~120 МБ вместо ~1 ГБ
+    seen = HashIndex()
+    for item in iterable:
+        if not seen.add(item):
+            if stats is not None:
+                stats["duplicates"] = stats.get("duplicates", 0) + 1
+            continue
+        yield item
+
+# ==========================
+# ПОТОКОВЫЙ РАЗБОР ВХОДНОГО ФАЙЛА
+# ==========================
+def parse_email(line):
+    # "login@domain" -> (login как в файле, domain в нижнем регистре) или None;
+    # канонический вид логина — в WorkPlanner (ему нужно знать и исходное написание)
+    if "@" not in line:
+        return None
+    login, domain = line.rsplit("@", 1)
+    return login.strip(), domain.strip().lower()
+
+def iter_emails(filename):
+    for line in iter_lines(filename):
+        if "@" in line:
+            yield canonical_email(line)
+
+def iter_domain_logins(filename, domain):
+    for line in iter_lines(filename):
+        parsed = parse_email(line)
+        if parsed and parsed[1] == domain:
+            yield parsed[0]
+
+def iter_process_logins(filename, limit=0):
+    # СНАЧАЛА YAHOO, ПОТОМ AOL (порядок SUPPORTED_DOMAINS):
+    # отдельный проход по файлу на каждый домен вместо списков yahoo_logins/aol_logins
+    n = 0
+    for dom in SUPPORTED_DOMAINS:
+        for login in iter_domain_logins(filename, dom):
+            yield login
+            n += 1
+            if limit and n >= limit:
+                return
+
+# ==========================
+# ЖУРНАЛ ВХОДНОГО ФАЙЛА: с какого места продолжать и сжатие mail.txt
+# ==========================
+def iter_domain_logins_at(filename, domain, start=0):
+    # как iter_domain_logins, но с позицией: (login, смещение конца строки в байтах)
+    try:
+        with open(filename, "rb") as f:
+            f.seek(start)
+            pos = start
+            for raw in f:
+                pos += len(raw)
+                line = raw.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                parsed = parse_email(line)
+                if parsed and parsed[1] == domain:
+                    yield parsed[0], pos
+    except OSError:
+        return
+
+class InputJournal:
+    # Для каждого прохода (домена из SUPPORTED_DOMAINS) — смещение в байтах, до которого все логины
+    # проверены на всех доменах. Хранится рядом со входным файлом (<файл>.journal), вместе с
+    # "якорем" — хэшем байт перед смещением: если файл поменяли руками, журнал сбрасывается.
+    ANCHOR_BYTES = 256
+
+    def __init__(self, filename):
+        self.filename = str(filename)
+        self.path = self.filename + ".journal"
+        self.domains = list(SUPPORTED_DOMAINS)
+        self.offsets = [0] * len(self.domains)   # подтверждённые (commit)
+        self.pos = list(self.offsets)             # сразу после последнего выданного логина
+        self.load()
+
+    def _anchor(self, offset):
+        if not offset:
+            return ""
+        try:
+            with open(self.filename, "rb") as f:
+                f.seek(max(0, offset - self.ANCHOR_BYTES))
+                return hashlib.sha1(f.read(min(offset, self.ANCHOR_BYTES))).hexdigest()
+        except OSError:
+            return None
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        size = os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+        for i, dom in enumerate(self.domains):
+            entry = data.get("passes", {}).get(dom)
+            if not entry or entry["offset"] > size or self._anchor(entry["offset"]) != entry["anchor"]:
+                continue
+            self.offsets[i] = entry["offset"]
+        self.pos = list(self.offsets)
+
+    def save(self):
+        data = {"file": os.path.abspath(self.filename), "updated": time.time(), "passes": {
+            dom: {"offset": off, "anchor": self._anchor(off)} for dom, off in zip(self.domains, self.offsets)
+        }}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def skipped(self) -> int:
+        # сколько байт файла не придётся перечитывать (по всем проходам)
+        return sum(self.offsets)
+
+    def iter_logins(self, limit=0):
+        # как iter_process_logins, но каждый проход начинается с подтверждённого смещения
+        start = list(self.offsets)
+        self.pos = list(start)
+        n = 0
+        for i, dom in enumerate(self.domains):
+            for login, end in iter_domain_logins_at(self.filename, dom, start[i]):
+                self.pos[i] = end
+                yield login
+                n += 1
+                if limit and n >= limit:
+                    return
+            # проход дочитан до конца: строки после последнего совпадения — не этого домена
+            try:
+                self.pos[i] = max(self.pos[i], os.path.getsize(self.filename))
+            except OSError:
+                pass
+
+    def commit(self):
+        # всё, что выдано до этого момента, проверено
+        self.offsets = list(self.pos)
+        self.save()
+
+    def compact(self, is_done):
+        # Переписать файл без строк, где логин проверен на всех доменах (is_done(login) -> bool).
+        # Построчно через временный файл, в память не читается. Смещения журнала пересчитываются.
+        tmp = self.filename + ".compact.tmp"
+        supported = set(self.domains)
+        old_pos = new_pos = 0
+        new_offsets = [None] * len(self.domains)
+        kept = dropped = 0
+        with open(self.filename, "rb") as src, open(tmp, "wb") as dst:
+            for raw in src:
+                for i, off in enumerate(self.offsets):
+                    if new_offsets[i] is None and old_pos >= off:
+                        new_offsets[i] = new_pos
+                old_pos += len(raw)
+                parsed = parse_email(raw.decode("utf-8", errors="replace").strip())
+                if parsed and parsed[1] in supported and is_done(parsed[0]):
+                    dropped += 1
+                    continue
+                dst.write(raw)
+                new_pos += len(raw)
+                kept += 1
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp, self.filename)
+        self.offsets = [new_pos if off is None else off for off in new_offsets]
+        self.pos = list(self.offsets)
+        self.save()
+        return kept, dropped
+
+# ==========================
+# КЭШ ДОСТУПНОСТИ (SQLite вместо checked_cache.txt)
+# ==========================
+AVAIL_STATUSES = ("busy", "free", "unknown")
+
+def _non_canonical_rows(conn, table, columns):
+    # потоковый проход по ключам; в память попадают только строки, которые нужно переименовать
+    cur = conn.execute(f"SELECT email, {columns} FROM {table}")
+    out = []
+    while True:
+        chunk = cur.fetchmany(50000)
+        if not chunk:
+            return out
+        for row in chunk:
+            canon = canonical_email(row[0])
+            if canon != row[0]:
+                out.append((canon,) + tuple(row))
+
+# ==========================
+# ИНДЕКС КЭША ДОСТУПНОСТИ В ПАМЯТИ
+# ==========================
+# Хранятся не строки "login@domain" (~100 байт в set), а 64-битные хэши. hash() строк в Python
+# зависит от процесса (PYTHONHASHSEED), но индекс и так строится заново при каждом запуске.
+_HASH64 = (1 << 64) - 1
+
+class HashIndex:
+    # Открытая адресация (линейное пробирование) в array('Q'), 0 — пустая ячейка. Совпадение 64-битных хэшей разных email
+    # на 10M записей — порядка 1e-12 на запрос, поэтому ответ считается точным.
+    exact = True
+    LOAD = 0.7
+
+    def __init__(self, capacity=0):
+        self.count = 0
+        self._slots = self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        # запас на записи этого запуска, чтобы не перестраивать таблицу сразу после загрузки
+        size = int(max(capacity * 1.1, 1024) / self.LOAD) | 1
+        # таблица и размер одним объектом: читатели в других потоках не увидят их вразнобой
+        return array("Q", bytes(8 * size)), size
+
+    @staticmethod
+    def _hash(email):
+        return (hash(email) & _HASH64) or 1
+
+    def __contains__(self, email):
+        h = self._hash(email)
+        table, size = self._slots
+        i = h % size
+        while True:
+            v = table[i]
+            if v == h:
+                return True
+            if not v:
+                return False
+            i += 1
+            if i == size:
+                i = 0
+
+    def add(self, email) -> bool:
+        # вызывается под замком AvailCache — писатель всегда один; True — записи ещё не было
+        if self.count + 1 > self.LOAD * self._slots[1]:
+            # новая таблица заполняется целиком в стороне и публикуется одним присваиванием:
+            # читатели до этого момента видят старую (полную), после — новую (тоже полную)
+            slots = self._alloc(self.count * 2)
+            for v in self._slots[0]:
+                if v:
+                    self._insert(v, slots)
+            self._slots = slots
+        if self._insert(self._hash(email)):
+            self.count += 1
+            return True
+        return False
+
+    def _insert(self, h, slots=None):
+        table, size = slots or self._slots
+        i = h % size
+        while True:
+            v = table[i]
+            if v == h:
+                return False
+            if not v:
+                table[i] = h
+                return True
+            i += 1
+            if i == size:
+                i = 0
+
+    def nbytes(self):
+        return self._slots[0].buffer_info()[1] * 8
+
+class BloomIndex:
+    # Фильтр Блума: "нет" — точно нет, "есть" — надо проверить в SQLite (exact = False).
+    # Размер задаётся при построении; если записей стало больше, растёт только доля лишних
+    # запросов в SQLite, до следующего запуска.
+    exact = False
+
+    def __init__(self, capacity=0, bits_per_key=CACHE_INDEX_BLOOM_BITS):
+        self.count = 0
+        self.m = max(8 * 1024, int(max(capacity, 1) * bits_per_key))
+        self.k = max(1, round(bits_per_key * 0.69))
+        self._bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, email):
+        # k позиций из одного 64-битного хэша (двойное хэширование), по одной — промах
+        # обычно выясняется на первой-второй
+        h = hash(email) & _HASH64
+        p, step, m = (h & 0xFFFFFFFF) % self.m, ((h >> 32) | 1) % self.m, self.m
+        for _ in range(self.k):
+            yield p
+            p += step
+            if p >= m:
+                p -= m
+
+    def __contains__(self, email):
+        bits = self._bits
+        for p in self._positions(email):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def add(self, email):
+        bits = self._bits
+        for p in self._positions(email):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def nbytes(self):
+        return len(self._bits)
+
+CACHE_INDEX_TYPES = {"hash": HashIndex, "bloom": BloomIndex}
+
+class AvailCache:
+    # Интерфейс как у set: `email in cache`, cache.add(email, status), len(cache).
+    # Записи копятся в памяти и пишутся пачкой (executemany + один commit).
+    def __init__(self, path=CACHE_AVAIL_DB, batch_size=CACHE_AVAIL_BATCH,
+                 flush_seconds=CACHE_AVAIL_FLUSH_SECONDS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.auto_flush = True     # False — сбрасывает только ResultWriter (в своём потоке)
+        self._lock = Lock()
+        self._pending = {}
+        self._last_flush = time.time()
+        self.index = None          # HashIndex / BloomIndex после load_index()
+        self.index_kind = ""
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS avail ("
+            "email TEXT PRIMARY KEY, status TEXT NOT NULL, checked_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('count', '0')")
+        self._conn.commit()
+
+    def _meta_get(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _meta_set(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def get(self, email):
+        # -> (status, checked_at) или None
+        with self._lock:
+            hit = self._pending.get(email)
+            if hit is not None:
+                return hit
+            row = self._conn.execute(
+                "SELECT status, checked_at FROM avail WHERE email = ?", (email,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def __contains__(self, email):
+        index = self.index
+        if index is not None:
+            if email not in index:
+                return False
+            if index.exact:
+                return True
+        return self.get(email) is not None
+
+    def load_index(self, kind=CACHE_INDEX) -> int:
+        # один потоковый проход по ключам; дальше add()/add_many() пополняют индекс сами
+        self.index_kind = kind
+        if not kind:
+            self.index = None
+            return 0
+        with self._lock:
+            index = CACHE_INDEX_TYPES[kind](int(self._meta_get("count", "0")) + len(self._pending))
+            cur = self._conn.execute("SELECT email FROM avail")
+            while True:
+                chunk = cur.fetchmany(50000)
+                if not chunk:
+                    break
+                for (email,) in chunk:
+                    index.add(email)
+            for email in self._pending:
+                index.add(email)
+            self.index = index
+        return index.nbytes()
+
+    def __len__(self):
+        # COUNT(*) на десятках миллионов строк — это скан всей таблицы, держим счётчик в meta
+        with self._lock:
+            return int(self._meta_get("count", "0")) + len(self._pending)
+
+    def add(self, email, status="unknown", checked_at=None):
+        self.add_many([(email, status, checked_at)])
+
+    def add_many(self, items):
+        with self._lock:
+            now = time.time()
+            for email, status, checked_at in items:
+                if status not in AVAIL_STATUSES:
+                    raise ValueError(f"Неизвестный статус: {status}")
+                self._pending[email] = (status, checked_at or now)
+                if self.index is not None:
+                    self.index.add(email)
+            if self.auto_flush and (len(self._pending) >= self.batch_size
+                                    or now - self._last_flush >= self.flush_seconds):
+                self._flush_locked()
+
+    def flush(self) -> int:
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        self._last_flush = time.time()
+        if not self._pending:
+            return 0
+        rows = [(e, st, ts) for e, (st, ts) in self._pending.items()]
+        with self._conn:
+            cur = self._conn.executemany("INSERT OR IGNORE INTO avail VALUES (?, ?, ?)", rows)
+            added = cur.rowcount
+            if added < len(rows):
+                # часть email уже была в кэше — обновляем статус/время
+                self._conn.executemany(
+                    "UPDATE avail SET status = ?, checked_at = ? WHERE email = ?",
+                    [(st, ts, e) for e, st, ts in rows],
+                )
+            count = int(self._meta_get("count", "0")) + max(added, 0)
+            self._meta_set("count", count)
+        self._pending.clear()
+        return len(rows)
+
+    def import_txt(self, txt_path=CACHE_AVAIL):
+        # Одноразовый импорт старого checked_cache.txt (стримингом, пачками).
+        # Запоминаем смещение: если старую версию скрипта ещё запускали и файл вырос,
+        # при следующем старте догрузится только хвост.
+        if not os.path.exists(txt_path):
+            return 0
+        key = f"imported:{os.path.abspath(txt_path)}"
+        offset = int(self._meta_get(key, "0"))
+        size = os.path.getsize(txt_path)
+        if offset >= size:
+            return 0
+
+        imported = 0
+        with open(txt_path, "rb") as f:
+            f.seek(offset)
+            batch = []
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # недописанная строка — заберём в следующий раз
+                offset += len(raw)
+                email = raw.decode("utf-8", errors="replace").strip()
+                if email:
+                    # статус в старом файле не хранился
+                    batch.append((email, "unknown", None))
+                if len(batch) >= 50000:
+                    imported += self._import_rows(batch)
+                    batch = []
+            imported += self._import_rows(batch)
+
+        with self._lock, self._conn:
+            self._meta_set(key, offset)
+        return imported
+
+    def _import_rows(self, items):
+        if not items:
+            return 0
+        now = time.time()
+        rows = [(e, st, ts or now) for e, st, ts in items]
+        with self._lock, self._conn:
+            added = max(self._conn.executemany(
+                "INSERT OR IGNORE INTO avail VALUES (?, ?, ?)", rows
+            ).rowcount, 0)
+            self._meta_set("count", int(self._meta_get("count", "0")) + added)
+            if self.index is not None:
+                for email, _, _ in rows:
+                    self.index.add(email)
+        return added
+
+    def migrate_keys(self, force=False):
+        # Ключи старых версий (John.Doe@yahoo.com) -> канонические; при совпадении остаётся более
+        # свежая проверка. Выполняется один раз на CANON_VERSION (force — после импорта из txt).
+        self.flush()
+        with self._lock:
+            if not force and self._meta_get("canon_version") == str(CANON_VERSION):
+                return 0
+            rows = _non_canonical_rows(self._conn, "avail", "status, checked_at")
+            merged = 0
+            with self._conn:
+                for canon, email, status, checked_at in rows:
+                    merged += self._conn.execute(
+                        "SELECT 1 FROM avail WHERE email = ?", (canon,)).fetchone() is not None
+                    self._conn.execute(
+                        "INSERT INTO avail VALUES (?, ?, ?) ON CONFLICT(email) DO UPDATE SET "
+                        "status = excluded.status, checked_at = excluded.checked_at "
+                        "WHERE excluded.checked_at > avail.checked_at",
+                        (canon, status, checked_at))
+                    self._conn.execute("DELETE FROM avail WHERE email = ?", (email,))
+                self._meta_set("count", int(self._meta_get("count", "0")) - merged)
+                self._meta_set("canon_version", CANON_VERSION)
+        if rows and self.index is not None:
+            self.load_index(self.index_kind)   # старые ключи из индекса не удалить — строим заново
+        return len(rows)
+
+    def free_ratio(self) -> float:
+        # доля пустых страниц (две PRAGMA, без чтения таблицы)
+        with self._lock:
+            pages = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            free = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return free / pages if pages else 0.0
+
+    def compact(self, min_free_ratio=CACHE_AVAIL_VACUUM_RATIO):
+        # VACUUM переписывает весь файл — только по запросу (--compact-cache) и если есть что сжимать
+        self.flush()
+        if self.free_ratio() < min_free_ratio:
+            return False
+        with self._lock:
+            self._conn.execute("VACUUM")
+        return True
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            try:
+                self._conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            self._conn.close()
+
+# ==========================
+# КЭШ РЕПУТАЦИИ (SQLite вместо reputation_cache.txt)
+# ==========================
+class RepCache:
+    # Одна строка на email: последний рейтинг, время проверки, попытки, последняя ошибка.
+    # Поиск — точечный по ключу, вся история в память не грузится.
+    def __init__(self, path=CACHE_REP_DB,
+                 ttl_days=REP_CACHE_TTL_DAYS, ttl_zero_hours=REP_CACHE_TTL_ZERO_HOURS):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.ttl_zero = ttl_zero_hours * 3600
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reputation ("
+            "email TEXT PRIMARY KEY, score INTEGER, checked_at REAL NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, checks INTEGER NOT NULL DEFAULT 0, "
+            "last_error TEXT"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    def get(self, email):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT score, checked_at, attempts, checks, last_error "
+                "FROM reputation WHERE email = ?", (email,)
+            ).fetchone()
+        if not row:
+            return None
+        return {"score": row[0], "checked_at": row[1], "attempts": row[2],
+                "checks": row[3], "last_error": row[4]}
+
+    def _is_fresh(self, score, checked_at, now):
+        if score is None:
+            return False
+        ttl = self.ttl_zero if score == 0 else self.ttl
+        return (now - checked_at) < ttl
+
+    def fresh_score(self, email):
+        # рейтинг, если он есть и не устарел по TTL, иначе None (→ проверять заново)
+        entry = self.get(email)
+        if entry and self._is_fresh(entry["score"], entry["checked_at"], time.time()):
+            return entry["score"]
+        return None
 
-def save_cache_line(path, line):
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    def put(self, email, score, attempts=1, error=None, checked_at=None):
+        self.put_many([(email, score, attempts, error, checked_at)])
+
+    def put_many(self, items):
+        # upsert: повторная проверка перезаписывает строку, а не добавляет дубль; один commit на пачку
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO reputation (email, score, checked_at, attempts, checks, last_error) "
+                "VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT(email) DO UPDATE SET "
+                "score = COALESCE(excluded.score, reputation.score), "
+                "checked_at = CASE WHEN excluded.score IS NULL "
+                "THEN reputation.checked_at ELSE excluded.checked_at END, "
+                "attempts = excluded.attempts, checks = reputation.checks + 1, "
+                "last_error = excluded.last_error",
+                [(email, score, checked_at or now, attempts, error)
+                 for email, score, attempts, error, checked_at in items],
+            )
+
+    def import_txt(self, txt_path=CACHE_REP):
+        # Одноразовый импорт reputation_cache.txt: последняя строка по email побеждает
+        if not os.path.exists(txt_path):
+            return 0
+        key = f"imported:{os.path.abspath(txt_path)}"
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        offset = int(row[0]) if row else 0
+        if offset >= os.path.getsize(txt_path):
+            return 0
+
+        # время проверки старых записей неизвестно — берём mtime файла
+        file_ts = os.path.getmtime(txt_path)
+        imported = 0
+        with open(txt_path, "rb") as f:
+            f.seek(offset)
+            batch = {}
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                offset += len(raw)
+                line = raw.decode("utf-8", errors="replace").strip()
+                if ":" not in line:
+                    continue
+                email, val = line.split(":", 1)
+                val = val.strip()
+                if not val.isdigit():
+                    continue
+                batch[email] = int(val)
+                if len(batch) >= 50000:
+                    imported += self._import_rows(batch, file_ts)
+                    batch = {}
+            imported += self._import_rows(batch, file_ts)
+
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(offset)))
+        return imported
+
+    def _import_rows(self, batch, ts):
+        if not batch:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO reputation (email, score, checked_at, attempts, checks) "
+                "VALUES (?, ?, ?, 0, 1) "
+                "ON CONFLICT(email) DO UPDATE SET score = excluded.score, "
+                "checked_at = excluded.checked_at",
+                # старые нули никогда не переиспользовались — помечаем их устаревшими
+                [(e, sc, ts if sc else 0.0) for e, sc in batch.items()],
+            )
+        return len(batch)
+
+    def migrate_keys(self, force=False):
+        # как AvailCache.migrate_keys: при совпадении ключей побеждает более свежий рейтинг,
+        # счётчики проверок складываются
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'canon_version'").fetchone()
+            if not force and row and row[0] == str(CANON_VERSION):
+                return 0
+            rows = _non_canonical_rows(self._conn, "reputation",
+                                       "score, checked_at, attempts, checks, last_error")
+            with self._conn:
+                for canon, email, *vals in rows:
+                    self._conn.execute(
+                        "INSERT INTO reputation (email, score, checked_at, attempts, checks, last_error) "
+                        "VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(email) DO UPDATE SET "
+                        "score = CASE WHEN excluded.checked_at > reputation.checked_at "
+                        "THEN COALESCE(excluded.score, reputation.score) ELSE reputation.score END, "
+                        "attempts = CASE WHEN excluded.checked_at > reputation.checked_at "
+                        "THEN excluded.attempts ELSE reputation.attempts END, "
+                        "last_error = CASE WHEN excluded.checked_at > reputation.checked_at "
+                        "THEN excluded.last_error ELSE reputation.last_error END, "
+                        "checked_at = MAX(excluded.checked_at, reputation.checked_at), "
+                        "checks = reputation.checks + excluded.checks",
+                        (canon, *vals))
+                    self._conn.execute("DELETE FROM reputation WHERE email = ?", (email,))
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('canon_version', ?)",
+                                   (str(CANON_VERSION),))
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            self._conn.close()
+
+# ==========================
+# ЗАПИСЬ РЕЗУЛЬТАТОВ: один фоновый поток, групповая запись
+# ==========================
+class _WriterFile:
+    # Вместо файла для process_domain/check_reputation: write() только кладёт строку в очередь
+    def __init__(self, writer, f):
+        self._writer = writer
+        self._f = f
+
+    def write(self, text):
+        self._writer._put(("line", self._f, text))
+
+    def close(self):
+        self._writer._put(("close", self._f, None))
+
+class ResultWriter:
+    # Проверки кладут записи в очередь; поток забирает всё накопившееся (до WRITER_BATCH)
+    # и пишет одним write на файл + одним commit на кэш. fsync — по времени или по счётчику.
+    # AvailCache после attach() сбрасывается только отсюда, проверки пишут лишь в его память.
+    _STOP = object()
+
+    def __init__(self, batch=WRITER_BATCH, flush_seconds=WRITER_FLUSH_SECONDS,
+                 fsync_seconds=WRITER_FSYNC_SECONDS, fsync_every=WRITER_FSYNC_EVERY,
+                 maxsize=WRITER_QUEUE_SIZE):
+        self.batch = batch
+        self.flush_seconds = flush_seconds
+        self.fsync_seconds = fsync_seconds
+        self.fsync_every = fsync_every
+        self._q = queue.Queue(maxsize)
+        self._files = []
+        self._caches = []
+        self._thread = Thread(target=self._loop, name="writer", daemon=True)
+        self.stats = {"records": 0, "batches": 0, "writes": 0, "commits": 0, "fsyncs": 0,
+                      "put_wait": 0.0}
+        self._wait_lock = Lock()   # put_wait пополняют все потоки проверок, остальное — только поток writer
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def open(self, path, mode="w"):
+        f = open(path, mode, encoding="utf-8")
+        self._files.append(f)
+        return _WriterFile(self, f)
+
+    def attach(self, cache: AvailCache):
+        cache.auto_flush = False
+        self._caches.append(cache)
+
+    def rep_put(self, rep_cache: RepCache, email, score, attempts=1, error=None):
+        self._put(("rep", rep_cache, (email, score, attempts, error, time.time())))
+
+    def _put(self, item):
+        t0 = time.perf_counter()
+        self._q.put(item)
+        waited = time.perf_counter() - t0
+        with self._wait_lock:
+            self.stats["put_wait"] += waited
+
+    def flush(self):
+        # барьер: вернётся, когда всё, что положили до вызова, записано
+        done = Event()
+        self._put(("barrier", done, None))
+        while not done.wait(0.5):
+            if not self._thread.is_alive():
+                return
+
+    def close(self):
+        # вызывается и после Ctrl+C: поток дописывает очередь до конца и делает fsync
+        if self._thread.is_alive():
+            self._q.put((self._STOP, None, None))
+            join_thread(self._thread)
+        for f in self._files:
+            if not f.closed:
+                f.close()
+        for cache in self._caches:
+            cache.auto_flush = True
+
+    def summary(self) -> str:
+        st = self.stats
+        line = (f"записей {st['records']}, групп {st['batches']}, write {st['writes']}, "
+                f"commit {st['commits']}, fsync {st['fsyncs']}, ожидание очереди {st['put_wait']:.2f}s")
+        if st.get("failed"):
+            line += f", не записано {st['failed']} (см. {WRITER_FAILED_FILE})"
+        return line
+
+    def _loop(self):
+        last_sync = time.time()
+        since_sync = 0
+        retry = []      # [(попыток, запись)] — группы, запись которых упала
+        while True:
+            items = []
+            try:
+                items.append(self._q.get(timeout=self.flush_seconds))
+                while len(items) < self.batch:
+                    items.append(self._q.get_nowait())
+            except queue.Empty:
+                pass
+            # до записи: упавшая пачка не должна "съесть" сигнал остановки
+            stop = any(kind is self._STOP for kind, _, _ in items)
+
+            attempts = {id(item): n for n, item in retry}
+            written, failed = self._apply([item for _, item in retry] + items)
+            since_sync += written
+            retry = []
+            lost = []
+            for item in failed:
+                n = attempts.get(id(item), 0) + 1
+                if stop or n >= WRITER_RETRIES:
+                    lost.append(item)
+                else:
+                    retry.append((n, item))
+            if lost:
+                self._dump_failed(lost)
+
+            now = time.time()
+            try:
+                if since_sync and (stop or now - last_sync >= self.fsync_seconds
+                                   or (self.fsync_every and since_sync >= self.fsync_every)):
+                    for f in self._files:
+                        if not f.closed:
+                            os.fsync(f.fileno())
+                            self.stats["fsyncs"] += 1
+                    last_sync, since_sync = now, 0
+            except OSError as e:
+                print(Fore.RED + f"[writer] fsync не удался: {e!r}")
+            for kind, target, _ in items:
+                if kind == "barrier":
+                    target.set()
+            if stop:
+                return
+
+    def _apply(self, items):
+        # -> (записано, [записи упавших групп]). Группы (файл, хранилище, кэш) пишутся независимо:
+        # ошибка одной не мешает остальным, а её записи вернутся на повтор.
+        groups = {}
+        for item in items:
+            kind, target, _ = item
+            if kind in ("line", "row", "rep", "close"):
+                groups.setdefault((kind, id(target)), (kind, target, []))[2].append(item)
+        order = ("line", "row", "rep", "close")   # файл закрывается после своих строк
+        failed = []
+        failed_targets = set()
+        n = 0
+        for kind, target, group in sorted(groups.values(), key=lambda g: order.index(g[0])):
+            payloads = [p for _, _, p in group]
+            try:
+                if kind == "close":
+                    if id(target) in failed_targets:
+                        raise OSError("строки файла ещё не записаны")
+                    os.fsync(target.fileno())
+                    target.close()
+                    self._files.remove(target)   # в сервисе файлы заданий не копятся
+                    continue
+                if kind == "line":
+                    target.write("".join(payloads))
+                    target.flush()
+                    self.stats["writes"] += 1
+                elif kind == "row":
+                    target.add_many(payloads)
+                    self.stats["commits"] += 1
+                else:
+                    target.put_many(payloads)
+                    self.stats["commits"] += 1
+            except Exception as e:
+                print(Fore.RED + f"[writer] ошибка записи ({kind}, {len(group)}): {e!r}")
+                failed.extend(group)
+                failed_targets.add(id(target))
+                continue
+            n += len(group)
+        for cache in self._caches:
+            try:
+                if cache.flush():
+                    self.stats["commits"] += 1
+            except Exception as e:
+                # несброшенное остаётся в памяти кэша и уйдёт следующим flush
+                print(Fore.RED + f"[writer] кэш не сброшен: {e!r}")
+
+        if n:
+            self.stats["records"] += n
+            self.stats["batches"] += 1
+        return n, failed
+
+    def _dump_failed(self, items):
+        # последняя линия: то, что так и не записалось, — построчно в WRITER_FAILED_FILE
+        self.stats["failed"] = self.stats.get("failed", 0) + len(items)
+        try:
+            with open(WRITER_FAILED_FILE, "a", encoding="utf-8") as f:
+                for kind, target, payload in items:
+                    where = getattr(target, "name", None) or getattr(target, "path", None) or repr(target)
+                    f.write(json.dumps({"kind": kind, "target": str(where), "payload": payload,
+                                        "ts": round(time.time(), 3)}, ensure_ascii=False, default=str) + "\n")
+            print(Fore.RED + f"[writer] не записано {len(items)} — сохранил в {WRITER_FAILED_FILE}")
+        except OSError as e:
+            print(Fore.RED + f"[writer] не записано {len(items)}, и {WRITER_FAILED_FILE} недоступен: {e!r}")
+
+# ==========================
+# ХРАНИЛИЩЕ РЕЗУЛЬТАТОВ: одна строка на (email, этап) вместо пяти txt
+# ==========================
+RESULT_FIELDS = ("email", "stage", "status", "score", "bucket", "password",
+                 "attempts", "error", "started_at", "finished_at")
+
+LEGACY_TXT_FILES = ("available.txt", "busy.txt", "reputation_good.txt", "reputation_medium.txt",
+                    "reputation_bad.txt", "reputation_retry_failed.txt", "reputation_errors.txt")
+
+def reputation_bucket(score):
+    if score is None:
+        return None
+    if score >= 71:
+        return "good"
+    if score >= 31:
+        return "medium"
+    return "bad"
+
+class ResultStore(ABC):
+    # availability()/reputation() вызывают проверки; с writer строки уходят в его поток
+    # и пишутся пачкой через add_many(), без writer — сразу.
+    name = ""
+
+    def __init__(self, writer: ResultWriter = None):
+        self.writer = writer
+        self._direct_lock = Lock()   # без writer пишут сразу несколько потоков доменов
+
+    def _record(self, row):
+        row["finished_at"] = time.time()
+        if self.writer:
+            self.writer._put(("row", self, row))
+        else:
+            with self._direct_lock:
+                self.add_many([row])
+
+    def availability(self, email, status, password=None, error=None, attempts=1, started_at=None):
+        # status: busy / free / unknown / error
+        self._record({"email": email, "stage": "availability", "status": status, "score": None,
+                      "bucket": None, "password": password, "attempts": attempts, "error": error,
+                      "started_at": started_at})
+
+    def reputation(self, email, score, status, attempts=0, error=None, started_at=None):
+        # status: ok / cached / failed / exception
+        self._record({"email": email, "stage": "reputation", "status": status, "score": score,
+                      "bucket": reputation_bucket(score), "password": None, "attempts": attempts,
+                      "error": error, "started_at": started_at})
+
+    @abstractmethod
+    def add_many(self, rows):
+        ...
+
+    def close(self):
+        pass
+
+class RowResultStore(ResultStore):
+    # хранит строки и отдаёт их обратно (экспорт, бенчмарки); txt так не умеет
+    @abstractmethod
+    def iter_rows(self, stage=None):
+        ...
+
+class SqliteResultStore(RowResultStore):
+    name = "sqlite"
+    filename = "results.db"
+
+    def __init__(self, path, writer: ResultWriter = None):
+        super().__init__(writer)
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "email TEXT NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL, score INTEGER, "
+            "bucket TEXT, password TEXT, attempts INTEGER, error TEXT, "
+            "started_at REAL, finished_at REAL NOT NULL, UNIQUE (email, stage))"
+        )
+        self._conn.commit()
+
+    def add_many(self, rows):
+        # повторная проверка того же email на том же этапе заменяет строку
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO results ({', '.join(RESULT_FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(RESULT_FIELDS))})",
+                [tuple(r[k] for k in RESULT_FIELDS) for r in rows],
+            )
+
+    def iter_rows(self, stage=None):
+        sql = f"SELECT {', '.join(RESULT_FIELDS)} FROM results"
+        args = ()
+        if stage:
+            sql += " WHERE stage = ?"
+            args = (stage,)
+        # читается после того, как поток записи закончил (экспорт), поэтому без лока на всю выборку
+        rows = self._conn.execute(sql + " ORDER BY rowid", args)
+        while True:
+            chunk = rows.fetchmany(10000)
+            if not chunk:
+                return
+            for r in chunk:
+                yield dict(zip(RESULT_FIELDS, r))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class JsonlResultStore(RowResultStore):
+    name = "jsonl"
+    filename = "results.jsonl"
+
+    def __init__(self, path, writer: ResultWriter = None):
+        super().__init__(writer)
+        self.path = path
+        self._f = open(path, "a", encoding="utf-8")
+
+    def add_many(self, rows):
+        self._f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows))
+        self._f.flush()
+
+    def iter_rows(self, stage=None):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    if stage is None or row["stage"] == stage:
+                        yield row
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+class TxtResultStore(ResultStore):
+    # старый формат: сразу пишет available.txt / busy.txt / reputation_*.txt
+    name = "txt"
+
+    def __init__(self, out_dir: Path, writer: ResultWriter = None):
+        super().__init__(writer)
+        self.out_dir = out_dir
+        self._files = {name: open(out_dir / name, "w", encoding="utf-8") for name in LEGACY_TXT_FILES}
+
+    def add_many(self, rows):
+        _write_legacy_rows(rows, self._files)
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        for f in self._files.values():
+            if not f.closed:
+                f.close()
+
+RESULT_STORE_TYPES = {"sqlite": SqliteResultStore, "jsonl": JsonlResultStore, "txt": TxtResultStore}
+
+def open_result_store(out_dir: Path, writer: ResultWriter = None, kind=None) -> ResultStore:
+    cls = RESULT_STORE_TYPES[kind or RESULTS_STORE]
+    if cls is TxtResultStore:
+        return cls(out_dir, writer)
+    return cls(out_dir / cls.filename, writer)
+
+def find_result_store(out_dir: Path) -> RowResultStore:
+    # для экспорта: то, что лежит в папке результатов
+    for cls in (SqliteResultStore, JsonlResultStore):
+        if (out_dir / cls.filename).exists():
+            return cls(out_dir / cls.filename)
+    if (out_dir / "available.txt").exists():
+        raise FileNotFoundError(f"В {out_dir} результаты в txt (RESULTS_STORE = \"txt\") — строк для выгрузки нет")
+    raise FileNotFoundError(f"В {out_dir} нет results.db / results.jsonl")
+
+def _write_legacy_rows(rows, files):
+    # строки -> старые txt в том же формате, что писал скрипт раньше
+    for r in rows:
+        email = r["email"]
+        if r["stage"] == "availability":
+            if r["status"] == "free":
+                files["available.txt"].write(f"{email}:{r['password']}\n")
+            else:
+                files["busy.txt"].write(email + "\n")
+            continue
+        if r["status"] == "exception":
+            files["reputation_errors.txt"].write(f"{email} | EXC | {r['error']}\n")
+        if r["bucket"] is None:
+            files["reputation_retry_failed.txt"].write(email + "\n")
+        else:
+            files[f"reputation_{r['bucket']}.txt"].write(f"{email}:{r['score']}\n")
+
+def export_legacy_txt(store: RowResultStore, out_dir: Path) -> int:
+    files = {name: open(out_dir / name, "w", encoding="utf-8") for name in LEGACY_TXT_FILES}
+    n = 0
+    try:
+        for rows in iter_batches(store.iter_rows(), 10000):
+            _write_legacy_rows(rows, files)
+            n += len(rows)
+    finally:
+        for f in files.values():
+            f.close()
+    return n
 
-def load_rep_cache():
-    if not os.path.exists(CACHE_REP):
-        return {}
-    d = {}
-    with open(CACHE_REP, "r", encoding="utf-8") as f:
-        for l in f:
-            if ":" in l:
-                k, v = l.strip().split(":", 1)
-                d[k] = v
-    return d
+def finish_result_store(store: ResultStore, out_dir: Path):
+    # вызывать, когда поток записи уже всё записал (writer.flush()/close())
+    try:
+        if RESULTS_EXPORT_TXT and isinstance(store, RowResultStore):
+            n = export_legacy_txt(store, out_dir)
+            print(Fore.CYAN + f"[results] {store.name}: {n} строк, txt выгружены в {out_dir}")
+    finally:
+        store.close()
 
-def save_rep_cache(email, score):
-    with open(CACHE_REP, "a", encoding="utf-8") as f:
-        f.write(f"{email}:{score}\n")
+def export_parquet(store: RowResultStore, path: Path) -> int:
+    # необязательно: нужен pip install pyarrow
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для Parquet нужен pyarrow: pip install pyarrow")
+    schema = pa.schema([
+        ("email", pa.string()), ("stage", pa.string()), ("status", pa.string()),
+        ("score", pa.int64()), ("bucket", pa.string()), ("password", pa.string()),
+        ("attempts", pa.int64()), ("error", pa.string()),
+        ("started_at", pa.float64()), ("finished_at", pa.float64()),
+    ])
+    n = 0
+    with pq.ParquetWriter(str(path), schema) as pq_writer:
+        for rows in iter_batches(store.iter_rows(), 50000):
+            pq_writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            n += len(rows)
+    return n
 
 # ==========================
 # SELENIUM
 # ==========================
-def make_driver():
+_driver_path = None
+_driver_path_lock = Lock()
+driver_launch_times = []   # секунды на каждый запуск браузера (для отчёта)
+
+def resolve_driver_path():
+    # chromedriver ищем один раз на процесс: ChromeDriverManager().install()
+    # на каждый запуск — это лишние запросы версий и проверки файлов
+    global _driver_path
+    _load_selenium()
+    with _driver_path_lock:
+        if _driver_path is None:
+            t0 = time.time()
+            if CHROMEDRIVER_PATH:
+                if not os.path.isfile(CHROMEDRIVER_PATH):
+                    raise FileNotFoundError(f"CHROMEDRIVER_PATH не найден: {CHROMEDRIVER_PATH}")
+                _driver_path = CHROMEDRIVER_PATH
+                source = "config"
+            else:
+                _driver_path = ChromeDriverManager().install()
+                source = "webdriver_manager"
+            print(Fore.CYAN + f"[driver] {_driver_path} ({source}, {time.time() - t0:.2f}s)")
+        return _driver_path
+
+def _chrome_options(profile: str):
     opt = webdriver.ChromeOptions()
     opt.add_argument("--disable-blink-features=AutomationControlled")
-    opt.add_argument("--start-maximized")
-    return webdriver.Chrome(
-        service=ChromeService(ChromeDriverManager().install()),
+    if profile != "lean":
+        opt.add_argument("--start-maximized")
+        return opt
+
+    if BROWSER_HEADLESS:
+        opt.add_argument("--headless=new")
+    w, h = BROWSER_WINDOW_SIZE
+    opt.add_argument(f"--window-size={w},{h}")
+    for arg in (
+        "--blink-settings=imagesEnabled=false",
+        "--disable-extensions",
+        "--disable-background-networking",
+        "--disable-component-update",
+        "--disable-default-apps",
+        "--disable-sync",
+        "--disable-notifications",
+        "--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication",
+        "--mute-audio",
+        "--no-first-run",
+    ):
+        opt.add_argument(arg)
+    opt.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.default_content_setting_values.notifications": 2,
+    })
+    return opt
+
+def make_driver(profile: str = None):
+    _load_selenium()
+    profile = profile or BROWSER_PROFILE
+    t0 = time.time()
+    opt = _chrome_options(profile)
+    # Service — лёгкий объект, но он владеет процессом chromedriver и останавливается
+    # в driver.quit(), поэтому переиспользуем путь, а Service создаём на каждый браузер
+    driver = webdriver.Chrome(
+        service=ChromeService(resolve_driver_path()),
         options=opt
     )
+    install_net_hook(driver)
+    if profile == "lean":
+        # шрифты/медиа/трекеры через prefs не отключить — режем на уровне сети
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+        except:
+            pass
+    if webdriver_trace.enabled:
+        webdriver_trace.wrap(driver)
+    dt = time.time() - t0
+    driver_launch_times.append(dt)
+    print(Fore.CYAN + f"[driver] запуск #{len(driver_launch_times)}: {dt:.2f}s")
+    return driver
+
+def driver_launch_summary() -> str:
+    if not driver_launch_times:
+        return "браузеры не запускались"
+    n = len(driver_launch_times)
+    first = driver_launch_times[0]
+    rest = driver_launch_times[1:]
+    avg_rest = f"{sum(rest) / len(rest):.2f}s" if rest else "-"
+    return f"запусков {n}, первый {first:.2f}s, последующие в среднем {avg_rest}"
+
+# ==========================
+# ТРАССИРОВКА WEBDRIVER: сколько HTTP-запросов к chromedriver стоит каждый email
+# ==========================
+class WebDriverTrace:
+    # driver.execute — единая точка для всех команд (и драйвера, и WebElement), её и подменяем.
+    # Место вызова — первый кадр стека из этого файла: find_username_input:1790, _wait_validation:...
+    def __init__(self):
+        self.enabled = False
+        self._lock = Lock()
+        self._local = local()          # email, который сейчас проверяет этот поток
+        self._f = None
+        self.sites = {}                # (место вызова, команда) -> [вызовов, секунд, ошибок]
+        self.emails = 0                # email с командами
+        self.email_calls = 0
+        self.email_seconds = 0.0
+        self.heaviest = None           # (вызовов, секунд, email)
+
+    def start(self, path: Path):
+        self._f = open(path, "w", encoding="utf-8")
+        self.enabled = True
+
+    def wrap(self, driver):
+        inner = driver.execute
+
+        def execute(command, params=None):
+            t0 = time.perf_counter()
+            ok = False
+            try:
+                res = inner(command, params)
+                ok = True
+                return res
+            finally:
+                self._record(command, time.perf_counter() - t0, ok)
+
+        driver.execute = execute
+        return driver
+
+    @staticmethod
+    def _call_site():
+        f = sys._getframe(3)   # _record <- execute <- WebElement/WebDriver; ищем наш код выше
+        while f is not None and f.f_code.co_filename != __file__:
+            f = f.f_back
+        return f"{f.f_code.co_name}:{f.f_lineno}" if f is not None else "?"
+
+    def _record(self, command, seconds, ok):
+        site = self._call_site()
+        email = getattr(self._local, "email", None)
+        counter = getattr(self._local, "counter", None)
+        if counter is not None:
+            counter[0] += 1
+            counter[1] += seconds
+        line = json.dumps({"t": round(time.time(), 3), "email": email, "site": site, "command": command,
+                           "ms": round(seconds * 1000, 2), "ok": ok}, ensure_ascii=False) + "\n"
+        with self._lock:
+            st = self.sites.setdefault((site, command), [0, 0.0, 0])
+            st[0] += 1
+            st[1] += seconds
+            st[2] += not ok
+            if self._f:
+                self._f.write(line)
+
+    @contextmanager
+    def email(self, email):
+        # все команды внутри блока (в этом потоке) считаются на этот email
+        self.begin(email)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def begin(self, email):
+        if self.enabled:
+            self._local.email = email
+            self._local.counter = [0, 0.0]
+
+    def end(self):
+        email = getattr(self._local, "email", None)
+        counter = getattr(self._local, "counter", None)
+        self._local.email = self._local.counter = None
+        if not counter or not counter[0]:
+            return
+        with self._lock:
+            self.emails += 1
+            self.email_calls += counter[0]
+            self.email_seconds += counter[1]
+            if self.heaviest is None or counter[0] > self.heaviest[0]:
+                self.heaviest = (counter[0], counter[1], email)
+            if self._f:
+                self._f.write(json.dumps({"email": email, "calls": counter[0],
+                                          "seconds": round(counter[1], 3)}) + "\n")
+
+    def report(self, top=WEBDRIVER_TRACE_TOP) -> list:
+        with self._lock:
+            sites = sorted(self.sites.items(), key=lambda kv: kv[1][1], reverse=True)
+            total_calls = sum(st[0] for _, st in sites)
+            total = sum(st[1] for _, st in sites)
+            lines = [f"команд {total_calls}, {total:.1f}s"]
+            if self.emails:
+                lines[0] += (f"; на email в среднем {self.email_calls / self.emails:.1f} команд, "
+                             f"{self.email_seconds / self.emails:.2f}s (больше всех: {self.heaviest[2]} — "
+                             f"{self.heaviest[0]} команд, {self.heaviest[1]:.2f}s)")
+            for (site, command), (n, sec, err) in sites[:top]:
+                per_email = f"{n / self.emails:>6.2f}/email" if self.emails else ""
+                lines.append(f"  {site:<34} {command:<24} {n:>8} | {sec:>8.1f}s | "
+                             f"{sec / n * 1000:>7.1f} ms | {per_email}" + (f" | ошибок {err}" if err else ""))
+        return lines
+
+    def close(self):
+        with self._lock:
+            if self._f:
+                self._f.close()
+                self._f = None
+        self.enabled = False
+
+webdriver_trace = WebDriverTrace()
+
+# ==========================
+# ПУЛ БРАУЗЕРОВ: тёплые сессии по назначению (yahoo.com / aol.com / reputation)
+# ==========================
+class BrowserPool:
+    def __init__(self, urls, recycle_after=BROWSER_RECYCLE_AFTER, max_idle=BROWSER_POOL_MAX_IDLE):
+        self.urls = urls                 # назначение -> стартовая страница
+        self.recycle_after = recycle_after
+        self.max_idle = max_idle
+        self._idle = {}                  # назначение -> [driver, ...]
+        self._uses = {}                  # id(driver) -> сколько проверок сделал
+        self._lock = Lock()
+        self.created = 0
+        self.reused = 0
+        self.recycled = 0
+
+    def _healthy(self, driver, purpose) -> bool:
+        # одна команда: жив ли браузер и на нужной ли он странице
+        try:
+            state, href = driver.execute_script("return [document.readyState, location.href];")
+        except:
+            return False
+        if urlsplit(href or "").netloc != urlsplit(self.urls[purpose]).netloc:
+            try:
+                driver.get(self.urls[purpose])
+            except:
+                return False
+        return True
+
+    def acquire(self, purpose):
+        while True:
+            with self._lock:
+                idle = self._idle.get(purpose)
+                driver = idle.pop() if idle else None
+            if driver is None:
+                break
+            if self._healthy(driver, purpose):
+                self.reused += 1
+                return driver
+            self.discard(driver)
+
+        with metrics.phase(purpose, "driver_start"):
+            driver = make_driver()
+        with self._lock:
+            self._uses[id(driver)] = 0
+            self.created += 1
+        try:
+            with metrics.phase(purpose, "driver_get"):
+                driver.get(self.urls[purpose])
+        except:
+            self.discard(driver)
+            raise
+        return driver
+
+    def release(self, purpose, driver, checks=0):
+        with self._lock:
+            uses = self._uses.get(id(driver), 0) + checks
+            self._uses[id(driver)] = uses
+            idle = self._idle.setdefault(purpose, [])
+            keep = (not stop_event.is_set()
+                    and uses < self.recycle_after
+                    and len(idle) < self.max_idle)
+            if keep:
+                idle.append(driver)
+                return
+            if uses >= self.recycle_after:
+                self.recycled += 1
+        self.discard(driver)
+
+    def discard(self, driver):
+        with self._lock:
+            self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            drivers = [d for idle in self._idle.values() for d in idle]
+            self._idle.clear()
+        for d in drivers:
+            self.discard(d)
+
+    def warm(self, purposes):
+        # открыть заранее по браузеру на каждое назначение и оставить свободными
+        for purpose in purposes:
+            try:
+                self.release(purpose, self.acquire(purpose))
+            except Exception as e:
+                print(Fore.YELLOW + f"[pool] {purpose}: не прогрелся ({e})")
+
+    def summary(self) -> str:
+        return f"создано {self.created}, переиспользовано {self.reused}, пересоздано {self.recycled}"
+
+browser_pool = BrowserPool({**SUPPORTED_DOMAINS, "reputation": REPUTATION_URL})
 
 # ==========================
 # УЧЁТ ПРОВЕРЕННЫХ ЛОГИНОВ (для удаления из mail.txt)
@@ -143,13 +1893,10 @@ def get_fully_done_logins(login_done_map):
 # ==========================
 # Детектор BUSY по тексту (включая Yahoo new UI)
 # ==========================
-def _is_busy_message(txt: str) -> bool:
-    if not txt:
-        return False
-    t = txt.lower()
-
-    # Полные варианты сообщений
-    busy_phrases = [
+# Встроенные наборы фраз по языкам (полные сообщения + устойчивые маркеры).
+# Дополнительные языки и фразы под конкретный домен — в BUSY_PHRASES_FILE.
+BUSY_PACKS = {
+    "en": [
         "not available for sign up",
         "this email address is not available",
         "that email address is not available",
@@ -158,27 +1905,113 @@ def _is_busy_message(txt: str) -> bool:
         "isn't available",
         "is not available",
         "email not available. try entering a different one.",
-    ]
-
-    # Ключевые куски (устойчивые маркеры)
-    busy_keywords = [
         "email not available",
         "try something else",
         "try entering a different one",
         "taken",
-        "занят",          # русский
-        "недоступен",     # русский
-        "déjà utilisée",  # французский
-        "nicht verfügbar" # немецкий
-    ]
-
-    # Проверка: либо совпадает целая фраза, либо встречаются ключевые слова
-    if any(p in t for p in busy_phrases):
-        return True
-    if any(k in t for k in busy_keywords):
-        return True
+    ],
+    "ru": ["занят", "недоступен"],
+    "fr": ["déjà utilisée"],
+    "de": ["nicht verfügbar"],
+}
+BUSY_PHRASES_FILE = Path(__file__).resolve().parent / "busy_phrases.json"
+BUSY_LOCALES = None    # None = все языки; например ("en", "ru") — только эти
+
+class BusyClassifier:
+    # Фразы компилируются один раз на домен в таблицу "минимальных" маркеров: фраза,
+    # которая содержит другую фразу, отдельно не ищется (её покрывает более короткая).
+    # Поиск — проход по маркерам через `in` (C-поиск подстроки: в CPython это быстрее
+    # одной большой регулярки-альтернации, см. --bench classifier); при попадании
+    # уточняем, какая самая длинная фраза совпала. match() говорит, что именно сработало.
+    def __init__(self, packs, domain_packs=None, locales=None):
+        self.packs = {loc: list(ph) for loc, ph in packs.items()
+                      if locales is None or loc in locales}
+        self.domain_packs = {dom: list(ph) for dom, ph in (domain_packs or {}).items()}
+        self._compiled = {}
+
+    @classmethod
+    def load(cls, path=BUSY_PHRASES_FILE, locales=BUSY_LOCALES):
+        # JSON: {"locales": {"es": [...]}, "domains": {"yahoo.com": [...]}}; файла нет — только встроенные
+        packs = {loc: list(ph) for loc, ph in BUSY_PACKS.items()}
+        domain_packs = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            cls._validate(data)
+        except FileNotFoundError:
+            data = {}
+        except (OSError, ValueError) as e:
+            # битый файл не должен ронять import main — работаем на встроенных пакетах
+            print(Fore.YELLOW + f"[busy] {path} не прочитан ({e}) — только встроенные фразы")
+            data = {}
+        for loc, phrases in data.get("locales", {}).items():
+            packs.setdefault(loc, []).extend(phrases)
+        for dom, phrases in data.get("domains", {}).items():
+            domain_packs.setdefault(dom.lower(), []).extend(phrases)
+        return cls(packs, domain_packs, locales)
+
+    @staticmethod
+    def _validate(data):
+        # строка вместо списка дала бы "фразы" из отдельных букв — и всё подряд стало бы "занят",
+        # поэтому любой неверный кусок отбрасывает файл целиком (ValueError)
+        if not isinstance(data, dict):
+            raise ValueError("ожидался объект {\"locales\": ..., \"domains\": ...}")
+        for section in ("locales", "domains"):
+            packs = data.get(section, {})
+            if not isinstance(packs, dict):
+                raise ValueError(f"{section}: ожидался объект {{имя: [фразы]}}")
+            for name, phrases in packs.items():
+                if not isinstance(phrases, list):
+                    raise ValueError(f"{section}.{name}: ожидался список фраз")
+                for ph in phrases:
+                    if not isinstance(ph, str) or not ph.strip():
+                        raise ValueError(f"{section}.{name}: фраза {ph!r} — нужна непустая строка")
+
+    def _entries(self, domain):
+        for loc, phrases in self.packs.items():
+            for ph in phrases:
+                yield ph.lower(), loc
+        for ph in self.domain_packs.get(domain, ()):
+            yield ph.lower(), domain
+
+    def _get(self, domain):
+        hit = self._compiled.get(domain)
+        if hit is None:
+            origin = {}
+            for ph, src in self._entries(domain):
+                origin.setdefault(ph, src)
+            phrases = sorted(origin, key=len, reverse=True)
+            table = []
+            for m in sorted(origin, key=len):
+                if any(other in m for other, _ in table):
+                    continue
+                # длинные фразы, в которых встречается этот маркер (для ответа match)
+                table.append((m, tuple(ph for ph in phrases if m in ph and ph != m)))
+            hit = self._compiled[domain] = (tuple(table), origin)
+        return hit
+
+    def match(self, txt: str, domain: str = None):
+        # -> (источник: язык или домен, фраза) или None
+        if not txt:
+            return None
+        table, origin = self._get(domain)
+        t = txt.lower()
+        for marker, longer in table:
+            if marker in t:
+                for ph in longer:
+                    if ph in t:
+                        return origin[ph], ph
+                return origin[marker], marker
+        return None
 
-    return False
+    def markers(self, domain: str = None):
+        # минимальные маркеры в нижнем регистре — для поиска прямо в браузере
+        return [m for m, _ in self._get(domain)[0]]
+
+busy_classifier = BusyClassifier.load()
+
+def _is_busy_message(txt: str, domain: str = None) -> bool:
+    return busy_classifier.match(txt, domain) is not None
 
 # ==========================
 # YAHOO/AOL: поиск поля логина для разных дизайнов
@@ -207,43 +2040,47 @@ def find_username_input(driver, domain: str):
             continue
     return None
 
-def _extract_error_text_multi(driver, input_el):
+# Все три уровня кандидатов за один execute_script (вместо find_element/is_displayed/.text
+# на каждый элемент): [свой error-элемент], [p/span/div в fieldset поля], [*error*/*invalid*]
+_ERROR_TIERS_JS = r"""
+function visible(el) {
+    var st = getComputedStyle(el);
+    if (st.visibility === 'hidden' || st.display === 'none') return false;
+    return el.getClientRects().length > 0;
+}
+function grab(nodes, minLen, onlyVisible) {
+    var out = [];
+    for (var i = 0; i < nodes.length && out.length < 50; i++) {
+        if (onlyVisible && !visible(nodes[i])) continue;
+        var t = (nodes[i].innerText || '').trim();
+        if (t.length > minLen) out.push(t.slice(0, 300));
+    }
+    return out;
+}
+function collectErrorTiers(input) {
+    var own = document.getElementById('reg-userId-error');
+    var fs = input && input.closest ? input.closest('fieldset') : null;
+    return [
+        own ? grab([own], 0, false) : [],
+        fs ? grab(fs.querySelectorAll('p, span, div'), 2, true) : [],
+        grab(document.querySelectorAll("[class*='error'], [class*='invalid']"), 2, true)
+    ];
+}
+"""
+_COLLECT_ERRORS_JS = _ERROR_TIERS_JS + "return collectErrorTiers(arguments[0]);"
+
+def _pick_busy_text(tiers, domain: str = None):
+    # приоритет уровней: свой error-элемент → fieldset поля → fallback по классам
+    for tier in tiers or []:
+        for t in tier:
+            if t and _is_busy_message(t, domain):
+                return t
+    return ""
+
+def _extract_error_text_multi(driver, input_el, domain: str = None):
     try:
-        # старый дизайн
-        try:
-            el = driver.find_element(By.ID, "reg-userId-error")
-            txt = (el.text or "").strip()
-            if txt and _is_busy_message(txt):
-                return txt
-        except:
-            pass
-
-        # рядом с input (fieldset)
-        try:
-            container = input_el.find_element(By.XPATH, "./ancestor::fieldset[1]")
-            candidates = container.find_elements(By.XPATH, ".//p|.//span|.//div")
-            for c in candidates:
-                if not c.is_displayed():
-                    continue
-                t = (c.text or "").strip()
-                if t and len(t) > 2 and _is_busy_message(t):
-                    return t
-        except:
-            pass
-
-        # fallback
-        try:
-            candidates = driver.find_elements(By.CSS_SELECTOR, "[class*='error'], [class*='invalid']")
-            for c in candidates:
-                if not c.is_displayed():
-                    continue
-                t = (c.text or "").strip()
-                if t and len(t) > 2 and _is_busy_message(t):
-                    return t
-        except:
-            pass
-
-        return ""
+        tiers = driver.execute_script(_COLLECT_ERRORS_JS, input_el)
+        return _pick_busy_text(tiers, domain)
     except StaleElementReferenceException:
         return ""
     except:
@@ -252,7 +2089,65 @@ def _extract_error_text_multi(driver, input_el):
 # ==========================
 # Не TAB: blur кликом/JS, чтобы не прыгать в пароль
 # ==========================
+# Запросы валидации логина (AVAIL_VALIDATE_URL_MARKERS): сколько в полёте и когда пришёл ответ на запрос,
+# начатый после blur (net.since). Ставится на каждую новую страницу до её скриптов (make_driver, CDP),
+# поэтому запросы во время ввода тоже видны; повторная установка ничего не делает.
+_NET_HOOK_JS = r"""
+(function () {
+    if (window.__ecNet) return;
+    var markers = __MARKERS__;
+    var net = window.__ecNet = {pending: 0, since: 0, replied: 0, lastDone: 0};
+    function track(u) {
+        try { u = new URL(u, location.href).href; } catch (e) { return null; }
+        for (var i = 0; i < markers.length && u.indexOf(markers[i]) === -1; i++) {}
+        if (i === markers.length) return null;
+        var started = Date.now();
+        net.pending++;
+        return function () {
+            net.pending = Math.max(0, net.pending - 1);
+            net.lastDone = Date.now();
+            if (net.since && started >= net.since) net.replied = net.lastDone;
+        };
+    }
+    var open = XMLHttpRequest.prototype.open, send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.open = function (m, u) { this.__ecUrl = u; return open.apply(this, arguments); };
+    XMLHttpRequest.prototype.send = function () {
+        var end = track(this.__ecUrl);
+        if (end) this.addEventListener('loadend', end);
+        return send.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var f = window.fetch;
+        window.fetch = function (input) {
+            var end = track((input && input.url) || input);
+            if (!end) return f.apply(this, arguments);
+            return f.apply(this, arguments).finally(end);
+        };
+    }
+})();
+""".replace("__MARKERS__", json.dumps(list(AVAIL_VALIDATE_URL_MARKERS)))
+
+def install_net_hook(driver):
+    # на все следующие страницы (до их скриптов) и на уже открытую
+    try:
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": _NET_HOOK_JS})
+    except:
+        pass
+    try:
+        driver.execute_script(_NET_HOOK_JS)
+    except:
+        pass
+
 def _blur_without_tab(driver, input_el):
+    # один round trip: хук сети + отметка времени + blur + клик по body
+    try:
+        driver.execute_script(
+            _NET_HOOK_JS + "window.__ecNet.since = Date.now(); arguments[0].blur(); document.body.click();",
+            input_el,
+        )
+        return
+    except:
+        pass
     try:
         driver.execute_script("arguments[0].blur();", input_el)
     except:
@@ -262,13 +2157,110 @@ def _blur_without_tab(driver, input_el):
     except:
         pass
 
+# ==========================
+# Адаптивные окна: сколько реально ждать сообщения/рейтинга (по доменам)
+# ==========================
+# availability: задержка = через сколько секунд после ввода появилось сообщение "занят";
+#               окно = сколько ждём сообщения, прежде чем сказать "свободен"
+# reputation:   задержка = сколько секунд рейтинг ещё менялся после первого значения;
+#               окно = сколько рейтинг должен не меняться
+class AdaptiveWindows:
+    def __init__(self, enabled=ADAPTIVE_WINDOWS):
+        self.enabled = enabled
+        self._lock = Lock()
+        self._samples = {}     # key -> deque задержек
+        self._checks = {}      # key -> номер проверки (для ADAPTIVE_PROBE_EVERY)
+        self._cooldown = {}    # key -> сколько ещё проверок с фиксированным окном
+        self._censored = {}    # key -> [продлений окна, из них нашлось позднее сообщение]
+        self._record = None
+
+    def load(self, path=ADAPTIVE_STATE_FILE):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        with self._lock:
+            for key, vals in data.items():
+                self._samples[key] = deque(vals, maxlen=ADAPTIVE_MAX_SAMPLES)
+        return sum(len(v) for v in data.values())
+
+    def save(self, path=ADAPTIVE_STATE_FILE):
+        with self._lock:
+            data = {key: list(vals) for key, vals in self._samples.items()}
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def record_to(self, path):
+        self._record = open(path, "a", encoding="utf-8")
+
+    def close(self):
+        if self._record:
+            self._record.close()
+            self._record = None
+
+    def window(self, key: str, fixed: float) -> float:
+        if not self.enabled:
+            return fixed
+        with self._lock:
+            n = self._checks[key] = self._checks.get(key, 0) + 1
+            if self._cooldown.get(key, 0) > 0:
+                self._cooldown[key] -= 1
+                return fixed
+            samples = self._samples.get(key)
+            if not samples or len(samples) < ADAPTIVE_MIN_SAMPLES or n % ADAPTIVE_PROBE_EVERY == 0:
+                return fixed
+            learned = percentile(samples, ADAPTIVE_PERCENTILE) * ADAPTIVE_MARGIN
+        return min(fixed, max(ADAPTIVE_MIN_WINDOW, learned))
+
+    def observe(self, key: str, latency, status: str, window: float, fixed: float,
+                censored=False, replied=None, elapsed=None):
+        # latency=None — сообщения/смены рейтинга не было; "unknown" расширяет окна обратно.
+        # censored — сокращённое окно кончилось без ответа и проверку дождали до фиксированного;
+        # если сообщение пришло уже после сокращённого окна, окно мало — тоже возвращаем фиксированное
+        with self._lock:
+            if latency is not None:
+                self._samples.setdefault(key, deque(maxlen=ADAPTIVE_MAX_SAMPLES)).append(round(latency, 3))
+            late = censored and latency is not None and latency > window
+            if censored:
+                st = self._censored.setdefault(key, [0, 0])
+                st[0] += 1
+                st[1] += late
+            if (status == "unknown" or late) and self.enabled:
+                self._cooldown[key] = ADAPTIVE_COOLDOWN
+            if self._record:
+                self._record.write(json.dumps({
+                    "key": key, "latency": latency, "status": status,
+                    "window": round(window, 3), "fixed": fixed, "ts": round(time.time(), 3),
+                    "censored": censored, "replied": replied,
+                    "elapsed": None if elapsed is None else round(elapsed, 3),
+                }) + "\n")
+
+    def summary(self) -> str:
+        with self._lock:
+            parts = []
+            for key, samples in sorted(self._samples.items()):
+                p = percentile(samples, ADAPTIVE_PERCENTILE)
+                part = f"{key}: n={len(samples)} p{ADAPTIVE_PERCENTILE * 100:g}={p:.2f}s"
+                if key in self._censored:
+                    ext, late = self._censored[key]
+                    part += f" продлено {ext} (позднее сообщение: {late})"
+                parts.append(part)
+        return ", ".join(parts) or "замеров нет"
+
+adaptive = AdaptiveWindows()
+
 # ==========================
 # Availability: ожидание "busy/free" без спама
 # ==========================
 def _wait_busy_or_free(driver, input_el,
                        timeout=AVAIL_VALIDATION_TIMEOUT,
                        stable_ok=AVAIL_STABLE_OK_SECONDS,
-                       ignore_err_initial=AVAIL_IGNORE_ERROR_INITIAL):
+                       ignore_err_initial=AVAIL_IGNORE_ERROR_INITIAL,
+                       domain=None, obs=None):
+    # obs (необязательно) получает busy_at — когда впервые увидели сообщение, сек от start
     start = time.time()
     ok_since = None
     busy_since = None
@@ -279,10 +2271,12 @@ def _wait_busy_or_free(driver, input_el,
             raise KeyboardInterrupt
 
         now = time.time()
-        err = _extract_error_text_multi(driver, input_el)
+        err = _extract_error_text_multi(driver, input_el, domain)
 
         if err:  # сообщение есть
             last_err = err
+            if obs is not None and "busy_at" not in obs:
+                obs["busy_at"] = now - start
             if busy_since is None:
                 busy_since = now
             elif (now - busy_since) >= stable_ok:
@@ -309,51 +2303,494 @@ def _wait_busy_or_free(driver, input_el,
         time.sleep(AVAIL_POLL_INTERVAL)
 
 
+# ==========================
+# Availability: ожидание по событиям (один execute_async_script на логин)
+# ==========================
+# В браузере: MutationObserver + счётчик запросов валидации. Скрипт завершается, когда пришёл ответ
+# на запрос валидации, начатый после blur, и DOM затих на settleMs (или, если запрос не замечен, не раньше
+# stableMs — старый "пол"), либо по таймауту. Возвращает видимые тексты по уровням
+# (collectErrorTiers) — окончательно классифицирует Python.
+_WAIT_VALIDATION_JS = _ERROR_TIERS_JS + r"""
+var input = arguments[0], timeoutMs = arguments[1], stableMs = arguments[2],
+    settleMs = arguments[3], markers = arguments[4];
+var done = arguments[arguments.length - 1];
+var start = Date.now(), lastChange = start, seen = '', seenAt = null, finished = false;
+var net = window.__ecNet || {pending: 0, since: start, replied: 0, lastDone: 0};
+
+function busyText(tiers) {
+    for (var i = 0; i < tiers.length; i++)
+        for (var j = 0; j < tiers[i].length; j++) {
+            var t = tiers[i][j].toLowerCase();
+            for (var k = 0; k < markers.length; k++)
+                if (t.indexOf(markers[k]) !== -1) return tiers[i][j];
+        }
+    return '';
+}
+
+var obs = new MutationObserver(function () { lastChange = Date.now(); });
+obs.observe(document.body, {subtree: true, childList: true, characterData: true, attributes: true});
+
+var timer = setInterval(function () {
+    var now = Date.now(), tiers = collectErrorTiers(input), busy = busyText(tiers);
+    if (busy) { if (!seen) seenAt = now - start; seen = busy; }
+    var reason = null, replied = net.replied > 0 && net.replied >= net.since;
+    if (now - start >= timeoutMs) {
+        reason = 'timeout';
+    } else if (net.pending === 0 && now - Math.max(lastChange, net.lastDone) >= settleMs) {
+        if (replied || now - start >= stableMs) reason = busy ? 'busy' : 'free';
+    }
+    if (!reason || finished) return;
+    finished = true;
+    obs.disconnect();
+    clearInterval(timer);
+    done({reason: reason, elapsed: Date.now() - start, texts: tiers, seen: seen, seenAt: seenAt,
+          replied: replied});
+}, 50);
+"""
+
+def _wait_busy_or_free_event(driver, input_el,
+                             timeout=AVAIL_VALIDATION_TIMEOUT,
+                             stable_ok=AVAIL_STABLE_OK_SECONDS,
+                             domain=None, window=None, obs=None):
+    if stop_event.is_set():
+        raise KeyboardInterrupt
+
+    # AVAIL_AFTER_INPUT_DELAY здесь не спим — он входит в окна ожидания внутри скрипта
+    if window is None:
+        window = AVAIL_AFTER_INPUT_DELAY + stable_ok
+    floor_ms = int(window * 1000)
+    timeout_ms = int((AVAIL_AFTER_INPUT_DELAY + timeout) * 1000)
+    res = driver.execute_async_script(
+        _WAIT_VALIDATION_JS, input_el, timeout_ms, floor_ms, AVAIL_EVENT_SETTLE_MS,
+        busy_classifier.markers(domain),
+    )
+    if obs is not None:
+        obs["replied"] = bool(res.get("replied"))
+        if res.get("seenAt") is not None:
+            obs["busy_at"] = res["seenAt"] / 1000
+
+    err = _pick_busy_text(res.get("texts"), domain)
+    if err:
+        return "busy", err
+    seen = res.get("seen") or ""
+    if seen and _is_busy_message(seen, domain):
+        # сообщение о занятости было, но пропало — безопасно считаем занят
+        return "busy", seen
+    if res.get("reason") == "timeout":
+        return "unknown", None
+    return "free", None
+
+def _wait_validation(driver, input_el, domain=None):
+    # окно "ждём сообщение" считается от ввода: пауза после ввода + стабильное окно
+    fixed = AVAIL_AFTER_INPUT_DELAY + AVAIL_STABLE_OK_SECONDS
+    window = adaptive.window(domain, fixed)
+    obs = {}
+    t0 = time.time()
+    result = _wait_validation_once(driver, input_el, domain, window, fixed, obs)
+    censored = result[0] == "free" and window < fixed and not obs.get("replied")
+    if censored:
+        # сокращённое окно кончилось, а ответа валидации не было: "нет сообщения" ещё не значит
+        # "свободен" — сообщение могло опоздать. Дожидаемся остатка фиксированного окна.
+        late = {}
+        result = _wait_validation_tail(driver, input_el, domain, fixed - window, late)
+        if "busy_at" in late:
+            obs["busy_at"] = window + late["busy_at"]
+    adaptive.observe(domain, obs.get("busy_at"), result[0], window, fixed,
+                     censored=censored, replied=obs.get("replied"), elapsed=time.time() - t0)
+    return result
+
+def _wait_validation_tail(driver, input_el, domain, extra, obs):
+    # продолжение после сокращённого окна: ждём ещё extra сек (пауза после ввода уже прошла)
+    if AVAIL_EVENT_WAIT:
+        try:
+            return _wait_busy_or_free_event(driver, input_el, domain=domain, window=extra, obs=obs)
+        except KeyboardInterrupt:
+            raise
+        except StaleElementReferenceException:
+            raise
+        except Exception as e:
+            print(Fore.MAGENTA + f"[event-wait] fallback на опрос: {e}")
+            obs.clear()
+    return _wait_busy_or_free(driver, input_el, stable_ok=extra, domain=domain, obs=obs)
+
+def _wait_validation_once(driver, input_el, domain, window, fixed, obs):
+    if AVAIL_EVENT_WAIT:
+        try:
+            return _wait_busy_or_free_event(driver, input_el, domain=domain, window=window, obs=obs)
+        except KeyboardInterrupt:
+            raise
+        except StaleElementReferenceException:
+            raise
+        except Exception as e:
+            # например, страница перезагрузилась посреди скрипта — добиваем старым опросом
+            print(Fore.MAGENTA + f"[event-wait] fallback на опрос: {e}")
+            obs.clear()
+    # окно сокращаем пропорционально: и паузу после ввода, и стабильное окно
+    scale = window / fixed
+    delay = AVAIL_AFTER_INPUT_DELAY * scale
+    time.sleep(delay)
+    result = _wait_busy_or_free(driver, input_el, stable_ok=AVAIL_STABLE_OK_SECONDS * scale,
+                                domain=domain, obs=obs)
+    if "busy_at" in obs:
+        obs["busy_at"] += delay
+    return result
+
 # ==========================
 # Фильтрация (ВАЖНО): не запускаем браузеры, если всё уже в кэше
 # ==========================
-def _login_fully_cached(login: str, checked_cache: set) -> bool:
-    for dom in SUPPORTED_DOMAINS:
-        if f"{login}@{dom}" not in checked_cache:
-            return False
-    return True
+class WorkPlanner:
+    # Один линейный проход: для каждого логина ключ "login@domain" строится один раз,
+    # результат — битовая маска доменов, которые ещё нужно проверить.
+    def __init__(self, checked_cache, domains=None):
+        self.checked_cache = checked_cache
+        self.domains = tuple(domains or SUPPORTED_DOMAINS)
+        self.suffixes = tuple("@" + d for d in self.domains)
+        self.full_mask = (1 << len(self.domains)) - 1
+        self.reset()
+
+    def reset(self):
+        self.logins = 0
+        self.fully_cached = 0
+        self.need = dict.fromkeys(self.domains, 0)
+        self.canonicalized = 0  # логинов, записанных в файле не в каноническом виде
+        self.duplicates = 0     # повторов (после канонизации) среди ещё не проверенных
+        self.saved = 0          # проверок "логин@домен", которые не придётся делать благодаря этому
+        self.seen = HashIndex()  # хэши непроверенных логинов, а не строки (см. iter_unique)
+
+    def need_mask(self, login: str) -> int:
+        cache = self.checked_cache
+        mask = 0
+        for i, suffix in enumerate(self.suffixes):
+            if login + suffix not in cache:
+                mask |= 1 << i
+        return mask
+
+    def iter_work(self, logins, on_cached=None):
+        # -> (login, mask) только для логинов, где есть что проверять; попутно считаем статистику.
+        # Логины приводятся к каноническому виду; повторы выдаются один раз
+        # (в seen — только непроверенные логины, закэшированные отсекаются раньше).
+        # on_cached(email) — для каждого "логин@домен", который уже в кэше и проверяться не будет
+        seen = self.seen
+        for raw in logins:
+            self.logins += 1
+            login = canonical_login(raw)
+            mask = self.need_mask(login)
+            if login != raw:
+                self.canonicalized += 1
+                self.saved += bin(self.need_mask(raw) & ~mask).count("1")
+            if on_cached and mask != self.full_mask:
+                for i, suffix in enumerate(self.suffixes):
+                    if not mask & (1 << i):
+                        on_cached(login + suffix)
+            if not mask:
+                self.fully_cached += 1
+                continue
+            if not seen.add(login):
+                self.duplicates += 1
+                self.saved += bin(mask).count("1")
+                continue
+            for i, dom in enumerate(self.domains):
+                if mask & (1 << i):
+                    self.need[dom] += 1
+            yield login, mask
+
+    def survey(self, logins):
+        # только подсчёт (без списков) — для отчёта перед запуском
+        for _ in self.iter_work(logins):
+            pass
+        return self
+
+    def plan_batch(self, work):
+        # [(login, mask)] -> {domain: [login, ...]} без повторных обращений к кэшу
+        out = {dom: [] for dom in self.domains}
+        lists = [out[dom] for dom in self.domains]
+        for login, mask in work:
+            for i, lst in enumerate(lists):
+                if mask & (1 << i):
+                    lst.append(login)
+        return out
+
+    def report(self) -> str:
+        need = ", ".join(f"{dom}: {n}" for dom, n in self.need.items())
+        return (f"логинов {self.logins}, полностью в кэше {self.fully_cached}, "
+                f"нужно проверить — {need}; канонизировано {self.canonicalized}, "
+                f"повторов {self.duplicates}, сэкономлено проверок {self.saved}")
 
-def _logins_need_domain(domain: str, logins: list, checked_cache: set) -> list:
-    out = []
-    for login in logins:
-        if f"{login}@{domain}" not in checked_cache:
-            out.append(login)
-    return out
+# ==========================
+# БЭКЕНДЫ ПРОВЕРОК: доступность (login -> busy/free/unknown) и репутация (email -> score)
+# ==========================
+class BackendError(Exception):
+    # сбой транспорта не-браузерного бэкенда (обрабатывается как WebDriverException: перезапуск)
+    pass
+
+class BackendRejected(BackendError):
+    # сайт отказал (4xx/429: лимит, запрет) — ответа по существу нет, в кэш не пишем
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+class AvailabilityBackend(ABC):
+    name = "base"
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self.checks = 0
+
+    def open(self):
+        pass
+
+    @abstractmethod
+    def check(self, login: str):
+        # -> (status: "busy"|"free"|"unknown", текст сообщения или None)
+        ...
+
+    def restart(self):
+        self.close()
+        self.open()
+
+    def close(self):
+        pass
+
+class ReputationBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def score(self, email: str, info: dict = None):
+        # -> 0..100 или None; info получает attempts/error (для кэша)
+        ...
+
+    def close(self):
+        pass
+
+class SeleniumAvailabilityBackend(AvailabilityBackend):
+    name = "selenium"
+
+    def __init__(self, domain: str, url: str = None):
+        super().__init__(domain)
+        # своя страница (например, локальный стенд) — отдельное назначение в пуле
+        self.purpose = domain if url is None else f"{domain} @ {url}"
+        browser_pool.urls.setdefault(self.purpose, url or SUPPORTED_DOMAINS[domain])
+        self.driver = None
+        self.input_el = None
+
+    def open(self):
+        self.driver = browser_pool.acquire(self.purpose)
+        install_net_hook(self.driver)   # браузер мог быть создан без CDP-хука
+        self.input_el = self.ensure_input()
+
+    def ensure_input(self):
+        t0 = time.time()
+        while True:
+            if stop_event.is_set():
+                raise KeyboardInterrupt
+            el = find_username_input(self.driver, self.domain)
+            if el:
+                return el
+            if time.time() - t0 > 25:
+                raise TimeoutException(f"[{self.domain}] Не найдено поле логина (дизайн не распознан).")
+            time.sleep(0.3)
+
+    def check(self, login: str):
+        driver = self.driver
+        with metrics.phase(self.domain, "ensure_input"):
+            input_el = self.input_el = self.ensure_input()
+
+        with metrics.phase(self.domain, "typing"):
+            # фокус и ввод
+            try:
+                input_el.click()
+            except:
+                pass
+
+            try:
+                input_el.clear()
+            except:
+                input_el.send_keys(Keys.CONTROL, "a")
+                input_el.send_keys(Keys.BACKSPACE)
+
+            input_el.send_keys(login)
+
+            # микро-действие (важно!)
+            input_el.send_keys(" ")
+            input_el.send_keys(Keys.BACKSPACE)
+
+            # blur без TAB
+            _blur_without_tab(driver, input_el)
+
+        with metrics.phase(self.domain, "wait_busy_or_free"):
+            result = _wait_validation(driver, input_el, self.domain)
+        self.checks += 1
+        return result
+
+    def restart(self):
+        if self.driver is not None:
+            browser_pool.discard(self.driver)
+            self.driver = None
+        self.open()
+
+    def close(self):
+        if self.driver is not None:
+            browser_pool.release(self.purpose, self.driver, self.checks)
+            self.driver = None
+        self.checks = 0
+
+class _HttpClient:
+    # одно keep-alive соединение на бэкенд (http.client из stdlib)
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or "/"
+        self.query = dict(parse_qsl(parts.query))
+        self.conn = None
+
+    def get_json(self, **params):
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.conn = cls(self.host, self.port, timeout=HTTP_BACKEND_TIMEOUT)
+        q = urlencode({**self.query, **params})
+        try:
+            self.conn.request("GET", f"{self.path}?{q}", headers={"Accept": "application/json"})
+            resp = self.conn.getresponse()
+            body = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.close()
+            raise BackendError(f"{self.host}: {e!r}") from e
+        if resp.status >= 500:
+            raise BackendError(f"{self.host}: HTTP {resp.status}")
+        if resp.status != 200:
+            raise BackendRejected(f"{self.host}: HTTP {resp.status}", resp.status)
+        try:
+            return resp.status, json.loads(body)
+        except ValueError as e:
+            raise BackendError(f"{self.host}: не JSON") from e
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except OSError:
+                pass
+            self.conn = None
+
+class HttpAvailabilityBackend(AvailabilityBackend):
+    name = "http"
+
+    def __init__(self, domain: str, url: str = None):
+        super().__init__(domain)
+        url = url or HTTP_AVAIL_URLS.get(domain)
+        if not url:
+            raise ValueError(f"Для {domain} не задан HTTP_AVAIL_URLS")
+        self.client = _HttpClient(url)
+
+    def check(self, login: str):
+        if stop_event.is_set():
+            raise KeyboardInterrupt
+        _, data = self.client.get_json(userId=login)
+        self.checks += 1
+        err = _pick_busy_text([data.get("messages") or []], self.domain)
+        if err:
+            return "busy", err
+        return "free", None
+
+    def close(self):
+        self.client.close()
+
+class SeleniumReputationBackend(ReputationBackend):
+    name = "selenium"
+
+    def __init__(self, url: str = None):
+        self.purpose = "reputation" if url is None else f"reputation @ {url}"
+        self.url = url or REPUTATION_URL
+        browser_pool.urls.setdefault(self.purpose, self.url)
+        self.driver = None
+        self.checks = 0
+
+    def score(self, email: str, info: dict = None):
+        # браузер берём только когда реально нужна живая проверка (всё из кэша — без Chrome)
+        if self.driver is None:
+            self.driver = browser_pool.acquire(self.purpose)
+        score = _get_reputation_with_retry(self.driver, email, info, url=self.url)
+        self.checks += 1
+        return score
+
+    def close(self):
+        if self.driver is not None:
+            browser_pool.release(self.purpose, self.driver, self.checks)
+            self.driver = None
+
+class HttpReputationBackend(ReputationBackend):
+    name = "http"
+
+    def __init__(self, url: str = None):
+        url = url or HTTP_REP_URL
+        if not url:
+            raise ValueError("Не задан HTTP_REP_URL")
+        self.client = _HttpClient(url)
+
+    def score(self, email: str, info: dict = None):
+        # те же правила, что и у браузера: REP_MAX_ATTEMPTS, UNABLE_MAX_HITS, REP_RETRY_BACKOFF
+        if info is None:
+            info = {}
+        info["attempts"] = 0
+        info["error"] = None
+        unable_hits = 0
+        for attempt in range(1, REP_MAX_ATTEMPTS + 1):
+            if stop_event.is_set():
+                return None
+            info["attempts"] = attempt
+            try:
+                _, data = self.client.get_json(email=email)
+            except BackendError as e:
+                info["error"] = repr(e)
+                if attempt >= REP_MAX_ATTEMPTS:
+                    return None
+                time.sleep(REP_RETRY_BACKOFF[min(attempt - 1, len(REP_RETRY_BACKOFF) - 1)])
+                continue
+            data = data or {}
+            if data.get("unable"):
+                unable_hits += 1
+                info["error"] = "unable to check"
+                if unable_hits >= UNABLE_MAX_HITS:
+                    return 0
+                continue
+            score = _meter_value(data.get("score"))
+            if score is not None:
+                return score
+            info["error"] = f"bad answer: {data!r}"
+        return None
+
+    def close(self):
+        self.client.close()
+
+AVAIL_BACKEND_TYPES = {"selenium": SeleniumAvailabilityBackend, "http": HttpAvailabilityBackend}
+REP_BACKEND_TYPES = {"selenium": SeleniumReputationBackend, "http": HttpReputationBackend}
+
+def make_availability_backend(domain: str) -> AvailabilityBackend:
+    return AVAIL_BACKEND_TYPES[AVAIL_BACKENDS.get(domain, "selenium")](domain)
+
+def make_reputation_backend() -> ReputationBackend:
+    return REP_BACKEND_TYPES[REP_BACKEND]()
 
 # ==========================
 # ШАГ 1: ДОСТУПНОСТЬ (yahoo/aol)
 # ==========================
 def process_domain(domain, logins, checked_cache, cache_lock,
-                   avail_f, busy_f, login_done_map, done_lock):
+                   results: ResultStore, login_done_map, done_lock, on_free=None,
+                   backend: AvailabilityBackend = None, on_result=None, limiter=None):
+    # on_result(dict) — итог по каждому email (сервисный режим отдаёт их клиенту)
+    # limiter — потолок частоты проверок (по умолчанию общий для домена, DOMAIN_RATE_LIMITS)
     # если нечего проверять по этому домену — не открываем браузер вообще
     if not logins:
         print(Fore.CYAN + f"[{domain}] Нечего проверять (всё в кэше) — браузер не запускаю")
         return
 
-    driver = None
+    backend = backend or make_availability_backend(domain)
+    limiter = limiter or rate_limiter(domain)
     try:
-        driver = make_driver()
-        driver.get(SUPPORTED_DOMAINS[domain])
-        print(Fore.CYAN + f"[{domain}] Браузер запущен (логинов: {len(logins)})")
-
-        def ensure_input():
-            t0 = time.time()
-            while True:
-                if stop_event.is_set():
-                    raise KeyboardInterrupt
-                el = find_username_input(driver, domain)
-                if el:
-                    return el
-                if time.time() - t0 > 25:
-                    raise TimeoutException(f"[{domain}] Не найдено поле логина (дизайн не распознан).")
-                time.sleep(0.3)
-
-        input_el = ensure_input()
+        backend.open()
+        print(Fore.CYAN + f"[{domain}] {backend.name}: готов (логинов: {len(logins)})")
 
         for login in logins:
             if stop_event.is_set():
@@ -362,66 +2799,54 @@ def process_domain(domain, logins, checked_cache, cache_lock,
             email = f"{login}@{domain}"
 
             with cache_lock:
-                if email in checked_cache:
-                    mark_login_done(login_done_map, login, domain, done_lock)
-                    continue
+                hit = checked_cache.get(email) if email in checked_cache else None
+            if hit:
+                # проверил другой поток/задание, пока логин ждал своей очереди
+                mark_login_done(login_done_map, login, domain, done_lock)
+                if on_result:
+                    on_result({"stage": "availability", "email": email, "status": hit[0], "cached": True})
+                continue
 
             # 2 попытки на один логин (если DOM сломался)
             per_login_attempts = 2
+            started_at = time.time()
+            webdriver_trace.begin(email)   # команды всех попыток и перезапусков — на этот email
             for attempt in range(1, per_login_attempts + 1):
+                if not limiter.acquire():
+                    break
                 try:
-                    input_el = ensure_input()
-
-                    # фокус и ввод
-                    try:
-                        input_el.click()
-                    except:
-                        pass
-
-                    try:
-                        input_el.clear()
-                    except:
-                        input_el.send_keys(Keys.CONTROL, "a")
-                        input_el.send_keys(Keys.BACKSPACE)
-
-                    input_el.send_keys(login)
-
-                    # микро-действие (важно!)
-                    input_el.send_keys(" ")
-                    input_el.send_keys(Keys.BACKSPACE)
-
-                    # blur без TAB
-                    _blur_without_tab(driver, input_el)
-
-                    time.sleep(AVAIL_AFTER_INPUT_DELAY)
-
-                    status, err_text = _wait_busy_or_free(driver, input_el)
+                    with metrics.phase(domain, "check"):
+                        status, err_text = backend.check(login)
+                    metrics.result(domain, status)
 
                     if status == "busy":
-                        busy_f.write(email + "\n")
+                        results.availability(email, "busy", error=err_text,
+                                             attempts=attempt, started_at=started_at)
                         with cache_lock:
-                            save_cache_line(CACHE_AVAIL, email)
-                            checked_cache.add(email)
+                            checked_cache.add(email, "busy")
                         print(Fore.RED + f"{email} — ЗАНЯТ | {err_text}")
 
                     elif status == "free":
                         pwd = "".join(random.choice(
                             "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
                         ) for _ in range(PASSWORD_LENGTH))
-                        avail_f.write(f"{email}:{pwd}\n")
+                        results.availability(email, "free", password=pwd,
+                                             attempts=attempt, started_at=started_at)
                         with cache_lock:
-                            save_cache_line(CACHE_AVAIL, email)
-                            checked_cache.add(email)
+                            checked_cache.add(email, "free")
                         print(Fore.GREEN + f"{email} — СВОБОДЕН")
+                        if on_free:
+                            on_free(email)
 
                     else:
-                        busy_f.write(email + "\n")
+                        results.availability(email, "unknown", attempts=attempt, started_at=started_at)
                         with cache_lock:
-                            save_cache_line(CACHE_AVAIL, email)
-                            checked_cache.add(email)
+                            checked_cache.add(email, "unknown")
                         print(Fore.YELLOW + f"{email} — НЕЯСНО (timeout). Записал как ЗАНЯТ (безопасно).")
 
                     mark_login_done(login_done_map, login, domain, done_lock)
+                    if on_result:
+                        on_result({"stage": "availability", "email": email, "status": status})
                     time.sleep(0.25)
                     break
 
@@ -429,77 +2854,223 @@ def process_domain(domain, logins, checked_cache, cache_lock,
                     stop_event.set()
                     break
 
-                except (TimeoutException, StaleElementReferenceException, WebDriverException) as e:
+                except (TimeoutException, StaleElementReferenceException, WebDriverException, BackendError) as e:
+                    if attempt >= per_login_attempts and isinstance(e, BackendRejected):
+                        # отказ сайта (лимит/запрет) — не ответ: не кэшируем и не отмечаем,
+                        # пакет не подтвердится в журнале, и email проверится в следующий запуск
+                        print(Fore.YELLOW + f"[{domain}] {email} — сайт отказал ({e}). Отложен, в кэш не пишу.")
+                        metrics.result(domain, "error")
+                        if on_result:
+                            on_result({"stage": "availability", "email": email, "status": "error"})
+                        break
                     if attempt >= per_login_attempts:
                         print(Fore.YELLOW + f"[{domain}] {email} — ошибка DOM/валидации: {e}. Записал как ЗАНЯТ.")
-                        busy_f.write(email + "\n")
+                        metrics.result(domain, "error")
+                        results.availability(email, "error", error=repr(e),
+                                             attempts=attempt, started_at=started_at)
                         with cache_lock:
-                            save_cache_line(CACHE_AVAIL, email)
-                            checked_cache.add(email)
+                            checked_cache.add(email, "unknown")
                         mark_login_done(login_done_map, login, domain, done_lock)
+                        if on_result:
+                            on_result({"stage": "availability", "email": email, "status": "error"})
                         break
 
-                    print(Fore.MAGENTA + f"[{domain}] Перезапуск браузера (причина: {e})...")
-                    try:
-                        driver.quit()
-                    except:
-                        pass
-                    driver = make_driver()
-                    driver.get(SUPPORTED_DOMAINS[domain])
-                    input_el = ensure_input()
+                    print(Fore.MAGENTA + f"[{domain}] Перезапуск {backend.name} (причина: {e})...")
+                    metrics.result(domain, "restart", progress=False)
+                    backend.restart()
 
                 except Exception as e:
                     if attempt >= per_login_attempts:
                         print(Fore.YELLOW + f"[{domain}] {email} — неизвестная ошибка: {e}. Записал как ЗАНЯТ.")
-                        busy_f.write(email + "\n")
+                        metrics.result(domain, "error")
+                        results.availability(email, "error", error=repr(e),
+                                             attempts=attempt, started_at=started_at)
                         with cache_lock:
-                            save_cache_line(CACHE_AVAIL, email)
-                            checked_cache.add(email)
+                            checked_cache.add(email, "unknown")
                         mark_login_done(login_done_map, login, domain, done_lock)
+                        if on_result:
+                            on_result({"stage": "availability", "email": email, "status": "error"})
                         break
 
-                    print(Fore.MAGENTA + f"[{domain}] Перезапуск браузера (unknown err: {e})...")
-                    try:
-                        driver.quit()
-                    except:
-                        pass
-                    driver = make_driver()
-                    driver.get(SUPPORTED_DOMAINS[domain])
-                    input_el = ensure_input()
+                    print(Fore.MAGENTA + f"[{domain}] Перезапуск {backend.name} (unknown err: {e})...")
+                    metrics.result(domain, "restart", progress=False)
+                    backend.restart()
+            webdriver_trace.end()
 
     finally:
+        webdriver_trace.end()
+        backend.close()
+        print(Fore.CYAN + f"[{domain}] Готово")
+
+# ==========================
+# ДОМЕНЫ ПАРАЛЛЕЛЬНО: поток на домен, потолок частоты на сайт
+# ==========================
+class TokenBucket:
+    # rate проверок в секунду, не больше burst подряд. acquire() резервирует следующий слот
+    # под замком и спит вне его — несколько потоков/заданий на один сайт встают в очередь.
+    def __init__(self, rate, burst=DOMAIN_RATE_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = Lock()
+        self.waited = 0.0          # сколько секунд всего ждали потолка
+
+    def acquire(self) -> bool:
+        # False — ожидание прервано остановкой (Ctrl+C)
+        if self.rate <= 0:
+            return not stop_event.is_set()
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += wait
+        if wait:
+            return not stop_event.wait(wait)
+        return not stop_event.is_set()
+
+_rate_limiters = {}
+_rate_limiters_lock = Lock()
+
+def rate_limiter(domain) -> TokenBucket:
+    # один на домен на весь процесс
+    with _rate_limiters_lock:
+        bucket = _rate_limiters.get(domain)
+        if bucket is None:
+            bucket = _rate_limiters[domain] = TokenBucket(DOMAIN_RATE_LIMITS.get(domain, 0))
+        return bucket
+
+def rate_limit_summary() -> str:
+    with _rate_limiters_lock:
+        parts = [f"{dom} ≤{b.rate:g}/с, ожидание {b.waited:.1f}s" if b.rate > 0 else f"{dom} без потолка"
+                 for dom, b in _rate_limiters.items()]
+    return "; ".join(parts) or "проверок не было"
+
+def process_domains(logins_by_domain, checked_cache, cache_lock, results: ResultStore,
+                    login_done_map, done_lock, on_free=None, on_result=None,
+                    backends=None, limiters=None, parallel=DOMAIN_WORKERS):
+    # process_domain для всех доменов пакета: одновременно (parallel) или по очереди в порядке
+    # SUPPORTED_DOMAINS. Общие кэш, журнал выполненного и результаты и так защищены замками/очередью.
+    backends = backends or {}
+    limiters = limiters or {}
+    domains = [dom for dom in SUPPORTED_DOMAINS if dom in logins_by_domain]
+
+    def run(dom):
+        process_domain(dom, logins_by_domain[dom], checked_cache, cache_lock, results,
+                       login_done_map, done_lock, on_free=on_free, backend=backends.get(dom),
+                       on_result=on_result, limiter=limiters.get(dom))
+
+    busy = [dom for dom in domains if logins_by_domain[dom]]
+    if not parallel or len(busy) < 2:
+        for dom in domains:
+            run(dom)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(len(domains), thread_name_prefix="domain") as pool:
+        futures = [pool.submit(run, dom) for dom in domains]
+        pending = futures
         try:
-            if driver:
-                driver.quit()
-        except:
-            pass
-        print(Fore.CYAN + f"[{domain}] Закрыт")
+            # с таймаутом: бесконечное ожидание на Windows не прерывается Ctrl+C
+            while pending:
+                _, pending = concurrent.futures.wait(pending, timeout=0.5)
+        except KeyboardInterrupt:
+            stop_event.set()   # потоки доменов увидят и закончат текущую проверку
+            raise
+    for f in futures:
+        f.result()   # ошибка в потоке домена — как при последовательном запуске
 
 # ==========================
 # ШАГ 2: РЕПУТАЦИЯ (Mailmeteor)
 # ==========================
-def _mailmeteor_unable_message(driver) -> bool:
-    try:
-        html = (driver.page_source or "").lower()
-        return ("unable to check this email" in html) and ("please try again" in html)
-    except:
-        return False
+# Одна проба вместо page_source + find_element + get_attribute на каждый тик:
+# браузер сам ищет текстовые узлы "Unable to check..." через XPath (без сериализации
+# всего HTML) и читает aria-valuenow у [role='meter'], а в Python уходит маленький объект.
+# Размер страницы меряется только на первой пробе email — для отчёта об экономии.
+# Если с прошлой пробы ничего не поменялось,
+# скрипт ждёт изменения DOM (но не дольше waitMs) — тиков становится меньше.
+_REP_PROBE_JS = r"""
+var first = arguments[0], last = arguments[1], waitMs = arguments[2];
+var done = arguments[arguments.length - 1];
+function hasText(phrase) {
+    var xp = "boolean(//text()[contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', " +
+             "'abcdefghijklmnopqrstuvwxyz'), '" + phrase + "')])";
+    return document.evaluate(xp, document, null, XPathResult.BOOLEAN_TYPE, null).booleanValue;
+}
+function snap() {
+    var m = document.querySelector("[role='meter']");
+    return {
+        unable: hasText('unable to check this email') && hasText('please try again'),
+        score: m ? m.getAttribute('aria-valuenow') : null
+    };
+}
+var cur = snap();
+if (first) cur.page_bytes = new TextEncoder().encode(document.documentElement.outerHTML).length;
+if (first || cur.unable || cur.score !== last) return done(cur);
+var dirty = false, finished = false;
+var obs = new MutationObserver(function () { dirty = true; });
+obs.observe(document.documentElement, {subtree: true, childList: true, characterData: true, attributes: true});
+function finish(s) {
+    if (finished) return;
+    finished = true;
+    obs.disconnect();
+    clearInterval(timer);
+    done(s);
+}
+var timer = setInterval(function () {
+    if (!dirty) return;
+    dirty = false;
+    var s = snap();
+    if (s.unable || s.score !== last) finish(s);
+}, 100);
+setTimeout(function () { finish(snap()); }, waitMs);
+"""
+
+# учёт экономии: сколько round trips и байт ушло бы на старый опрос раз в 0.5 с
+rep_probe_stats = {"probes": 0, "payload_bytes": 0, "page_bytes": 0, "page_samples": 0, "seconds": 0.0}
+_rep_probe_lock = Lock()
+
+def _meter_value(val):
+    if val is None:
+        return None
+    val = str(val).strip()
+    if not val.isdigit():
+        return None
+    score = int(val)
+    if 0 <= score <= 100:
+        return score
+    return None
 
-def _parse_meter_score(driver):
+def _probe_reputation(driver, first: bool, last_raw):
+    # -> (unable: bool, сырое aria-valuenow или None)
+    t0 = time.time()
     try:
-        meter = driver.find_element(By.CSS_SELECTOR, "[role='meter']")
-        val = meter.get_attribute("aria-valuenow")
-        if val is None:
-            return None
-        val = str(val).strip()
-        if not val.isdigit():
-            return None
-        score = int(val)
-        if 0 <= score <= 100:
-            return score
-        return None
+        res = driver.execute_async_script(_REP_PROBE_JS, first, last_raw, REP_PROBE_WAIT_MS)
     except:
-        return None
+        time.sleep(0.5)
+        return False, None
+    with _rep_probe_lock:
+        rep_probe_stats["probes"] += 1
+        rep_probe_stats["payload_bytes"] += len(json.dumps(res))
+        if res.get("page_bytes"):
+            rep_probe_stats["page_bytes"] += int(res["page_bytes"])
+            rep_probe_stats["page_samples"] += 1
+        rep_probe_stats["seconds"] += time.time() - t0
+    return bool(res.get("unable")), res.get("score")
+
+def rep_probe_summary() -> str:
+    st = rep_probe_stats
+    if not st["probes"]:
+        return "проб не было"
+    # старый цикл: тик раз в 0.5 с × 3 запроса (page_source, find_element, get_attribute)
+    old_ticks = max(st["probes"], int(st["seconds"] / 0.5))
+    line = f"проб {st['probes']} (round trips {st['probes']} вместо ~{old_ticks * 3}), передано {st['payload_bytes']} Б"
+    if st["page_samples"]:
+        # page_source на каждом тике: средний размер страницы (UTF-8) × число тиков — оценка
+        avg_page = st["page_bytes"] / st["page_samples"]
+        line += f" вместо ~{int(avg_page * old_ticks)} Б page_source (оценка)"
+    return line
 
 def _wait_for_form_ready(driver, timeout_seconds: int = 90):
     start = time.time()
@@ -526,15 +3097,21 @@ def _wait_for_ready_score(driver, timeout_seconds: int, require_nonzero: bool =
     start = time.time()
     stable_score = None
     stable_since = None
+    first_seen = None
+    first = True
+    last_raw = None
+    window = adaptive.window("reputation", REP_STABLE_SECONDS)
 
     while True:
         if stop_event.is_set():
             raise KeyboardInterrupt
 
-        if _mailmeteor_unable_message(driver):
+        unable, last_raw = _probe_reputation(driver, first, last_raw)
+        first = False
+        if unable:
             raise UnableToCheckEmail("Unable to check this email. Please try again.")
 
-        score = _parse_meter_score(driver)
+        score = _meter_value(last_raw)
 
         if score is not None:
             if require_nonzero and score == 0:
@@ -544,46 +3121,59 @@ def _wait_for_ready_score(driver, timeout_seconds: int, require_nonzero: bool =
                 if stable_score != score:
                     stable_score = score
                     stable_since = time.time()
-                elif (time.time() - stable_since) >= 2.0:  # устойчиво 2 сек
+                    if first_seen is None:
+                        first_seen = stable_since
+                elif (time.time() - stable_since) >= window:  # устойчиво REP_STABLE_SECONDS
+                    # рейтинг 0 может быть ранним значением — расширяем окно
+                    adaptive.observe("reputation", stable_since - first_seen,
+                                     "ok" if stable_score else "unknown", window, REP_STABLE_SECONDS)
                     return stable_score
 
         if time.time() - start > timeout_seconds:
             raise TimeoutException("Score not ready (still 0/None).")
 
-        time.sleep(0.5)
-
 
-def _get_reputation_with_retry(driver, email: str):
+def _get_reputation_with_retry(driver, email: str, info: dict = None, url: str = REPUTATION_URL):
+    # info (необязательно) получает метаданные для кэша: attempts, error
+    if info is None:
+        info = {}
+    info["attempts"] = 0
+    info["error"] = None
     unable_hits = 0
 
     for attempt in range(1, REP_MAX_ATTEMPTS + 1):
         if stop_event.is_set():
             return None
 
+        info["attempts"] = attempt
         try:
-            driver.get(REPUTATION_URL)
-            _wait_for_form_ready(driver, timeout_seconds=REP_WAIT_SECONDS)
+            with metrics.phase("reputation", "driver_get"):
+                driver.get(url)
+            with metrics.phase("reputation", "wait_for_form_ready"):
+                _wait_for_form_ready(driver, timeout_seconds=REP_WAIT_SECONDS)
 
             _submit_email_for_reputation(driver, email)
             print(Fore.YELLOW + f"{email} — попытка {attempt}/{REP_MAX_ATTEMPTS}: если есть Cloudflare, реши вручную")
 
             time.sleep(REP_AFTER_CLICK_DELAY)
 
-            score = _wait_for_ready_score(
-                driver,
-                timeout_seconds=REP_WAIT_SECONDS,
-                require_nonzero=False  # ⚡ снимаем ограничение
-            )
+            with metrics.phase("reputation", "wait_for_ready_score"):
+                score = _wait_for_ready_score(
+                    driver,
+                    timeout_seconds=REP_WAIT_SECONDS,
+                    require_nonzero=False  # ⚡ снимаем ограничение
+                )
 
             # 🔹 Дополнительная проверка: если score == 0 → пробуем ещё раз
             if score == 0:
                 print(Fore.MAGENTA + f"{email} — результат 0, повторная проверка...")
                 time.sleep(5)  # пауза перед повтором
-                score_retry = _wait_for_ready_score(
-                    driver,
-                    timeout_seconds=REP_WAIT_SECONDS,
-                    require_nonzero=False
-                )
+                with metrics.phase("reputation", "wait_for_ready_score"):
+                    score_retry = _wait_for_ready_score(
+                        driver,
+                        timeout_seconds=REP_WAIT_SECONDS,
+                        require_nonzero=False
+                    )
                 if score_retry and score_retry > 0:
                     return score_retry
 
@@ -591,6 +3181,7 @@ def _get_reputation_with_retry(driver, email: str):
 
         except UnableToCheckEmail:
             unable_hits += 1
+            info["error"] = "unable to check"
             print(Fore.MAGENTA + f"{email} — Unable... ({unable_hits}/{UNABLE_MAX_HITS})")
             if unable_hits >= UNABLE_MAX_HITS:
                 print(Fore.RED + f"{email} — SKIP (Unable... два раза). score=0")
@@ -603,6 +3194,7 @@ def _get_reputation_with_retry(driver, email: str):
             return None
 
         except (TimeoutException, WebDriverException, Exception) as e:
+            info["error"] = repr(e)
             if attempt >= REP_MAX_ATTEMPTS:
                 print(Fore.RED + f"{email} — репутация НЕ получена: {e}")
                 return None
@@ -612,15 +3204,25 @@ def _get_reputation_with_retry(driver, email: str):
 
     return None
 
-def check_reputation(emails, out_dir: Path):
-    rep_cache = load_rep_cache()
-    driver = make_driver()
-
-    good = open(out_dir / "reputation_good.txt", "w", encoding="utf-8")
-    mid  = open(out_dir / "reputation_medium.txt", "w", encoding="utf-8")
-    bad  = open(out_dir / "reputation_bad.txt", "w", encoding="utf-8")
-    fail = open(out_dir / "reputation_retry_failed.txt", "w", encoding="utf-8")
-    errf = open(out_dir / "reputation_errors.txt", "w", encoding="utf-8")
+def check_reputation(emails, out_dir: Path, backend: ReputationBackend = None,
+                     rep_cache_path: str = None, writer: ResultWriter = None, on_result=None,
+                     results: ResultStore = None):
+    # rep_cache_path — отдельный кэш (бенчмарки); старый txt импортируется только в основной
+    rep_cache = RepCache(rep_cache_path or CACHE_REP_DB)
+    if rep_cache_path is None:
+        imported = rep_cache.import_txt(CACHE_REP)
+        if imported:
+            print(Fore.CYAN + f"[CACHE reputation] импортировано из {CACHE_REP}: {imported}")
+        migrated = rep_cache.migrate_keys(force=bool(imported))
+        if migrated:
+            print(Fore.CYAN + f"[CACHE reputation] ключей приведено к каноническому виду: {migrated}")
+    backend = backend or make_reputation_backend()
+    own_writer = writer is None
+    if own_writer:
+        writer = ResultWriter().start()
+    own_results = results is None
+    if own_results:
+        results = open_result_store(out_dir, writer)
 
     try:
         for email in emails:
@@ -628,33 +3230,44 @@ def check_reputation(emails, out_dir: Path):
                 break
 
             score = None
+            status = "cached"
+            info = {}
+            started_at = time.time()
 
-            if email in rep_cache and str(rep_cache[email]).strip().isdigit():
-                cached = int(rep_cache[email])
-                if cached != 0:
-                    score = cached
-                    print(Fore.CYAN + f"{email} — репутация из кэша: {score}")
+            cached = rep_cache.fresh_score(email)
+            if cached is not None:
+                score = cached
+                print(Fore.CYAN + f"{email} — репутация из кэша: {score}")
 
             if score is None:
+                status = "ok"
                 try:
-                    score = _get_reputation_with_retry(driver, email)
+                    with webdriver_trace.email(email):
+                        score = backend.score(email, info)
                 except Exception as e:
-                    errf.write(f"{email} | EXC | {repr(e)}\n")
+                    status = "exception"
+                    info["error"] = repr(e)
                     score = None
 
-                if score is not None:
-                    save_rep_cache(email, score)
+                if score is not None or info.get("attempts"):
+                    writer.rep_put(rep_cache, email, score, attempts=info.get("attempts", 0),
+                                   error=info.get("error"))
+
+            if score is None and status == "ok":
+                status = "failed"
+            results.reputation(email, score, status, attempts=info.get("attempts", 0),
+                               error=info.get("error"), started_at=started_at)
 
             if score is None:
-                fail.write(email + "\n")
+                metrics.result("reputation", "failed", progress=metrics.reputation_progress)
+                if on_result:
+                    on_result({"stage": "reputation", "email": email, "score": None, "bucket": None})
                 continue
 
-            if score >= 71:
-                good.write(f"{email}:{score}\n")
-            elif score >= 31:
-                mid.write(f"{email}:{score}\n")
-            else:
-                bad.write(f"{email}:{score}\n")
+            bucket = reputation_bucket(score)
+            metrics.result("reputation", bucket, progress=metrics.reputation_progress)
+            if on_result:
+                on_result({"stage": "reputation", "email": email, "score": score, "bucket": bucket})
 
             print(Fore.GREEN + f"{email} — репутация {score}")
             time.sleep(1.5)
@@ -664,11 +3277,924 @@ def check_reputation(emails, out_dir: Path):
         print(Fore.YELLOW + "\nОстановка репутации по Ctrl+C...")
 
     finally:
-        good.close(); mid.close(); bad.close(); fail.close(); errf.close()
+        if own_writer:
+            writer.close()
+        else:
+            writer.flush()
+        if own_results:
+            finish_result_store(results, out_dir)
+        rep_cache.close()
+        backend.close()
+        print(Fore.CYAN + f"[probe] {rep_probe_summary()}")
+
+# ==========================
+# КОНВЕЙЕР: свободные email сразу уходят на репутацию (шаги 1 и 2 идут параллельно)
+# ==========================
+class ReputationFeed:
+    # Ограниченная очередь: если репутация не успевает, put() ждёт (back-pressure).
+    # Итерация отдаёт email, пока не закрыта очередь или не нажат Ctrl+C.
+    _DONE = object()
+
+    def __init__(self, maxsize=REP_QUEUE_SIZE):
+        self._q = queue.Queue(maxsize)
+        self.consumer_gone = Event()
+        self.dropped = 0
+        self._dropped_lock = Lock()   # put() зовут потоки всех доменов
+
+    def put(self, email) -> bool:
+        while not (stop_event.is_set() or self.consumer_gone.is_set()):
+            try:
+                self._q.put(email, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        with self._dropped_lock:
+            self.dropped += 1
+        return False
+
+    def close(self):
+        while not self.consumer_gone.is_set():
+            try:
+                self._q.put(self._DONE, timeout=0.5)
+                return
+            except queue.Full:
+                if stop_event.is_set():
+                    return
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self._q.get(timeout=0.5)
+            except queue.Empty:
+                if stop_event.is_set():
+                    return
+                continue
+            if item is self._DONE:
+                return
+            yield item
+
+def _reputation_worker(feed: ReputationFeed, out_dir: Path, kwargs: dict):
+    try:
+        check_reputation(feed, out_dir, **kwargs)
+    finally:
+        # если поток репутации упал — шаг 1 не должен зависнуть на полной очереди
+        feed.consumer_gone.set()
+
+def start_reputation_consumer(out_dir: Path, **kwargs):
+    # kwargs уходят в check_reputation (backend, rep_cache_path, writer, results, on_result)
+    feed = ReputationFeed()
+    t = Thread(target=_reputation_worker, args=(feed, out_dir, kwargs), name="reputation", daemon=True)
+    t.start()
+    return feed, t
+
+def join_thread(t: Thread):
+    # join короткими шагами, чтобы Ctrl+C в главном потоке продолжал работать
+    while t.is_alive():
         try:
-            driver.quit()
-        except:
+            t.join(0.5)
+        except KeyboardInterrupt:
+            stop_event.set()
+            print(Fore.YELLOW + "\nОстановка пользователем (Ctrl+C).")
+
+# ==========================
+# ЛОКАЛЬНЫЙ СТЕНД: имитация страницы регистрации и API (для бэкендов и бенчмарков)
+# ==========================
+FIXTURE_BUSY_MESSAGE = "This email address is not available for sign up, try something else"
+
+# Поле reg-userId внутри fieldset, как у Yahoo: на blur — XHR к /api/validate,
+# сообщение о занятости появляется в #reg-userId-error
+FIXTURE_SIGNUP_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Create account</title></head>
+<body>
+<form onsubmit="return false">
+  <fieldset>
+    <label for="reg-userId">Email address</label>
+    <input id="reg-userId" name="userId" type="text" autocomplete="off">
+    <p id="reg-userId-error" class="error-msg" style="display:none"></p>
+  </fieldset>
+  <fieldset><label>Password</label><input id="reg-password" type="password"></fieldset>
+</form>
+<script>
+var inp = document.getElementById('reg-userId');
+var err = document.getElementById('reg-userId-error');
+var seq = 0;
+inp.addEventListener('input', function () { err.style.display = 'none'; err.textContent = ''; });
+inp.addEventListener('blur', function () {
+  var my = ++seq, v = inp.value.trim();
+  if (!v) return;
+  var x = new XMLHttpRequest();
+  x.open('GET', '/api/validate?domain=__DOMAIN__&userId=' + encodeURIComponent(v));
+  x.onload = function () {
+    if (my !== seq || x.status !== 200) return;
+    var r = JSON.parse(x.responseText);
+    if (r.messages.length) { err.textContent = r.messages[0]; err.style.display = 'block'; }
+  };
+  x.send();
+});
+</script>
+</body></html>
+"""
+
+# Имитация Mailmeteor: форма email-reputation-checker-input, после submit появляется
+# [role='meter'] с aria-valuenow=0, потом настоящий рейтинг (или "Unable to check...").
+# Текст ошибки приходит с сервера, чтобы его не было в HTML страницы заранее.
+FIXTURE_REPUTATION_HTML = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Email reputation</title></head>
+<body>
+<form id="rep-form">
+  <input name="email-reputation-checker-input" type="email">
+  <button type="submit">Check</button>
+</form>
+<div id="result"></div>
+<script>
+document.getElementById('rep-form').addEventListener('submit', function (e) {
+  e.preventDefault();
+  var v = document.querySelector("[name='email-reputation-checker-input']").value;
+  var res = document.getElementById('result');
+  res.innerHTML = '<div role="meter" aria-valuemin="0" aria-valuemax="100" aria-valuenow="0">0</div>';
+  fetch('/api/reputation?email=' + encodeURIComponent(v))
+    .then(function (r) { return r.json(); })
+    .then(function (d) {
+      if (d.unable) { res.innerHTML = '<p class="error"></p>'; res.firstChild.textContent = d.message; return; }
+      var m = res.firstChild;
+      m.setAttribute('aria-valuenow', String(d.score));
+      m.textContent = d.score;
+    });
+});
+</script>
+</body></html>
+"""
+FIXTURE_UNABLE_MESSAGE = "Unable to check this email. Please try again."
+
+class FixtureServer:
+    # Детерминированный стенд: занятость логина и рейтинг email зависят только от хэша,
+    # так что любой бэкенд можно сверить с "правдой" (is_busy / score_for).
+    # Задержки — в секундах, *_fail_rate — доля сбоев (0..1), случайность с фиксированным seed.
+    def __init__(self, host="127.0.0.1", port=0, busy_ratio=0.5,
+                 page_delay=0.0, validate_delay=0.2, rep_delay=1.0,
+                 page_fail_rate=0.0, validate_fail_rate=0.0, unable_rate=0.0, reject_rate=0.0, seed=1):
+        self.host = host
+        self.port = port
+        self.busy_ratio = busy_ratio
+        self.page_delay = page_delay
+        self.validate_delay = validate_delay
+        self.rep_delay = rep_delay
+        self.page_fail_rate = page_fail_rate
+        self.validate_fail_rate = validate_fail_rate
+        self.unable_rate = unable_rate
+        self.reject_rate = reject_rate      # доля 429 (лимит) на /api/validate
+        self._rnd = random.Random(seed)
+        self._rnd_lock = Lock()
+        self._httpd = None
+        self._thread = None
+
+    def _fail(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._rnd_lock:
+            return self._rnd.random() < rate
+
+    @staticmethod
+    def _h(text: str) -> int:
+        return int(hashlib.md5(text.lower().encode("utf-8")).hexdigest()[:8], 16)
+
+    def is_busy(self, login: str) -> bool:
+        return self._h(login) % 1000 < self.busy_ratio * 1000
+
+    def score_for(self, email: str) -> int:
+        return self._h(email) % 100 + 1
+
+    def url(self, path: str) -> str:
+        return f"http://{self.host}:{self.port}{path}"
+
+    def _handle(self, req):
+        parts = urlsplit(req.path)
+        q = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        if parts.path.startswith("/signup/") or parts.path == "/reputation":
+            time.sleep(self.page_delay)
+            if self._fail(self.page_fail_rate):
+                return 503, "text/html", "<html><body>Service unavailable</body></html>"
+            if parts.path == "/reputation":
+                return 200, "text/html", FIXTURE_REPUTATION_HTML
+            domain = parts.path[len("/signup/"):]
+            return 200, "text/html", FIXTURE_SIGNUP_HTML.replace("__DOMAIN__", domain)
+        if parts.path == "/api/validate":
+            time.sleep(self.validate_delay)
+            if self._fail(self.validate_fail_rate):
+                return 500, "application/json", "{}"
+            if self._fail(self.reject_rate):
+                return 429, "application/json", json.dumps({"error": "too many requests"})
+            busy = self.is_busy(q.get("userId", ""))
+            return 200, "application/json", json.dumps({"messages": [FIXTURE_BUSY_MESSAGE] if busy else []})
+        if parts.path == "/api/reputation":
+            time.sleep(self.rep_delay)
+            if self._fail(self.unable_rate):
+                return 200, "application/json", json.dumps({"unable": True, "message": FIXTURE_UNABLE_MESSAGE})
+            return 200, "application/json", json.dumps({"score": self.score_for(q.get("email", ""))})
+        return 404, "text/plain", "not found"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive для HTTP-бэкендов
+            disable_nagle_algorithm = True  # иначе заголовки и тело ждут delayed ACK (~40 мс)
+
+            def do_GET(self):
+                code, ctype, body = server._handle(self)
+                data = body.encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", f"{ctype}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = Thread(target=self._httpd.serve_forever, name="fixture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+# ==========================
+# БЕНЧМАРКИ (python main.py --bench <имя>)
+# ==========================
+BENCHMARKS = {}
+
+def benchmark(name):
+    def deco(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return deco
+
+@benchmark("planner")
+def bench_planner(args):
+    # Синтетика: в кэше yahoo-ключ каждого 2-го логина и aol-ключ каждого 3-го.
+    # Старый вариант (список fully_cached + `in` по списку) — O(n²), гоняем только на малых n.
+    sizes = args.sizes or [10_000, 100_000, 1_000_000, 10_000_000]
+    legacy_max = 20_000
+
+    def legacy(logins, cache):
+        def fully(login):
+            return all(f"{login}@{dom}" in cache for dom in SUPPORTED_DOMAINS)
+        fully_cached = [lg for lg in logins if fully(lg)]
+        rest = [lg for lg in logins if lg not in fully_cached]
+        return {dom: [lg for lg in rest if f"{lg}@{dom}" not in cache] for dom in SUPPORTED_DOMAINS}
+
+    print(f"{'n':>11} | {'planner, s':>10} | {'ns/логин':>8} | {'старый, s':>9}")
+    for n in sizes:
+        logins = [f"user{i:08d}" for i in range(n)]
+        cache = {f"{lg}@yahoo.com" for lg in logins[::2]}
+        cache.update(f"{lg}@aol.com" for lg in logins[::3])
+
+        t0 = time.perf_counter()
+        planner = WorkPlanner(cache)
+        for chunk in iter_batches(planner.iter_work(logins), DEFAULT_BATCH_SIZE):
+            planner.plan_batch(chunk)
+        dt = time.perf_counter() - t0
+
+        old = "-"
+        if n <= legacy_max:
+            t0 = time.perf_counter()
+            legacy(logins, cache)
+            old = f"{time.perf_counter() - t0:.3f}"
+
+        print(f"{n:>11} | {dt:>10.3f} | {dt / n * 1e9:>8.0f} | {old:>9}")
+        print(f"{'':>11}   {planner.report()}")
+        del logins, cache
+
+@benchmark("index")
+def bench_index(args):
+    # Кэш доступности в памяти: set строк (как было до SQLite) против HashIndex/BloomIndex,
+    # и `in` у AvailCache без индекса и с ним. В кэше n email, запросы — попадания и промахи.
+    sizes = args.sizes or [100_000, 1_000_000]
+    print(f"{'n':>10} | {'вариант':<18} | {'построение, s':>13} | {'байт/запись':>11} | "
+          f"{'ns попадание':>12} | {'ns промах':>9} | ошибки")
+    for n in sizes:
+        with tempfile.TemporaryDirectory(prefix="bench_index_") as tmp:
+            cache = AvailCache(str(Path(tmp) / "checked_cache.db"))
+            t0 = time.perf_counter()
+            for chunk in iter_batches(_bench_emails(0, n), 50000):
+                cache._import_rows([(e, "busy", None) for e in chunk])
+            sqlite_build = time.perf_counter() - t0
+
+            for label, build in (("set строк", lambda: set(_bench_emails(0, n))),
+                                 ("HashIndex", lambda: _filled(HashIndex(n), _bench_emails(0, n))),
+                                 ("BloomIndex", lambda: _filled(BloomIndex(n), _bench_emails(0, n)))):
+                t0 = time.perf_counter()
+                build()
+                built = time.perf_counter() - t0
+                tracemalloc.start()
+                try:
+                    obj = build()
+                    mem = tracemalloc.get_traced_memory()[0]
+                finally:
+                    tracemalloc.stop()
+                _index_line(n, label, built, f"{mem / n:>11.1f}", obj)
+                del obj
+
+            _index_line(n, "AvailCache SQLite", sqlite_build,
+                        f"{os.path.getsize(cache.path) / n:>8.1f} ФС", cache)
+            for kind in ("hash", "bloom"):
+                t0 = time.perf_counter()
+                mem = cache.load_index(kind)
+                _index_line(n, f"AvailCache+{kind}", time.perf_counter() - t0, f"{mem / n:>11.1f}", cache)
+            cache.close()
+
+def _bench_emails(lo, hi):
+    for i in range(lo, hi):
+        yield f"user{i // 2:08d}@{'yahoo.com' if i % 2 else 'aol.com'}"
+
+def _filled(index, items):
+    for item in items:
+        index.add(item)
+    return index
+
+def _index_line(n, label, built, mem_label, container, probes=100_000):
+    # строки запросов свежие, как в планировщике (login + suffix): хэш ещё не посчитан
+    hit = list(itertools.islice(_bench_emails(0, n), 0, None, max(1, n // probes)))
+    miss = list(_bench_emails(n, n + len(hit)))
+    t0 = time.perf_counter()
+    found = sum(1 for e in hit if e in container)
+    t1 = time.perf_counter()
+    false_pos = sum(1 for e in miss if e in container)
+    t2 = time.perf_counter()
+    wrong = []
+    if found < len(hit):
+        wrong.append(f"не найдено {len(hit) - found}")
+    if false_pos:
+        wrong.append(f"ложных «есть» {false_pos}")
+    print(f"{n:>10} | {label:<18} | {built:>13.2f} | {mem_label} | {(t1 - t0) / len(hit) * 1e9:>12.0f} | "
+          f"{(t2 - t1) / len(miss) * 1e9:>9.0f} | {', '.join(wrong) or 'нет'}")
+
+# Реальные тексты под полем логина Yahoo/AOL (занят / не занят / прочие подсказки)
+BUSY_BENCH_CORPUS = [
+    "This email address is not available for sign up, try something else",
+    "Email not available. Try entering a different one.",
+    "That email address is not available. Try something else.",
+    "This email address is already taken",
+    "Ce nom d'utilisateur est déjà utilisée",
+    "Diese E-Mail-Adresse ist nicht verfügbar",
+    "Этот адрес электронной почты уже занят",
+    "Enter a valid email address",
+    "Email address must be at least 4 characters long",
+    "Email address can only contain letters, numbers, periods (‘.’), and underscores (‘_’).",
+    "Email address must start with a letter",
+    "Please enter a valid name",
+    "@yahoo.com",
+    "Create a Yahoo account",
+    "Password",
+    "Show password",
+    "",
+]
+
+@benchmark("classifier")
+def bench_classifier(args):
+    # Старый вариант: списки фраз создаются на каждый вызов + линейный `in` по каждой
+    def legacy(txt):
+        if not txt:
+            return False
+        t = txt.lower()
+        busy_phrases = list(BUSY_PACKS["en"][:8])
+        busy_keywords = list(BUSY_PACKS["en"][8:]) + BUSY_PACKS["ru"] + BUSY_PACKS["fr"] + BUSY_PACKS["de"]
+        return any(p in t for p in busy_phrases) or any(k in t for k in busy_keywords)
+
+    clf = BusyClassifier.load()
+    for txt in BUSY_BENCH_CORPUS:
+        hit = clf.match(txt, "yahoo.com")
+        mark = "≠ старый!" if bool(hit) != legacy(txt) else ""
+        print(f"  {str(hit):<40} {txt[:60]!r} {mark}")
+
+    for n in args.sizes or [100_000, 1_000_000]:
+        corpus = (BUSY_BENCH_CORPUS * (n // len(BUSY_BENCH_CORPUS) + 1))[:n]
+        t0 = time.perf_counter()
+        for txt in corpus:
+            legacy(txt)
+        old = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for txt in corpus:
+            clf.match(txt, "yahoo.com")
+        new = time.perf_counter() - t0
+        print(f"{n:>10} вызовов | старый {old / n * 1e9:>6.0f} ns | новый {new / n * 1e9:>6.0f} ns")
+
+@benchmark("backends")
+def bench_backends(args):
+    # Все бэкенды доступности и репутации против локального стенда: скорость и точность
+    n = (args.sizes or [100])[0]
+    domain = "yahoo.com"
+    server = FixtureServer().start()
+    logins = [f"bench.user{i:05d}" for i in range(n)]
+    try:
+        avail = {
+            "selenium": lambda: SeleniumAvailabilityBackend(domain, url=server.url(f"/signup/{domain}")),
+            "http": lambda: HttpAvailabilityBackend(domain, url=server.url("/api/validate")),
+        }
+        print(f"стенд {server.url('/')}, логинов: {n}")
+        for name, factory in avail.items():
+            try:
+                backend = factory()
+                backend.open()
+            except Exception as e:
+                print(f"  availability/{name:<8} недоступен: {e!r}")
+                continue
+            ok = 0
+            t0 = time.perf_counter()
+            try:
+                for login in logins:
+                    status, _ = backend.check(login)
+                    ok += (status == "busy") == server.is_busy(login)
+            finally:
+                dt = time.perf_counter() - t0
+                backend.close()
+            print(f"  availability/{name:<8} {n / dt:>8.1f} проверок/с, совпало со стендом {ok}/{n}")
+
+        emails = [f"{lg}@{domain}" for lg in logins]
+        backend = HttpReputationBackend(url=server.url("/api/reputation"))
+        ok = 0
+        t0 = time.perf_counter()
+        for email in emails:
+            ok += backend.score(email) == server.score_for(email)
+        dt = time.perf_counter() - t0
+        backend.close()
+        print(f"  reputation/http      {n / dt:>8.1f} проверок/с, совпало со стендом {ok}/{n}")
+    finally:
+        browser_pool.close_all()
+        server.stop()
+
+class _Measured:
+    # Обёртка бэкенда для бенчмарка: латентность каждой проверки и число перезапусков
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+        self.latencies = []
+        self.starts = []
+        self.restarts = 0
+
+    def __getattr__(self, item):
+        return getattr(self.inner, item)
+
+    def _timed(self, fn, *a, **kw):
+        t0 = time.perf_counter()
+        self.starts.append(t0)
+        try:
+            return fn(*a, **kw)
+        finally:
+            self.latencies.append(time.perf_counter() - t0)
+
+    def check(self, login):
+        return self._timed(self.inner.check, login)
+
+    def score(self, email, info=None):
+        return self._timed(self.inner.score, email, info)
+
+    def restart(self):
+        self.restarts += 1
+        return self.inner.restart()
+
+def _latency_line(label, m: _Measured, wall: float) -> str:
+    n = len(m.latencies)
+    if not n:
+        return f"  {label:<24} проверок не было"
+    p50, p95, p99 = (percentile(m.latencies, p) for p in (0.50, 0.95, 0.99))
+    return (f"  {label:<24} {n:>5} шт | {n / wall:>6.2f} email/с | "
+            f"p50 {p50:.2f}s p95 {p95:.2f}s p99 {p99:.2f}s | перезапусков {m.restarts}")
+
+@benchmark("e2e")
+def bench_e2e(args):
+    # Весь конвейер (process_domain + check_reputation) против локального стенда,
+    # с текущими AVAIL_*/REP_* — чтобы настраивать их по цифрам, а не наугад.
+    n = (args.sizes or [30])[0]
+    domain = "yahoo.com"
+    server = FixtureServer(**args.fixture).start()
+    out_dir = Path(tempfile.mkdtemp(prefix="bench_e2e_"))
+    print(f"стенд {server.url('/')} {args.fixture or ''}, логинов: {n}, результаты: {out_dir}")
+
+    if args.backend == "http":
+        avail = HttpAvailabilityBackend(domain, url=server.url("/api/validate"))
+        rep = HttpReputationBackend(url=server.url("/api/reputation"))
+    else:
+        avail = SeleniumAvailabilityBackend(domain, url=server.url(f"/signup/{domain}"))
+        rep = SeleniumReputationBackend(url=server.url("/reputation"))
+    avail, rep = _Measured(avail), _Measured(rep)
+
+    checked_cache = AvailCache(str(out_dir / "checked_cache.db"))
+    writer = ResultWriter().start()
+    writer.attach(checked_cache)
+    if WEBDRIVER_TRACE:
+        webdriver_trace.start(out_dir / "webdriver_trace.jsonl")
+    launches_before = len(driver_launch_times)
+    logins = [f"bench.user{i:05d}" for i in range(n)]
+    t0 = time.perf_counter()
+    results = open_result_store(out_dir, writer)
+    feed, rep_thread = start_reputation_consumer(
+        out_dir, backend=rep, rep_cache_path=str(out_dir / "reputation_cache.db"), writer=writer,
+        results=results)
+    try:
+        process_domain(domain, logins, checked_cache, Lock(), results, {}, Lock(),
+                       on_free=feed.put, backend=avail)
+        avail_wall = time.perf_counter() - t0
+    finally:
+        feed.close()
+        join_thread(rep_thread)
+        writer.close()
+        finish_result_store(results, out_dir)
+        total_wall = time.perf_counter() - t0
+        browser_pool.close_all()
+        server.stop()
+
+    def status(lg):
+        hit = checked_cache.get(f"{lg}@{domain}")
+        return hit[0] if hit else None
+
+    wrong = sum(1 for lg in logins if (status(lg) == "busy") != server.is_busy(lg))
+    checked_cache.close()
+    print(_latency_line(f"availability/{avail.name}", avail, avail_wall))
+    print(_latency_line(f"reputation/{rep.name}", rep, total_wall))
+    print(f"  всего {total_wall:.1f}s, запусков браузера {len(driver_launch_times) - launches_before}, "
+          f"расхождений со стендом по занятости: {wrong}")
+    if webdriver_trace.enabled:
+        webdriver_trace.close()
+        print("  WebDriver: " + "\n".join(webdriver_trace.report()))
+
+def _max_rate(starts, window=1.0) -> int:
+    # наибольшее число проверок, начатых в одном окне window секунд
+    starts = sorted(starts)
+    best = lo = 0
+    for hi, t in enumerate(starts):
+        while t - starts[lo] >= window:
+            lo += 1
+        best = max(best, hi - lo + 1)
+    return best
+
+@benchmark("scheduler")
+def bench_scheduler(args):
+    # Домены по очереди и параллельно против стенда (http-бэкенды) с текущими DOMAIN_RATE_LIMITS.
+    # Заодно сверка общих структур после параллельной работы: кэш, результаты (через writer
+    # и напрямую), журнал выполненного, потолок частоты на каждый домен.
+    n = (args.sizes or [20])[0]
+    server = FixtureServer(**args.fixture).start()
+    logins = [f"sched.user{i:05d}" for i in range(n)]
+    limits = ", ".join(f"{d} {DOMAIN_RATE_LIMITS.get(d, 0):g}/с" for d in SUPPORTED_DOMAINS)
+    print(f"стенд {server.url('/')} {args.fixture or ''}, логинов: {n}, потолок: {limits}, "
+          f"burst {DOMAIN_RATE_BURST}")
+    print(f"{'режим':<24} | {'время, s':>8} | {'email/с':>7} | {'макс/с по доменам':<22} | расхождения")
+    try:
+        for label, parallel, with_writer in (("по очереди", False, True), ("параллельно", True, True),
+                                             ("параллельно, без writer", True, False)):
+            out_dir = Path(tempfile.mkdtemp(prefix="bench_sched_"))
+            checked_cache = AvailCache(str(out_dir / "checked_cache.db"))
+            writer = ResultWriter().start() if with_writer else None
+            if writer:
+                writer.attach(checked_cache)
+            results = open_result_store(out_dir, writer, kind="jsonl")
+            backends = {d: _Measured(HttpAvailabilityBackend(d, url=server.url("/api/validate")))
+                        for d in SUPPORTED_DOMAINS}
+            limiters = {d: TokenBucket(DOMAIN_RATE_LIMITS.get(d, 0)) for d in SUPPORTED_DOMAINS}
+            done_map = {}
+            t0 = time.perf_counter()
+            try:
+                process_domains({d: logins for d in SUPPORTED_DOMAINS}, checked_cache, Lock(), results,
+                                done_map, Lock(), backends=backends, limiters=limiters, parallel=parallel)
+                wall = time.perf_counter() - t0
+            finally:
+                if writer:
+                    writer.close()
+                results.close()
+                checked_cache.flush()
+
+            problems = []
+            emails = [f"{lg}@{d}" for d in SUPPORTED_DOMAINS for lg in logins]
+            wrong = sum(1 for e in emails
+                        if ((checked_cache.get(e) or ("?",))[0] == "busy") != server.is_busy(e.split("@")[0]))
+            if wrong:
+                problems.append(f"кэш {wrong}")
+            if len(checked_cache) != len(emails):
+                problems.append(f"записей в кэше {len(checked_cache)}/{len(emails)}")
+            rows = [r["email"] for r in results.iter_rows("availability")]
+            if len(rows) != len(emails) or set(rows) != set(emails):
+                problems.append(f"строк результатов {len(rows)} (уникальных {len(set(rows))})/{len(emails)}")
+            not_done = n - len(get_fully_done_logins(done_map))
+            if not_done:
+                problems.append(f"не завершены {not_done}")
+            rates = []
+            for d in SUPPORTED_DOMAINS:
+                peak = _max_rate(backends[d].starts)
+                rates.append(str(peak))
+                cap = DOMAIN_RATE_LIMITS.get(d, 0)
+                if cap > 0 and peak > cap + DOMAIN_RATE_BURST:
+                    problems.append(f"{d} {peak}/с > {cap:g}/с")
+            checked_cache.close()
+            print(f"{label:<24} | {wall:>8.1f} | {len(emails) / wall:>7.2f} | {' / '.join(rates):<22} | "
+                  f"{', '.join(problems) or 'нет'}")
+    finally:
+        server.stop()
+
+@benchmark("startup")
+def bench_startup(args):
+    # Время запуска отдельным процессом: импорт main.py и --report по кэшу, где все email уже есть,
+    # с ленивыми импортами и с принудительной загрузкой selenium/colorama (как было раньше).
+    n = (args.sizes or [1000])[0]
+    repeat = 5
+    here = os.path.dirname(os.path.abspath(__file__))
+    eager = "main._load_selenium(); main._load_colorama(); "
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as tmp:
+        tmp = Path(tmp)
+        emails = [f"start.user{i:06d}@{'yahoo.com' if i % 2 else 'aol.com'}" for i in range(n)]
+        (tmp / MAILS_FILE_DEFAULT).write_text("\n".join(emails) + "\n", encoding="utf-8")
+        cache = AvailCache(str(tmp / CACHE_AVAIL_DB))
+        cache.add_many((e, "free" if i % 3 else "busy", None) for i, e in enumerate(emails))
+        cache.migrate_keys()
+        cache.close()
+        rep_cache = RepCache(str(tmp / CACHE_REP_DB))
+        rep_cache.put_many((e, 80, 1, None, None) for e in emails[::3])
+        rep_cache.migrate_keys()
+        rep_cache.close()
+
+        report = f"main.cli(['--report', {MAILS_FILE_DEFAULT!r}, '--out', 'report.csv'])"
+        variants = [
+            ("import main", ""),
+            ("import main + selenium", eager),
+            (f"--report ({n} email)", report),
+            ("--report + selenium", eager + report),
+        ]
+        print(f"{'вариант':<28} | {'медиана, s':>10} | {'мин, s':>7}")
+        for label, code in variants:
+            cmd = [sys.executable, "-c", f"import sys; sys.path.insert(0, {here!r}); import main; {code}"]
+            times = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                proc = subprocess.run(cmd, cwd=tmp, capture_output=True, text=True)
+                times.append(time.perf_counter() - t0)
+                if proc.returncode:
+                    break
+            if proc.returncode:
+                err = (proc.stderr.strip().splitlines() or ["?"])[-1]
+                print(f"{label:<28} | {'-':>10} | {'-':>7} | {err}")
+                continue
+            print(f"{label:<28} | {percentile(times, 0.5):>10.3f} | {min(times):>7.3f}")
+
+def _process_tree_rss(pid):
+    # RSS chromedriver + все процессы Chrome под ним (нужен psutil)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+    except psutil.Error:
+        return None
+    total = 0
+    for p in procs:
+        try:
+            total += p.memory_info().rss
+        except psutil.Error:
             pass
+    return total
+
+@benchmark("profile")
+def bench_profile(args):
+    # Сравнение профилей "full" и "lean": время готовности страницы и память браузера
+    pages = [*SUPPORTED_DOMAINS.values(), REPUTATION_URL]
+    repeat = 3
+    print(f"{'профиль':>8} | {'страница':<45} | {'ready, s':>8} | {'RSS, MB':>8}")
+    for profile in ("full", "lean"):
+        driver = make_driver(profile)
+        try:
+            for url in pages:
+                times = []
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    driver.get(url)
+                    while driver.execute_script("return document.readyState") != "complete":
+                        time.sleep(0.05)
+                    times.append(time.perf_counter() - t0)
+                rss = _process_tree_rss(driver.service.process.pid)
+                rss_txt = f"{rss / 2**20:.0f}" if rss is not None else "n/a"
+                print(f"{profile:>8} | {url[:45]:<45} | {sorted(times)[len(times) // 2]:>8.2f} | {rss_txt:>8}")
+        finally:
+            driver.quit()
+    print("RSS = chromedriver + все процессы Chrome (n/a — не установлен psutil)")
+
+def _write_syscalls():
+    # число системных вызовов записи процесса (все потоки): psutil или /proc/self/io (Linux)
+    try:
+        import psutil
+        return psutil.Process().io_counters().write_count
+    except (ImportError, AttributeError):
+        pass
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("syscw:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+@benchmark("writer")
+def bench_writer(args):
+    # K потоков отдают результаты как можно быстрее: на каждый — строка в файл результатов,
+    # запись в кэш доступности, на каждый 3-й — запись в кэш репутации.
+    # Старый вариант: open/append/close строки под общим локом (save_cache_line) и commit на
+    # каждую репутацию. Считаем время ожидания лока/очереди и вызовы записи на диск: измеряем
+    # (psutil / /proc/self/io), а если нечем — оцениваем по счётчикам (помечено "оценка").
+    threads = 4
+    for n in args.sizes or [20_000, 100_000]:
+        per_thread = n // threads
+        for variant in ("старый", "writer"):
+            tmp = Path(tempfile.mkdtemp(prefix="bench_writer_"))
+            avail = AvailCache(str(tmp / "checked_cache.db"))
+            rep_cache = RepCache(str(tmp / "reputation_cache.db"))
+            lock = Lock()
+            waits = [0.0] * threads
+            syscalls = [0] * threads
+
+            if variant == "writer":
+                writer = ResultWriter().start()
+                writer.attach(avail)
+                out = writer.open(tmp / "busy.txt")
+
+            def worker(k):
+                for i in range(per_thread):
+                    email = f"user{k}_{i}@yahoo.com"
+                    if variant == "старый":
+                        t0 = time.perf_counter()
+                        with lock:
+                            waits[k] += time.perf_counter() - t0
+                            with open(tmp / "busy.txt", "a", encoding="utf-8") as f:
+                                f.write(email + "\n")
+                            syscalls[k] += 3       # оценка: open + write + close
+                            avail.add(email, "busy")
+                            if i % 3 == 0:
+                                rep_cache.put(email, 50)
+                                syscalls[k] += 1   # оценка: commit
+                    else:
+                        out.write(email + "\n")
+                        avail.add(email, "busy")
+                        if i % 3 == 0:
+                            writer.rep_put(rep_cache, email, 50)
+
+            sys0 = _write_syscalls()
+            t0 = time.perf_counter()
+            pool = [Thread(target=worker, args=(k,)) for k in range(threads)]
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+            if variant == "writer":
+                out.close()
+                writer.close()
+                wait, calls = writer.stats["put_wait"], (
+                    writer.stats["writes"] + writer.stats["commits"] + writer.stats["fsyncs"])
+            else:
+                wait, calls = sum(waits), sum(syscalls)
+            avail.close()
+            wall = time.perf_counter() - t0
+            sys1 = _write_syscalls()
+            rep_cache.close()
+            if sys0 is not None and sys1 is not None:
+                calls_txt = f"write() {sys1 - sys0:>7}"
+            else:
+                calls_txt = f"вызовов записи {calls:>7} (оценка)"
+            print(f"{n:>8} | {variant:>7} | {wall:>6.2f}s | {n / wall:>9.0f} зап/с | "
+                  f"ожидание лока/очереди {wait:>6.2f}s | {calls_txt}")
+
+@benchmark("results")
+def bench_results(args):
+    # Типичная обработка после запуска: "свободные email с рейтингом и паролем".
+    # Старый вариант — разобрать available.txt и три reputation_*.txt и склеить по email;
+    # новый — один запрос к results.db. Плюс скорость выгрузки старых txt из хранилища.
+    for n in args.sizes or [100_000, 1_000_000]:
+        tmp = Path(tempfile.mkdtemp(prefix="bench_results_"))
+        store = SqliteResultStore(tmp / SqliteResultStore.filename)
+        now = time.time()
+        rows = []
+        for i in range(n):
+            email = f"user{i}@yahoo.com"
+            free = i % 3 == 0
+            rows.append({"email": email, "stage": "availability", "status": "free" if free else "busy",
+                         "score": None, "bucket": None, "password": "x" * PASSWORD_LENGTH if free else None,
+                         "attempts": 1, "error": None, "started_at": now, "finished_at": now})
+            if free:
+                score = i % 101
+                rows.append({"email": email, "stage": "reputation", "status": "ok", "score": score,
+                             "bucket": reputation_bucket(score), "password": None, "attempts": 1,
+                             "error": None, "started_at": now, "finished_at": now})
+        for chunk in iter_batches(iter(rows), 50000):
+            store.add_many(chunk)
+
+        t0 = time.perf_counter()
+        export_legacy_txt(store, tmp)
+        export_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        passwords = {}
+        for line in iter_lines(tmp / "available.txt"):
+            email, pwd = line.split(":", 1)
+            passwords[email] = pwd
+        legacy = []
+        for name in ("reputation_good.txt", "reputation_medium.txt", "reputation_bad.txt"):
+            for line in iter_lines(tmp / name):
+                email, score = line.rsplit(":", 1)
+                if email in passwords:
+                    legacy.append((email, passwords[email], int(score)))
+        legacy_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        joined = store._conn.execute(
+            "SELECT a.email, a.password, r.score FROM results a "
+            "JOIN results r ON r.email = a.email AND r.stage = 'reputation' "
+            "WHERE a.stage = 'availability' AND a.status = 'free' AND r.score IS NOT NULL"
+        ).fetchall()
+        store_time = time.perf_counter() - t0
+        store.close()
+        assert len(joined) == len(legacy)
+        print(f"{n:>9} email | выгрузка txt {export_time:>6.2f}s | склейка: txt {legacy_time:>6.2f}s, "
+              f"results.db {store_time:>6.2f}s")
+
+def _replay_availability(r, window):
+    # -> (ответ адаптивного режима, ожидание fixed, ожидание adaptive) — те же правила,
+    # что в _wait_validation. Ожидание без записанного elapsed оценивается по окнам.
+    latency, status, fixed = r["latency"], r["status"], r["fixed"]
+    if r.get("replied"):
+        # ответ валидации пришёл: ожидание кончается по нему (+ затишье), окно не участвует
+        waited = r.get("elapsed") or (latency if latency is not None else fixed)
+        return status, waited, waited
+    if status == "unknown" or window >= fixed:
+        return status, fixed, fixed
+    if latency is not None and latency <= window:
+        # сообщение успело в сокращённое окно: решение по его концу
+        return "busy", fixed, window
+    # censored: окно кончилось без ответа — дожидаемся фиксированного, ответ как у эталона
+    return status, fixed, fixed
+
+@benchmark("adaptive")
+def bench_adaptive(args):
+    # Replay: записи validation_timings.jsonl из запусков с фиксированными окнами (эталон)
+    # прогоняются через адаптивную политику по тем же правилам, что и живая проверка
+    # (_replay_availability). Расхождение — адаптивный режим ответил бы иначе, чем эталон.
+    if args.replay:
+        records = []
+        for path in args.replay:
+            with open(path, "r", encoding="utf-8") as f:
+                records += [json.loads(line) for line in f if line.strip()]
+        records = [r for r in records if r["window"] >= r["fixed"]]
+    else:
+        # синтетика: 60% логинов заняты, ответ приходит через ~0.3с с редким "хвостом"
+        # (сообщение "занят" — вместе с ним); в 5% проверок запрос валидации не замечен
+        rnd = random.Random(1)
+        fixed = AVAIL_AFTER_INPUT_DELAY + AVAIL_STABLE_OK_SECONDS
+        settle = AVAIL_EVENT_SETTLE_MS / 1000
+        records = []
+        domains = list(SUPPORTED_DOMAINS)
+        for i in range((args.sizes or [5000])[0]):
+            busy = rnd.random() < 0.6
+            reply_at = min(rnd.lognormvariate(-1.2, 0.4), fixed)
+            replied = rnd.random() >= 0.05
+            records.append({"key": domains[i % len(domains)], "latency": reply_at if busy else None,
+                            "status": "busy" if busy else "free", "fixed": fixed, "replied": replied,
+                            "elapsed": reply_at + settle if replied else None})
+    if not records:
+        print("Нет записей с фиксированным окном")
+        return
+
+    policy = AdaptiveWindows(enabled=True)
+    stats = {}
+    for r in records:
+        key, latency, status, fixed = r["key"], r["latency"], r["status"], r["fixed"]
+        window = policy.window(key, fixed)
+        seen = latency is not None and latency <= window
+        censored = False
+        if key == "reputation":
+            replayed = "unknown" if status == "unknown" else (
+                status if latency is None or seen else "changed")
+            fixed_wait, wait = fixed, window
+        else:
+            replayed, fixed_wait, wait = _replay_availability(r, window)
+            censored = replayed != "unknown" and not r.get("replied") and not seen and window < fixed
+        st = stats.setdefault(key, {"n": 0, "same": 0, "fixed_wait": 0.0, "adaptive_wait": 0.0})
+        st["n"] += 1
+        st["same"] += replayed == status
+        st["fixed_wait"] += fixed_wait
+        st["adaptive_wait"] += wait
+        observed = latency if key != "reputation" or seen else None
+        policy.observe(key, observed, replayed, window, fixed, censored=censored)
+
+    print(f"{'ключ':<12} | {'n':>6} | {'совпало':>8} | {'ожидание fixed':>14} | {'adaptive':>9}")
+    for key, st in sorted(stats.items()):
+        print(f"{key:<12} | {st['n']:>6} | {st['same'] / st['n']:>7.2%} | "
+              f"{st['fixed_wait'] / st['n']:>13.2f}s | {st['adaptive_wait'] / st['n']:>8.2f}s")
+    print(f"Окна: {policy.summary()}")
 
 # ==========================
 # MAIN
@@ -679,13 +4205,66 @@ def main():
     out_dir.mkdir(exist_ok=True)
     print(Fore.CYAN + f"[RESULTS] {out_dir}")
 
-    checked_cache = load_cache_set(CACHE_AVAIL)
+    with open_session(out_dir) as (checked_cache, writer):
+        _run(out_dir, checked_cache, writer)
+
+@contextmanager
+def open_session(out_dir: Path):
+    # общие для запуска (или всего сервиса) кэш доступности, поток записи, метрики, окна
+    checked_cache = AvailCache(CACHE_AVAIL_DB)
+    imported = checked_cache.import_txt(CACHE_AVAIL)
+    if imported:
+        print(Fore.CYAN + f"[CACHE availability] импортировано из {CACHE_AVAIL}: {imported}")
+    migrated = checked_cache.migrate_keys(force=bool(imported))
+    if migrated:
+        print(Fore.CYAN + f"[CACHE availability] ключей приведено к каноническому виду: {migrated}")
     print(Fore.CYAN + f"[CACHE availability] {len(checked_cache)}")
-
+    if CACHE_INDEX:
+        t0 = time.time()
+        size = checked_cache.load_index(CACHE_INDEX)
+        print(Fore.CYAN + f"[CACHE availability] индекс {CACHE_INDEX}: {size / 2**20:.1f} MB, "
+                          f"{time.time() - t0:.1f}s")
+
+    loaded = adaptive.load()
+    mode = "адаптивные" if adaptive.enabled else "фиксированные"
+    print(Fore.CYAN + f"[windows] {mode} окна, замеров загружено: {loaded}")
+    if ADAPTIVE_RECORD:
+        adaptive.record_to(out_dir / "validation_timings.jsonl")
+
+    writer = ResultWriter().start()
+    writer.attach(checked_cache)
+    reporter = MetricsReporter(out_dir).start()
+    if WEBDRIVER_TRACE:
+        webdriver_trace.start(out_dir / "webdriver_trace.jsonl")
+        print(Fore.CYAN + f"[trace] команды WebDriver -> {out_dir / 'webdriver_trace.jsonl'}")
+    try:
+        yield checked_cache, writer
+    finally:
+        writer.close()
+        print(Fore.CYAN + f"[writer] {writer.summary()}")
+        if checked_cache.free_ratio() >= CACHE_AVAIL_VACUUM_RATIO:
+            print(Fore.YELLOW + f"[CACHE availability] в {CACHE_AVAIL_DB} много пустого места — "
+                                f"python main.py --compact-cache")
+        checked_cache.close()
+        browser_pool.close_all()
+        reporter.stop()
+        adaptive.close()
+        adaptive.save()
+        print(Fore.CYAN + f"[windows] {adaptive.summary()}")
+        print(Fore.CYAN + f"[metrics] {out_dir / 'metrics.json'} | {metrics.progress_line()}")
+        print(Fore.CYAN + f"[driver] {driver_launch_summary()}")
+        print(Fore.CYAN + f"[pool] {browser_pool.summary()}")
+        print(Fore.CYAN + f"[rate] {rate_limit_summary()}")
+        if webdriver_trace.enabled:
+            webdriver_trace.close()
+            for line in webdriver_trace.report():
+                print(Fore.CYAN + f"[trace] {line}")
+
+def _run(out_dir: Path, checked_cache: AvailCache, writer: ResultWriter):
     mails_file = input(f"Файл email ({MAILS_FILE_DEFAULT}): ").strip() or MAILS_FILE_DEFAULT
-    raw_emails = load_lines(mails_file)
 
-    if not raw_emails:
+    first, _ = peek(iter_lines(mails_file))
+    if first is None:
         print(Fore.RED + f"Файл {mails_file} пустой или отсутствует")
         return
     # ==========================
@@ -701,106 +4280,574 @@ def main():
         print("Неверный выбор")
         return
 
-    # ===== ТОЛЬКО РЕПУТАЦІЯ =====
-    if mode == "2":
-        emails = [e for e in raw_emails if "@" in e]
+    limit, batch = 0, DEFAULT_BATCH_SIZE
+    if mode == "1":
+        # есть ли вообще yahoo/aol — выяснит run_job (без отдельного прохода по файлу)
+        limit = int(input("Сколько логинов проверить? (0 = все): ") or "0")
+        batch = int(input(f"Размер пакета ({DEFAULT_BATCH_SIZE}): ") or DEFAULT_BATCH_SIZE)
 
-        if not emails:
-            print(Fore.RED + "Нет валидных email для проверки репутации")
-            return
+    run_job(mails_file, out_dir, checked_cache, writer, mode, limit, batch)
+
+def run_job(mails_file, out_dir: Path, checked_cache: AvailCache, writer: ResultWriter,
+            mode: str, limit: int = 0, batch: int = DEFAULT_BATCH_SIZE,
+            on_result=None, track_progress: bool = True, resume: bool = INPUT_JOURNAL):
+    # Без вопросов: всё, что раньше спрашивал main(), приходит параметрами (CLI и сервис).
+    # track_progress=False — в сервисе задания идут параллельно, общий ETA не считаем.
+    # resume — вести журнал входного файла и продолжать с места прошлой остановки.
 
-        print(Fore.CYAN + f"Проверка ТОЛЬКО репутации ({len(emails)})")
-        check_reputation(emails, out_dir)
+    # ===== ТОЛЬКО РЕПУТАЦІЯ =====
+    if mode == "2":
+        dedup = {}
+        emails = iter_unique(iter_emails(mails_file), dedup)
+        # счётный проход (ради ETA) — как и план в режиме 1, только для файлов до INPUT_SURVEY_MAX_MB
+        try:
+            survey = os.path.getsize(mails_file) <= INPUT_SURVEY_MAX_MB * 2**20
+        except OSError:
+            survey = False
+        if survey:
+            total = sum(1 for _ in emails)
+            if dedup:
+                print(Fore.CYAN + f"[DEDUP] повторов после канонизации: {dedup['duplicates']} — не проверяются")
+            if not total:
+                print(Fore.RED + "Нет валидных email для проверки репутации")
+                return
+            print(Fore.CYAN + f"Проверка ТОЛЬКО репутации ({total})")
+            if track_progress:
+                metrics.total = total
+            emails = iter_unique(iter_emails(mails_file))
+        else:
+            first, emails = peek(emails)
+            if first is None:
+                print(Fore.RED + "Нет валидных email для проверки репутации")
+                return
+            print(Fore.CYAN + f"[PLAN] файл больше {INPUT_SURVEY_MAX_MB:g} МБ — email не считаются заранее")
+            print(Fore.CYAN + "Проверка ТОЛЬКО репутации")
+        if track_progress:
+            metrics.reputation_progress = True
+        check_reputation(emails, out_dir, writer=writer, on_result=on_result)
+        if not survey and dedup:
+            print(Fore.CYAN + f"[DEDUP] повторов после канонизации: {dedup['duplicates']} — не проверялись")
         print(Fore.CYAN + "\nГотово.")
         return
     # ==========================
-    # НОВОЕ: фильтрация email
+    # НОВОЕ: фильтрация email (потоково, файл не держим в памяти)
     # ==========================
-    yahoo_logins = []
-    aol_logins = []
-
-    for email in raw_emails:
-        if "@" not in email:
-            continue
-
-        login, domain = email.rsplit("@", 1)
-        domain = domain.lower()
-
-        if domain == "yahoo.com":
-            yahoo_logins.append(login)
-        elif domain == "aol.com":
-            aol_logins.append(login)
-
-    # СНАЧАЛА YAHOO, ПОТОМ AOL
-    process_logins = yahoo_logins + aol_logins
-
-    if not process_logins:
-        print(Fore.YELLOW + "Нет email с доменами yahoo.com или aol.com")
-        return
-
-    limit = int(input("Сколько логинов проверить? (0 = все): ") or "0")
-    if limit > 0:
-        process_logins = process_logins[:limit]
-
-    # Убираем полностью закэшированные
-    fully_cached = [lg for lg in process_logins if _login_fully_cached(lg, checked_cache)]
-    process_logins = [lg for lg in process_logins if lg not in fully_cached]
+    journal = InputJournal(mails_file) if resume else None
+    resumed = bool(journal and journal.skipped())
+    if resumed:
+        print(Fore.CYAN + f"[journal] продолжаю с места прошлой остановки: "
+                          f"{journal.skipped()} байт {mails_file} уже проверены")
+
+    def open_logins(lim):
+        return journal.iter_logins(lim) if journal else iter_process_logins(mails_file, lim)
+
+    # Планирование: отдельный потоковый проход только со счётчиками (ради плана и ETA),
+    # для больших файлов не делается — статистика собирается по ходу основного прохода.
+    # Полностью закэшированные логины в работу не попадают в любом случае.
+    planner = WorkPlanner(checked_cache)
+    try:
+        survey = os.path.getsize(mails_file) <= INPUT_SURVEY_MAX_MB * 2**20
+    except OSError:
+        survey = False
+    if survey:
+        planner.survey(open_logins(limit))
+        if not planner.logins and not resumed:
+            print(Fore.YELLOW + "Нет email с доменами yahoo.com или aol.com")
+            return
+        print(Fore.CYAN + f"[PLAN] {planner.report()}")
 
-    if fully_cached:
-        print(Fore.CYAN + f"[SKIP] Уже в кэше (yahoo+aol): {len(fully_cached)}")
+        if planner.fully_cached:
+            print(Fore.CYAN + f"[SKIP] Уже в кэше (yahoo+aol): {planner.fully_cached}")
+        if planner.saved:
+            print(Fore.CYAN + f"[DEDUP] канонизация и повторы сэкономили проверок: {planner.saved}")
 
-    if not process_logins:
+        if track_progress:
+            metrics.total = sum(planner.need.values())  # каждый домен проверяется независимо — число точное
+        planner.reset()
+    else:
+        print(Fore.CYAN + f"[PLAN] файл больше {INPUT_SURVEY_MAX_MB:g} МБ — план не считается заранее, "
+                          f"итог будет в конце")
+    def emit_cached(email):
+        # клиент сервиса получает строку и по email, закэшированным раньше
+        hit = checked_cache.get(email)
+        on_result({"stage": "availability", "email": email,
+                   "status": hit[0] if hit else "unknown", "cached": True})
+
+    on_cached = emit_cached if on_result else None
+
+    logins = open_logins(limit)
+    first, process_logins = peek(planner.iter_work(logins, on_cached))
+    if first is None:
+        if not planner.logins and not resumed:
+            print(Fore.YELLOW + "Нет email с доменами yahoo.com или aol.com")
+            return
+        if journal:
+            journal.commit()   # всё выданное уже в кэше
+            if INPUT_COMPACT:
+                _compact_input(journal, planner)
         print(Fore.YELLOW + "Нечего проверять — всё уже в кэше")
         return
 
-    batch = int(input(f"Размер пакета ({DEFAULT_BATCH_SIZE}): ") or DEFAULT_BATCH_SIZE)
-
-    avail_path = out_dir / "available.txt"
-    busy_path  = out_dir / "busy.txt"
-
     cache_lock = Lock()
     done_lock = Lock()
+    results = open_result_store(out_dir, writer)
 
+    # репутация стартует сразу и разбирает свободные email по мере их появления
+    print(Fore.CYAN + "Репутация проверяется параллельно, по мере появления свободных email")
+    feed, rep_thread = start_reputation_consumer(out_dir, writer=writer, on_result=on_result,
+                                                 results=results)
+
+    n = 0
+    uncompacted = 0     # пакетов, подтверждённых в журнале после последнего сжатия
+    journal_held = False  # был неполный пакет — курсор журнала стоит перед ним
     try:
-        with open(avail_path, "w", encoding="utf-8") as af, open(busy_path, "w", encoding="utf-8") as bf:
-            for i in range(0, len(process_logins), batch):
+        while process_logins is not None:
+            compact_now = False
+            for chunk in iter_batches(process_logins, batch):
                 if stop_event.is_set():
                     break
 
-                chunk = process_logins[i:i + batch]
-                print(Fore.MAGENTA + f"\n=== Пакет {i // batch + 1} ({len(chunk)}) ===")
+                n += 1
+                print(Fore.MAGENTA + f"\n=== Пакет {n} ({len(chunk)}) ===")
 
-                logins_by_domain = {
-                    dom: _logins_need_domain(dom, chunk, checked_cache)
-                    for dom in SUPPORTED_DOMAINS
-                }
+                logins_by_domain = planner.plan_batch(chunk)
 
                 login_done_map = {}
+                # домены, которые были в кэше ещё при планировании, тоже считаются проверенными
+                for login, mask in chunk:
+                    for i, dom in enumerate(planner.domains):
+                        if not mask & (1 << i):
+                            mark_login_done(login_done_map, login, dom, done_lock)
+
+                # Yahoo и AOL одновременно (DOMAIN_WORKERS), каждый не чаще DOMAIN_RATE_LIMITS
+                process_domains(
+                    logins_by_domain,
+                    checked_cache,
+                    cache_lock,
+                    results,
+                    login_done_map,
+                    done_lock,
+                    on_free=feed.put,
+                    on_result=on_result
+                )
 
-                # ВАЖНО: сначала Yahoo, потом AOL
-                for dom in ["yahoo.com", "aol.com"]:
-                    process_domain(
-                        dom,
-                        logins_by_domain[dom],
-                        checked_cache,
-                        cache_lock,
-                        af,
-                        bf,
-                        login_done_map,
-                        done_lock
-                    )
+                # пакет целиком проверен — двигаем курсор журнала (после Ctrl+C пакет пройдём заново).
+                # Если в пакете остались отложенные email (отказ сайта, не в кэше), курсор больше
+                # не двигается до конца запуска: следующий запуск начнёт с этого пакета.
+                if journal and not journal_held and not stop_event.is_set():
+                    done = get_fully_done_logins(login_done_map)
+                    if all(login in done for login, _ in chunk):
+                        journal.commit()
+                        uncompacted += 1
+                        compact_now = INPUT_COMPACT and uncompacted >= INPUT_COMPACT_EVERY
+                        if compact_now:
+                            break
+                    else:
+                        journal_held = True
+                        print(Fore.YELLOW + f"[journal] в пакете {n} есть непроверенные email — "
+                                            f"следующий запуск продолжит с него")
+
+            process_logins = None
+            if compact_now:
+                # файл переписывается — читаем его заново с курсора журнала
+                logins.close()
+                _compact_input(journal, planner)
+                uncompacted = 0
+                remaining = limit - planner.logins if limit else 0
+                if not limit or remaining > 0:
+                    logins = open_logins(remaining)
+                    process_logins = planner.iter_work(logins, on_cached)
 
     except KeyboardInterrupt:
         stop_event.set()
         print(Fore.YELLOW + "\nОстановка пользователем (Ctrl+C).")
 
+    finally:
+        feed.close()
+        logins.close()
+        if journal and INPUT_COMPACT and uncompacted:
+            _compact_input(journal, planner)
+
     if not stop_event.is_set():
-        emails = [l.split(":")[0] for l in load_lines(avail_path)]
-        if emails:
-            print(Fore.CYAN + "\nПереход к проверке репутации")
-            check_reputation(emails, out_dir)
+        print(Fore.CYAN + "\nДоступность проверена, дожидаюсь репутации...")
+    join_thread(rep_thread)
+    writer.flush()
+    finish_result_store(results, out_dir)
+    if feed.dropped:
+        print(Fore.YELLOW + f"[reputation] не попали в проверку: {feed.dropped} (есть в available.txt)")
+    if not survey:
+        print(Fore.CYAN + f"[PLAN] итог: {planner.report()}")
+    if planner.saved:
+        print(Fore.CYAN + f"[DEDUP] пропущено повторов {planner.duplicates}, "
+                          f"сэкономлено проверок {planner.saved}")
 
     print(Fore.CYAN + "\nГотово.")
 
-if __name__ == "__main__":
+def _compact_input(journal: InputJournal, planner: WorkPlanner):
+    t0 = time.time()
+    try:
+        kept, dropped = journal.compact(lambda login: not planner.need_mask(canonical_login(login)))
+    except OSError as e:
+        print(Fore.YELLOW + f"[journal] не удалось сжать {journal.filename}: {e}")
+        return
+    print(Fore.CYAN + f"[journal] {journal.filename}: убрано проверенных строк {dropped}, "
+                      f"осталось {kept} ({time.time() - t0:.1f}s)")
+
+# ==========================
+# СЕРВИС: python main.py --serve — браузеры остаются прогретыми между заданиями
+# ==========================
+# POST /jobs                {"emails": [...], "mode": 1|2, "limit": 0, "batch": 50} -> {"id", "results_dir", ...}
+# GET  /jobs                список заданий
+# GET  /jobs/<id>           состояние задания
+# GET  /jobs/<id>/results   результаты построчно (NDJSON) по мере появления, до конца задания
+# GET  /health
+class Job:
+    def __init__(self, job_id, emails, mode, limit, batch, out_dir: Path):
+        self.id = job_id
+        self.emails = emails
+        self.mode = mode
+        self.limit = limit
+        self.batch = batch
+        self.out_dir = out_dir
+        self.state = "queued"          # queued -> running -> done / failed / stopped
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.events = []
+        self._cond = Condition()
+
+    def emit(self, event):
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def set_state(self, state):
+        # state меняют поток задания и HTTP-потоки (info) — всё под замком условия
+        with self._cond:
+            self.state = state
+
+    def finish(self, state, error=None):
+        with self._cond:
+            self.state = state
+            self.error = error
+            self.finished = time.time()
+            self._cond.notify_all()
+
+    def info(self) -> dict:
+        with self._cond:
+            return {
+                "id": self.id, "state": self.state, "mode": int(self.mode), "emails": len(self.emails),
+                "results": len(self.events), "results_dir": str(self.out_dir), "error": self.error,
+                "created": self.created, "finished": self.finished,
+            }
+
+    def iter_events(self):
+        # отдаёт уже накопленные результаты, потом ждёт новые, пока задание не закончится
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.events) and self.finished is None:
+                    self._cond.wait(1.0)
+                chunk = self.events[i:]
+                over = self.finished is not None
+            i += len(chunk)
+            yield from chunk
+            if over and not chunk:
+                return
+
+def is_loopback_host(host: str) -> bool:
+    # имя/адрес, который резолвится только в 127.0.0.0/8 или ::1
+    try:
+        addrs = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except (OSError, UnicodeError):
+        return False
+    return bool(addrs) and all(ipaddress.ip_address(a.split("%")[0]).is_loopback for a in addrs)
+
+class JobService:
+    def __init__(self, checked_cache: AvailCache, writer: ResultWriter,
+                 host=SERVICE_HOST, port=SERVICE_PORT, max_jobs=SERVICE_MAX_JOBS):
+        # API без авторизации: слушаем только loopback
+        if not is_loopback_host(host):
+            raise ValueError(f"{host}: сервис слушает только локальный адрес (127.0.0.1, localhost)")
+        self.checked_cache = checked_cache
+        self.writer = writer
+        self.jobs = {}
+        self._lock = Lock()
+        self._slots = Semaphore(max_jobs)
+        self._seq = itertools.count(1)
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+
+    def submit(self, payload) -> Job:
+        emails = payload.get("emails")
+        mode = str(payload.get("mode", 1))
+        if not isinstance(emails, list) or not emails or not all(isinstance(e, str) for e in emails):
+            raise ValueError("emails: нужен непустой список строк")
+        if mode not in ("1", "2"):
+            raise ValueError("mode: 1 или 2")
+        limit = int(payload.get("limit", 0))
+        batch = int(payload.get("batch", DEFAULT_BATCH_SIZE))
+        if batch < 1:
+            raise ValueError("batch: больше 0")
+
+        ts = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        job_id = f"{next(self._seq):04d}"
+        out_dir = Path(f"results_{ts}_job{job_id}")
+        out_dir.mkdir(exist_ok=True)
+        write_lines(out_dir / "input.txt", emails)
+
+        job = Job(job_id, emails, mode, limit, batch, out_dir)
+        with self._lock:
+            self.jobs[job_id] = job
+        Thread(target=self._run_job, args=(job,), name=f"job-{job_id}", daemon=True).start()
+        print(Fore.CYAN + f"[service] задание {job_id}: {len(emails)} email, режим {mode} -> {out_dir}")
+        return job
+
+    def _run_job(self, job: Job):
+        with self._slots:
+            if stop_event.is_set():
+                job.finish("stopped")
+                return
+            job.set_state("running")
+            try:
+                run_job(job.out_dir / "input.txt", job.out_dir, self.checked_cache, self.writer,
+                        job.mode, job.limit, job.batch, on_result=job.emit, track_progress=False,
+                        resume=False)
+                self.writer.flush()
+                job.finish("stopped" if stop_event.is_set() else "done")
+            except Exception as e:
+                print(Fore.RED + f"[service] задание {job.id} упало: {e!r}")
+                job.finish("failed", repr(e))
+        info = job.info()
+        print(Fore.CYAN + f"[service] задание {job.id}: {info['state']}, результатов {info['results']}")
+
+    def serve(self):
+        host, port = self.httpd.server_address[:2]
+        print(Fore.CYAN + f"[service] слушаю http://{host}:{port} (Ctrl+C — остановка)")
+        try:
+            self.httpd.serve_forever(poll_interval=0.5)
+        except KeyboardInterrupt:
+            stop_event.set()
+            print(Fore.YELLOW + "\n[service] остановка, дожидаюсь заданий...")
+        finally:
+            self.httpd.server_close()
+            for t in [t for t in threading_enumerate() if t.name.startswith("job-")]:
+                join_thread(t)
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                pass
+
+            def _json(self, code, obj):
+                data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _job(self, job_id):
+                with service._lock:
+                    return service.jobs.get(job_id)
+
+            def do_GET(self):
+                parts = [p for p in urlsplit(self.path).path.split("/") if p]
+                if parts == ["health"]:
+                    return self._json(200, {"ok": not stop_event.is_set(), "pool": browser_pool.summary()})
+                if parts == ["jobs"]:
+                    with service._lock:
+                        jobs = [j.info() for j in service.jobs.values()]
+                    return self._json(200, jobs)
+                job = self._job(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+                if job is None:
+                    return self._json(404, {"error": "not found"})
+                if len(parts) == 2:
+                    return self._json(200, job.info())
+                if len(parts) == 3 and parts[2] == "results":
+                    # без Content-Length: строки уходят по мере появления, конец — закрытие соединения
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    try:
+                        for event in job.iter_events():
+                            self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+                            self.wfile.flush()
+                        end = {"stage": "end", **job.info()}
+                        self.wfile.write((json.dumps(end, ensure_ascii=False) + "\n").encode("utf-8"))
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    self.close_connection = True
+                    return
+                return self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if urlsplit(self.path).path.rstrip("/") != "/jobs":
+                    return self._json(404, {"error": "not found"})
+                if stop_event.is_set():
+                    return self._json(503, {"error": "сервис останавливается"})
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    job = service.submit(payload)
+                except (ValueError, TypeError, AttributeError) as e:
+                    return self._json(400, {"error": str(e)})
+                return self._json(202, job.info())
+
+        return Handler
+
+# ==========================
+# ОТЧЁТ ПО КЭШУ: python main.py --report mail.txt — без браузера, вопросов и проверок
+# ==========================
+REPORT_FIELDS = ("email", "availability", "availability_checked_at", "reputation", "bucket",
+                 "reputation_fresh")
+
+def report_from_cache(mails_file, out=None) -> dict:
+    # CSV в out (или stdout), сводка -> dict. Только кэши: checked_cache.db / reputation_cache.db
+    # (старые txt догружаются в них как обычно); selenium и colorama не импортируются.
+    checked_cache = AvailCache(CACHE_AVAIL_DB)
+    rep_cache = RepCache(CACHE_REP_DB)
+    for cache, txt in ((checked_cache, CACHE_AVAIL), (rep_cache, CACHE_REP)):
+        cache.migrate_keys(force=bool(cache.import_txt(txt)))
+
+    summary = {"emails": 0, "duplicates": 0, "to_check": 0, "reputation_missing": 0}
+    dedup = {}
+    f = open(out, "w", encoding="utf-8", newline="") if out else sys.stdout
+    try:
+        w = csv.writer(f)
+        w.writerow(REPORT_FIELDS)
+        now = time.time()
+        for email in iter_unique(iter_emails(mails_file), dedup):
+            summary["emails"] += 1
+            hit = checked_cache.get(email)
+            status = hit[0] if hit else "unchecked"
+            summary[status] = summary.get(status, 0) + 1
+            if not hit and email.rpartition("@")[2] in SUPPORTED_DOMAINS:
+                summary["to_check"] += 1
+
+            entry = rep_cache.get(email)
+            score = entry["score"] if entry else None
+            fresh = entry is not None and rep_cache._is_fresh(score, entry["checked_at"], now)
+            if status == "free" and not fresh:
+                summary["reputation_missing"] += 1
+            checked_at = (datetime.datetime.fromtimestamp(hit[1]).isoformat(timespec="seconds")
+                          if hit else "")
+            w.writerow((email, status, checked_at, "" if score is None else score,
+                        reputation_bucket(score) or "", int(fresh) if entry else ""))
+    finally:
+        if out:
+            f.close()
+        checked_cache.close()
+        rep_cache.close()
+    summary["duplicates"] = dedup.get("duplicates", 0)
+    return summary
+
+def _print_report_summary(summary, mails_file, out):
+    # в stderr: stdout может быть занят самим CSV
+    statuses = ", ".join(f"{st}: {summary[st]}" for st in (*AVAIL_STATUSES, "unchecked") if summary.get(st))
+    print(f"[report] {mails_file}: email {summary['emails']} (повторов {summary['duplicates']}) — "
+          f"{statuses or 'нет'}", file=sys.stderr)
+    print(f"[report] нужна живая проверка доступности: {summary['to_check']}, "
+          f"свободных без свежей репутации: {summary['reputation_missing']}"
+          + (f" | {out}" if out else ""), file=sys.stderr)
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT):
+    ts = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    out_dir = Path(f"results_{ts}_service")
+    out_dir.mkdir(exist_ok=True)
+    print(Fore.CYAN + f"[RESULTS] {out_dir} (метрики сервиса; задания пишут в свои results_*_jobNNNN)")
+
+    with open_session(out_dir) as (checked_cache, writer):
+        service = JobService(checked_cache, writer, host, port)
+        if SERVICE_WARM:
+            purposes = [dom for dom, kind in AVAIL_BACKENDS.items() if kind == "selenium"]
+            if REP_BACKEND == "selenium":
+                purposes.append("reputation")
+            print(Fore.CYAN + f"[service] прогреваю браузеры: {', '.join(purposes) or 'не нужны'}")
+            browser_pool.warm(purposes)
+        service.serve()
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Email Checker & Reputation — by Elegan4ik")
+    parser.add_argument("--bench", choices=sorted(BENCHMARKS),
+                        help="запустить бенчмарк вместо обычной проверки")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        help="размеры входа для бенчмарка")
+    parser.add_argument("--backend", choices=sorted(AVAIL_BACKEND_TYPES), default="selenium",
+                        help="бэкенд для --bench e2e")
+    parser.add_argument("--replay", nargs="+", metavar="JSONL",
+                        help="validation_timings.jsonl для --bench adaptive")
+    parser.add_argument("--serve", action="store_true",
+                        help="сервисный режим: HTTP API заданий, браузеры остаются прогретыми")
+    parser.add_argument("--host", default=SERVICE_HOST,
+                        help="адрес сервиса: только локальный (127.0.0.1, localhost)")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--export", metavar="RESULTS_DIR",
+                        help="выгрузить results.db/results.jsonl папки результатов в старые txt или Parquet")
+    parser.add_argument("--format", choices=("txt", "parquet"), default="txt",
+                        help="формат для --export (parquet — нужен pyarrow)")
+    parser.add_argument("--report", metavar="MAILS_FILE",
+                        help="отчёт по кэшу (доступность + репутация) без браузера и вопросов, CSV")
+    parser.add_argument("--out", metavar="CSV", help="куда писать CSV для --report (по умолчанию stdout)")
+    parser.add_argument("--compact-cache", action="store_true",
+                        help=f"сжать {CACHE_AVAIL_DB} (VACUUM), если в нём много пустых страниц")
+    parser.add_argument("--trace", action="store_true",
+                        help="трассировка команд WebDriver: webdriver_trace.jsonl и топ горячих мест")
+    parser.add_argument("--fixture", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="параметры стенда для --bench e2e (validate_delay=0.5 unable_rate=0.1 ...)")
+    args = parser.parse_args(argv)
+    args.fixture = {k: float(v) for k, v in (kv.split("=", 1) for kv in args.fixture)}
+    if args.trace:
+        global WEBDRIVER_TRACE
+        WEBDRIVER_TRACE = True
+
+    if args.bench:
+        BENCHMARKS[args.bench](args)
+        return
+    if args.serve:
+        if not is_loopback_host(args.host):
+            parser.error(f"--host {args.host}: API без авторизации, допускается только локальный адрес")
+        serve(args.host, args.port)
+        return
+    if args.compact_cache:
+        cache = AvailCache(CACHE_AVAIL_DB)
+        t0 = time.time()
+        try:
+            done = cache.compact()
+        finally:
+            cache.close()
+        print(Fore.CYAN + (f"[CACHE availability] сжат за {time.time() - t0:.1f}s" if done
+                           else "[CACHE availability] сжимать нечего"))
+        return
+    if args.report:
+        if not os.path.exists(args.report):
+            print(f"[report] {args.report}: файл не найден", file=sys.stderr)
+            return
+        _print_report_summary(report_from_cache(args.report, args.out), args.report, args.out)
+        return
+    if args.export:
+        out_dir = Path(args.export)
+        try:
+            store = find_result_store(out_dir)
+        except FileNotFoundError as e:
+            print(Fore.RED + str(e))
+            return
+        try:
+            if args.format == "parquet":
+                n = export_parquet(store, out_dir / "results.parquet")
+            else:
+                n = export_legacy_txt(store, out_dir)
+        except RuntimeError as e:
+            print(Fore.RED + str(e))
+            return
+        finally:
+            store.close()
+        print(Fore.CYAN + f"[export] {n} строк -> {out_dir} ({args.format})")
+        return
     main()
+
+if __name__ == "__main__":
+    cli()
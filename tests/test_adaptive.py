@@ -0,0 +1,79 @@
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import main  # noqa: E402
+
+
+def _records(n, seed=3):
+    # сообщения "занят" с хвостом дальше сокращённого окна, ответ валидации замечен не всегда
+    rnd = random.Random(seed)
+    fixed = main.AVAIL_AFTER_INPUT_DELAY + main.AVAIL_STABLE_OK_SECONDS
+    out = []
+    for i in range(n):
+        busy = rnd.random() < 0.6
+        latency = min(rnd.lognormvariate(-1.0, 0.7), fixed) if busy else None
+        replied = rnd.random() >= 0.2
+        out.append({"key": "yahoo.com", "latency": latency, "status": "busy" if busy else "free",
+                    "fixed": fixed, "replied": replied, "elapsed": None})
+    return out
+
+
+def test_replay_agrees_with_fixed_windows(monkeypatch):
+    # низкий перцентиль: окна заметно короче хвоста, поздних сообщений много
+    monkeypatch.setattr(main, "ADAPTIVE_PERCENTILE", 0.8)
+    policy = main.AdaptiveWindows(enabled=True)
+    shrunk = late = 0
+    for r in _records(3000):
+        window = policy.window(r["key"], r["fixed"])
+        shrunk += window < r["fixed"]
+        late += r["latency"] is not None and r["latency"] > window
+        replayed, fixed_wait, wait = main._replay_availability(r, window)
+        assert replayed == r["status"], (r, window)
+        assert wait <= fixed_wait
+        policy.observe(r["key"], r["latency"], replayed, window, r["fixed"])
+    assert shrunk and late   # окна сокращались, и сообщения приходили позже окна
+
+
+def test_censored_window_waits_for_late_message(monkeypatch):
+    policy = main.AdaptiveWindows(enabled=True)
+    monkeypatch.setattr(main, "adaptive", policy)
+    monkeypatch.setattr(policy, "window", lambda key, fixed: 0.5)
+    tail = []
+
+    def once(driver, input_el, domain, window, fixed, obs):
+        obs["replied"] = False
+        return "free", None
+
+    def late(driver, input_el, domain, extra, obs):
+        tail.append(extra)
+        obs["busy_at"] = 0.4
+        return "busy", "This email address is already taken"
+
+    monkeypatch.setattr(main, "_wait_validation_once", once)
+    monkeypatch.setattr(main, "_wait_validation_tail", late)
+    assert main._wait_validation(None, None, "yahoo.com") == ("busy", "This email address is already taken")
+    fixed = main.AVAIL_AFTER_INPUT_DELAY + main.AVAIL_STABLE_OK_SECONDS
+    assert tail == [fixed - 0.5]
+    assert policy._censored["yahoo.com"] == [1, 1]
+    assert policy._cooldown["yahoo.com"] == main.ADAPTIVE_COOLDOWN
+
+
+def test_reply_ends_wait_without_fallback(monkeypatch):
+    policy = main.AdaptiveWindows(enabled=True)
+    monkeypatch.setattr(main, "adaptive", policy)
+    monkeypatch.setattr(policy, "window", lambda key, fixed: 0.5)
+
+    def once(driver, input_el, domain, window, fixed, obs):
+        obs["replied"] = True
+        return "free", None
+
+    def late(*args):
+        raise AssertionError("ответ пришёл — продлевать окно не нужно")
+
+    monkeypatch.setattr(main, "_wait_validation_once", once)
+    monkeypatch.setattr(main, "_wait_validation_tail", late)
+    assert main._wait_validation(None, None, "yahoo.com") == ("free", None)
+    assert "yahoo.com" not in policy._censored
@@ -0,0 +1,39 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import main  # noqa: E402
+
+
+def _load(tmp_path, body):
+    path = tmp_path / "busy_phrases.json"
+    path.write_text(body, encoding="utf-8")
+    return main.BusyClassifier.load(path)
+
+
+@pytest.mark.parametrize("body", [
+    "{bad",
+    "[1]",
+    json.dumps({"locales": ["no está disponible"]}),
+    json.dumps({"locales": {"es": "no está disponible"}}),
+    json.dumps({"domains": {"yahoo.com": [1]}}),
+    json.dumps({"domains": {"yahoo.com": ["  "]}}),
+], ids=["not-json", "not-object", "locales-list", "pack-string", "phrase-int", "phrase-blank"])
+def test_malformed_file_falls_back_to_builtin_packs(tmp_path, capsys, body):
+    classifier = _load(tmp_path, body)
+    assert "[busy]" in capsys.readouterr().out
+    assert classifier.packs == {loc: list(ph) for loc, ph in main.BUSY_PACKS.items()}
+    assert classifier.domain_packs == {}
+    assert classifier.match("Enter a valid email address", "yahoo.com") is None
+
+
+def test_valid_file_extends_packs(tmp_path):
+    classifier = _load(tmp_path, json.dumps({"locales": {"es": ["no está disponible"]},
+                                             "domains": {"Yahoo.com": ["ya está en uso"]}}))
+    assert classifier.match("Este usuario no está disponible", "aol.com") is not None
+    assert classifier.match("El nombre ya está en uso", "yahoo.com") is not None
+    assert classifier.match("Enter a valid email address", "yahoo.com") is None
@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+from threading import Event, Thread
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import main  # noqa: E402
+
+
+def test_hash_index_add_reports_new_entries():
+    index = main.HashIndex()
+    assert index.add("a@yahoo.com") is True
+    assert index.add("a@yahoo.com") is False
+    assert "a@yahoo.com" in index and "b@yahoo.com" not in index
+    assert index.count == 1
+
+
+def test_hash_index_readers_never_miss_during_resize():
+    # читатель всё время спрашивает про ранние записи, пока писатель несколько раз растит таблицу
+    index = main.HashIndex()
+    early = [f"early{i}@yahoo.com" for i in range(200)]
+    for email in early:
+        index.add(email)
+    stop = Event()
+    misses = []
+
+    def reader():
+        while not stop.is_set():
+            for email in early:
+                if email not in index:
+                    misses.append(email)
+
+    t = Thread(target=reader)
+    t.start()
+    try:
+        size = index._slots[1]
+        for i in range(20_000):
+            index.add(f"late{i}@aol.com")
+        assert index._slots[1] > size
+    finally:
+        stop.set()
+        t.join()
+
+    assert misses == []
+    assert all(email in index for email in early)
+    assert index.count == len(early) + 20_000
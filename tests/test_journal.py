@@ -0,0 +1,70 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import main  # noqa: E402
+
+
+class RejectingBackend(main.HttpAvailabilityBackend):
+    # сайт отвечает 429 на выбранные (домен, логин), пока rejected не очистят
+    rejected = set()
+
+    def check(self, login):
+        if (self.domain, login) in self.rejected:
+            self.checks += 1
+            raise main.BackendRejected(f"{self.client.host}: HTTP 429", 429)
+        return super().check(login)
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    srv = main.FixtureServer(validate_delay=0.0, rep_delay=0.0).start()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "DOMAIN_RATE_LIMITS", {})
+    monkeypatch.setattr(main, "_rate_limiters", {})
+    monkeypatch.setattr(main, "REP_BACKEND", "http")
+    monkeypatch.setattr(main, "HTTP_REP_URL", srv.url("/api/reputation"))
+    monkeypatch.setattr(main, "make_availability_backend",
+                        lambda domain: RejectingBackend(domain, url=srv.url("/api/validate")))
+    main.stop_event.clear()
+
+    def run(n):
+        out = tmp_path / f"run{n}"
+        out.mkdir()
+        with main.open_session(out) as (checked_cache, writer):
+            main.run_job("mail.txt", out, checked_cache, writer, "1", batch=2, resume=True)
+        cache = main.AvailCache(main.CACHE_AVAIL_DB)
+        try:
+            return {e for e in (f"u{i}@{d}" for i in range(1, 7) for d in main.SUPPORTED_DOMAINS)
+                    if e in cache}
+        finally:
+            cache.close()
+
+    yield run
+    RejectingBackend.rejected = set()
+    srv.stop()
+
+
+def test_rejected_email_is_rechecked_on_resume(session):
+    Path("mail.txt").write_text("".join(f"u{i}@yahoo.com\n" for i in range(1, 7)), encoding="utf-8")
+    RejectingBackend.rejected = {("yahoo.com", "u1")}
+
+    cached = session(1)
+    assert "u1@yahoo.com" not in cached and "u1@aol.com" in cached
+    assert {f"u{i}@yahoo.com" for i in range(2, 7)} <= cached
+    # курсор остался перед первым пакетом, где u1 не проверен (журнал и не создавался)
+    journal = Path("mail.txt.journal")
+    if journal.exists():
+        passes = json.loads(journal.read_text(encoding="utf-8"))["passes"]
+        assert all(entry["offset"] == 0 for entry in passes.values())
+
+    RejectingBackend.rejected = set()
+    cached = session(2)
+    assert "u1@yahoo.com" in cached
+    size = Path("mail.txt").stat().st_size
+    journal = json.loads(Path("mail.txt.journal").read_text(encoding="utf-8"))
+    assert all(entry["offset"] == size for entry in journal["passes"].values())
@@ -0,0 +1,133 @@
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from threading import Lock, Thread
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import main  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def server():
+    srv = main.FixtureServer(validate_delay=0.0).start()
+    yield srv
+    srv.stop()
+
+
+@pytest.fixture(autouse=True)
+def clear_stop():
+    main.stop_event.clear()
+    yield
+    main.stop_event.clear()
+
+
+# ==========================
+# process_domains: домены параллельно, общий кэш и результаты
+# ==========================
+@pytest.mark.parametrize("with_writer", [True, False], ids=["writer", "direct"])
+def test_parallel_domains_record_each_email_once(tmp_path, server, with_writer):
+    # повторы в списке логинов: второй раз email уже в кэше и не проверяется
+    logins = [f"sched.user{i:02d}" for i in range(8)]
+    work = logins + logins[:4]
+    emails = [f"{lg}@{d}" for d in main.SUPPORTED_DOMAINS for lg in logins]
+
+    checked_cache = main.AvailCache(str(tmp_path / "checked_cache.db"))
+    writer = main.ResultWriter().start() if with_writer else None
+    if writer:
+        writer.attach(checked_cache)
+    # jsonl хранит каждую строку (sqlite заменила бы повтор) — двойная запись будет видна
+    results = main.open_result_store(tmp_path, writer, kind="jsonl")
+    backends = {d: main.HttpAvailabilityBackend(d, url=server.url("/api/validate"))
+                for d in main.SUPPORTED_DOMAINS}
+    limiters = {d: main.TokenBucket(0) for d in main.SUPPORTED_DOMAINS}
+    done_map = {}
+    events = []
+    events_lock = Lock()
+
+    def on_result(event):
+        with events_lock:
+            events.append(event)
+
+    try:
+        main.process_domains({d: list(work) for d in main.SUPPORTED_DOMAINS}, checked_cache, Lock(),
+                             results, done_map, Lock(), on_result=on_result,
+                             backends=backends, limiters=limiters, parallel=True)
+    finally:
+        if writer:
+            writer.close()
+        results.close()
+        checked_cache.flush()
+
+    try:
+        assert len(checked_cache) == len(emails)
+        for email in emails:
+            status, _ = checked_cache.get(email)
+            assert (status == "busy") == server.is_busy(email.split("@")[0]), email
+
+        rows = Counter(r["email"] for r in results.iter_rows("availability"))
+        assert rows == Counter(emails)
+
+        checked = Counter(e["email"] for e in events if not e.get("cached"))
+        assert checked == Counter(emails)
+        cached = Counter(e["email"] for e in events if e.get("cached"))
+        assert cached == Counter(f"{lg}@{d}" for d in main.SUPPORTED_DOMAINS for lg in logins[:4])
+
+        assert main.get_fully_done_logins(done_map) == set(logins)
+    finally:
+        checked_cache.close()
+
+
+# ==========================
+# TokenBucket: потолок частоты и остановка
+# ==========================
+def test_token_bucket_holds_ceiling_under_concurrent_callers():
+    rate, burst, threads, per_thread = 20.0, 2, 6, 5
+    bucket = main.TokenBucket(rate, burst=burst)
+    starts = []
+    granted = []
+    lock = Lock()
+
+    def worker():
+        for _ in range(per_thread):
+            ok = bucket.acquire()
+            with lock:
+                granted.append(ok)
+                starts.append(time.monotonic())
+
+    t0 = time.monotonic()
+    pool = [Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.monotonic() - t0
+
+    total = threads * per_thread
+    assert all(granted) and len(granted) == total
+    # в любой секунде — не больше rate проверок плюс burst подряд
+    assert main._max_rate(starts, window=1.0) <= rate + burst
+    # первые burst сразу, остальные — строго по одной на 1/rate секунды
+    assert elapsed >= (total - burst) / rate * 0.9
+
+
+def test_token_bucket_acquire_returns_false_once_stopped():
+    bucket = main.TokenBucket(0.5, burst=1)
+    assert bucket.acquire() is True     # burst: первый слот без ожидания
+
+    result = []
+    waiter = Thread(target=lambda: result.append(bucket.acquire()))
+    t0 = time.monotonic()
+    waiter.start()
+    time.sleep(0.1)
+    main.stop_event.set()
+    waiter.join(1.0)
+
+    assert not waiter.is_alive()
+    assert result == [False]
+    assert time.monotonic() - t0 < 1.0  # следующий слот был бы только через 2 с
+    assert bucket.acquire() is False
+    assert main.TokenBucket(0).acquire() is False
@@ -0,0 +1,61 @@
+import json
+import sys
+from pathlib import Path
+from threading import Thread
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import main  # noqa: E402
+
+
+class FlakyStore(main.ResultStore):
+    # add_many падает на вызовах из fail_on (номера с 1)
+    def __init__(self, writer, fail_on):
+        super().__init__(writer)
+        self.fail_on = set(fail_on)
+        self.calls = 0
+        self.rows = []
+
+    def add_many(self, rows):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            raise OSError("disk full")
+        self.rows.extend(rows)
+
+
+def _close(writer, timeout=5.0):
+    t = Thread(target=writer.close, daemon=True)
+    t.start()
+    t.join(timeout)
+    return not t.is_alive()
+
+
+def test_failed_batch_with_stop_sentinel_does_not_hang(tmp_path, monkeypatch):
+    failed_file = tmp_path / "writer_failed.jsonl"
+    monkeypatch.setattr(main, "WRITER_FAILED_FILE", str(failed_file))
+    writer = main.ResultWriter(flush_seconds=0.05).start()
+    store = FlakyStore(writer, fail_on=range(2, 100))
+    store.availability("a@yahoo.com", "busy")
+    writer.flush()
+    store.availability("b@yahoo.com", "free", password="x")   # падает вместе с сигналом остановки
+
+    assert _close(writer), "close() завис"
+    assert [r["email"] for r in store.rows] == ["a@yahoo.com"]
+    lost = [json.loads(line) for line in failed_file.read_text(encoding="utf-8").splitlines()]
+    assert [(r["kind"], r["payload"]["email"]) for r in lost] == [("row", "b@yahoo.com")]
+    assert writer.stats["failed"] == 1
+
+
+def test_transient_failure_is_retried(tmp_path, monkeypatch):
+    failed_file = tmp_path / "writer_failed.jsonl"
+    monkeypatch.setattr(main, "WRITER_FAILED_FILE", str(failed_file))
+    writer = main.ResultWriter(flush_seconds=0.05).start()
+    store = FlakyStore(writer, fail_on={1})
+    store.availability("a@yahoo.com", "busy")
+    writer.flush()
+    store.availability("b@yahoo.com", "busy")
+    writer.flush()
+
+    assert _close(writer)
+    assert sorted(r["email"] for r in store.rows) == ["a@yahoo.com", "b@yahoo.com"]
+    assert not failed_file.exists()